@@ -0,0 +1,48 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import sys
+import json
+import argparse
+import os
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--uid", type=int)
+parser.add_argument("--gid", type=int)
+
+arguments = parser.parse_args()
+
+os.setgid(arguments.gid)
+os.setuid(arguments.uid)
+
+data = json.load(sys.stdin)
+
+sys.path.insert(0, data["installation.paths.install_dir"])
+
+import configuration
+import syntaxhighlight.store
+
+cache_dir = configuration.services.HIGHLIGHT["cache_dir"]
+
+if not os.path.isdir(cache_dir):
+    # Nothing has been highlighted yet.
+    sys.exit(0)
+
+store = syntaxhighlight.store.getStore()
+migrated = syntaxhighlight.store.migrateLegacyCache(store, cache_dir)
+
+if migrated:
+    print "Moved %d highlighted files into the packed highlight store." % migrated
@@ -21,3 +21,11 @@ DRIVER = %(installation.database.driver)r
 # Dictionary whose members are passed as keyword arguments to
 # psycopg2.connect().
 PARAMETERS = %(installation.database.parameters)r
+
+# Maximum number of idle database connections kept open per process for reuse
+# by later requests.  Set to zero to disable connection pooling.
+POOL_SIZE = 4
+
+# Number of seconds a pooled connection can have been idle before it is checked
+# (using a trivial query) before being reused.
+POOL_CHECK_INTERVAL = 30
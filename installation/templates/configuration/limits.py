@@ -35,3 +35,24 @@ MAXIMUM_REACHABLE_COMMITS = 4000
 # Maximum number of commits when /createreview is loaded with the
 # 'branch' URI parameter to create a review of all commits on a branch.
 MAXIMUM_REVIEW_COMMITS = 2000
+
+# Maximum number of idle 'git cat-file --batch' processes kept alive per
+# repository (and mode) in each Critic process, for reuse by later requests.
+GIT_BATCH_POOL_SIZE = 4
+
+# Number of seconds an idle pooled 'git cat-file --batch' process is kept alive
+# before being terminated.
+GIT_BATCH_IDLE_TIMEOUT = 300
+
+# Maximum total size (in bytes) of Git objects cached in memory for the
+# duration of a single request or background job.
+GIT_OBJECT_CACHE_SIZE = 64 * 1024 ** 2
+
+# Maximum total size (in bytes) of Git objects cached in memory per process and
+# shared between requests.  Set to zero to disable the shared cache.
+GIT_SHARED_OBJECT_CACHE_SIZE = 32 * 1024 ** 2
+
+# Maximum total size (in bytes) of rendered JSON API responses cached in memory
+# per process, keyed by their ETags.  Set to zero to disable the cache; ETags
+# and "304 Not Modified" responses are supported regardless.
+JSONAPI_RENDERED_CACHE_SIZE = 16 * 1024 ** 2
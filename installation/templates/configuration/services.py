@@ -46,12 +46,21 @@ HIGHLIGHT["cache_dir"] = os.path.join(configuration.paths.CACHE_DIR, "highlight"
 HIGHLIGHT["min_context_length"] = 5
 HIGHLIGHT["max_context_length"] = 256
 HIGHLIGHT["max_workers"] = %(installation.config.highlight.max_workers)d
+# Maximum number of files highlighted by each (forked) worker process.
+HIGHLIGHT["batch_size"] = 16
 HIGHLIGHT["compact_at"] = (3, 15)
 
 CHANGESET["max_workers"] = %(installation.config.changeset.max_workers)d
+# Maximum number of worker processes analyzing changes, per changeset job.
+CHANGESET["analysis_workers"] = 2
 CHANGESET["rss_limit"] = 1024 ** 3
 CHANGESET["purge_at"] = (2, 15)
 
+# Maximum number of tracked branch updates running in parallel, in total and
+# against any one remote.
+BRANCHTRACKER["max_workers"] = 4
+BRANCHTRACKER["max_workers_per_remote"] = 2
+
 # Timeout (in seconds) passed to smtplib.SMTP().
 MAILDELIVERY["timeout"] = 10
 
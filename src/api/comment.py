@@ -385,6 +385,19 @@ def fetchMany(critic, comment_ids):
     assert all(isinstance(comment_id, int) for comment_id in comment_ids)
     return api.impl.comment.fetchMany(critic, comment_ids)
 
+def prefetch(critic, comments):
+    """Load what is needed to access multiple comments' attributes in bulk
+
+       The comments' authors, replies, locations and the current user's draft
+       changes are fetched using a fixed number of queries, regardless of the
+       number of comments, instead of separately for each comment when the
+       attributes are accessed."""
+    import api.impl
+    assert isinstance(critic, api.critic.Critic)
+    comments = list(comments)
+    assert all(isinstance(comment, Comment) for comment in comments)
+    api.impl.comment.Comment.prefetch(critic, comments)
+
 def fetchAll(critic, review=None, author=None, comment_type=None, state=None,
              location_type=None, changeset=None, commit=None):
     """Fetch all Comment objects
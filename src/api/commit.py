@@ -218,3 +218,14 @@ def fetchMany(repository, commit_ids=None, sha1s=None):
         assert all(isinstance(sha1, str) and re_sha1.match(sha1)
                    for sha1 in sha1s)
     return api.impl.commit.fetchMany(repository, commit_ids, sha1s)
+
+def prefetchParents(commits):
+    """Fetch the parents of multiple commits in bulk
+
+       Accessing the |parents| attribute of any of the commits afterwards is
+       then cheap.  The commits can be from different repositories."""
+    import api.impl
+    commits = list(commits)
+    assert all(isinstance(commit, Commit) for commit in commits)
+    if commits:
+        api.impl.commit.Commit.prefetchParents(commits[0].critic, commits)
@@ -53,6 +53,11 @@ class Comment(apiobject.APIObject):
         self.__addressed_by_id = addressed_by_id
         self.__resolved_by_id = resolved_by_id
 
+        # Things that are fetched in bulk by prefetch(), if at all.
+        self.__replies = None
+        self.__lines = None
+        self.__draft_rows = None
+
         self.__type = comment_type
         if comment_type == "issue":
             self.wrapper_class = api.comment.Issue
@@ -65,8 +70,19 @@ class Comment(apiobject.APIObject):
     def getAuthor(self, critic):
         return api.user.fetch(critic, self.__author_id)
 
-    def getLocation(self, critic):
+    def __getLines(self, critic, sha1):
+        if self.__lines is not None:
+            return self.__lines.get(sha1)
         cursor = critic.getDatabaseCursor()
+        cursor.execute("""SELECT first_line, last_line
+                            FROM commentchainlines
+                           WHERE chain=%s
+                             AND sha1=%s
+                             AND (state!='draft' OR uid=%s)""",
+                       (self.id, sha1, critic.effective_user.id))
+        return cursor.fetchone()
+
+    def getLocation(self, critic):
         if self.__file_id is not None:
             repository = self.getReview(critic).repository
             if self.side == "old":
@@ -75,13 +91,7 @@ class Comment(apiobject.APIObject):
                 commit = api.commit.fetch(repository, self.__last_commit_id)
             file_sha1 = commit.getFileInformation(
                 api.file.fetch(critic, file_id=self.__file_id)).sha1
-            cursor.execute("""SELECT first_line, last_line
-                                FROM commentchainlines
-                               WHERE chain=%s
-                                 AND sha1=%s
-                                 AND (state!='draft' OR uid=%s)""",
-                           (self.id, file_sha1, critic.effective_user.id))
-            first_line, last_line = cursor.fetchone()
+            first_line, last_line = self.__getLines(critic, file_sha1)
             location = FileVersionLocation(
                 self, first_line, last_line, repository, self.__file_id,
                 first_commit_id=self.__first_commit_id,
@@ -90,13 +100,7 @@ class Comment(apiobject.APIObject):
             repository = self.getReview(critic).repository
             commit = api.commit.fetch(
                 repository, commit_id=self.__first_commit_id)
-            cursor.execute("""SELECT first_line, last_line
-                                FROM commentchainlines
-                               WHERE chain=%s
-                                 AND sha1=%s
-                                 AND (state!='draft' OR uid=%s)""",
-                           (self.id, commit.sha1, critic.effective_user.id))
-            first_line, last_line = cursor.fetchone()
+            first_line, last_line = self.__getLines(critic, commit.sha1)
             # FIXME: Make commit message comment line numbers one-based too!
             first_line += 1
             last_line += 1
@@ -108,6 +112,8 @@ class Comment(apiobject.APIObject):
         return location.wrap(critic)
 
     def getReplies(self, critic):
+        if self.__replies is not None:
+            return list(self.__replies)
         return api.impl.reply.fetchForComment(critic, self.id)
 
     def getAddressedBy(self, critic):
@@ -127,16 +133,28 @@ class Comment(apiobject.APIObject):
         if self.is_draft:
             return api.comment.Comment.DraftChanges(
                 critic.effective_user, True, None, None)
-        cursor = critic.getDatabaseCursor()
-        cursor.execute("""SELECT id
-                            FROM comments
-                           WHERE uid=%s
-                             AND chain=%s
-                             AND state='draft'""",
-                       (critic.effective_user.id, self.id))
-        row = cursor.fetchone()
-        if row:
-            reply_id, = row
+        if self.__draft_rows is not None:
+            reply_id, row = self.__draft_rows
+        else:
+            cursor = critic.getDatabaseCursor()
+            cursor.execute("""SELECT id
+                                FROM comments
+                               WHERE uid=%s
+                                 AND chain=%s
+                                 AND state='draft'""",
+                           (critic.effective_user.id, self.id))
+            row = cursor.fetchone()
+            reply_id = row[0] if row else None
+            cursor.execute("""SELECT from_state, to_state, from_type, to_type,
+                                     from_last_commit, to_last_commit,
+                                     from_addressed_by, to_addressed_by
+                                FROM commentchainchanges
+                               WHERE uid=%s
+                                 AND chain=%s
+                                 AND state='draft'""",
+                           (critic.effective_user.id, self.id))
+            row = cursor.fetchone()
+        if reply_id is not None:
             reply = api.reply.fetch(critic, reply_id)
         else:
             reply = None
@@ -144,15 +162,6 @@ class Comment(apiobject.APIObject):
         new_type = None
         new_state = None
         new_location = None
-        cursor.execute("""SELECT from_state, to_state, from_type, to_type,
-                                 from_last_commit, to_last_commit,
-                                 from_addressed_by, to_addressed_by
-                            FROM commentchainchanges
-                           WHERE uid=%s
-                             AND chain=%s
-                             AND state='draft'""",
-                       (critic.effective_user.id, self.id))
-        row = cursor.fetchone()
         if not row:
             if reply is None:
                 return None
@@ -173,8 +182,100 @@ class Comment(apiobject.APIObject):
             critic.effective_user, False, reply, new_type, new_state,
             new_location)
 
+    @staticmethod
+    def prefetch(critic, comments):
+        impls = { comment.id: comment._impl for comment in comments }
+        if not impls:
+            return
+        comment_ids = impls.keys()
+
+        # Fetch referenced users, files and commits, so that they are cached.
+        user_ids = set()
+        file_ids = set()
+        commit_ids_per_review = {}
+        for impl in impls.values():
+            user_ids.add(impl.__author_id)
+            if impl.state == "resolved" and impl.__resolved_by_id is not None:
+                user_ids.add(impl.__resolved_by_id)
+            commit_ids = commit_ids_per_review.setdefault(
+                impl.__review_id, set())
+            if impl.__file_id is not None:
+                file_ids.add(impl.__file_id)
+            commit_ids.add(impl.__first_commit_id)
+            commit_ids.add(impl.__last_commit_id)
+            if impl.state == "addressed" \
+                    and impl.__addressed_by_id is not None:
+                commit_ids.add(impl.__addressed_by_id)
+
+        api.user.fetchMany(critic, user_ids=user_ids)
+        if file_ids:
+            api.file.fetchMany(critic, file_ids=file_ids)
+        for review in api.review.fetchMany(
+                critic, commit_ids_per_review.keys()):
+            commit_ids = commit_ids_per_review[review.id] - set([None])
+            if commit_ids:
+                api.commit.fetchMany(review.repository, commit_ids=commit_ids)
+
+        replies = api.impl.reply.fetchForComments(critic, comment_ids)
+        for comment_id, impl in impls.items():
+            impl.__replies = replies.get(comment_id, [])
+
+        cursor = critic.getDatabaseCursor()
+        cursor.execute("""SELECT chain, sha1, first_line, last_line
+                            FROM commentchainlines
+                           WHERE chain=ANY (%s)
+                             AND (state!='draft' OR uid=%s)""",
+                       (comment_ids, critic.effective_user.id))
+        lines = { comment_id: {} for comment_id in comment_ids }
+        for comment_id, sha1, first_line, last_line in cursor:
+            lines[comment_id].setdefault(sha1, (first_line, last_line))
+        for comment_id, impl in impls.items():
+            impl.__lines = lines[comment_id]
+
+        if critic.effective_user.is_anonymous:
+            return
+
+        # Draft changes of published comments; see getDraftChanges().
+        draft_rows = { comment_id: [None, None]
+                       for comment_id, impl in impls.items()
+                       if not impl.is_draft }
+        if not draft_rows:
+            return
+        cursor.execute("""SELECT chain, id
+                            FROM comments
+                           WHERE uid=%s
+                             AND chain=ANY (%s)
+                             AND state='draft'""",
+                       (critic.effective_user.id, draft_rows.keys()))
+        for comment_id, reply_id in cursor:
+            if draft_rows[comment_id][0] is None:
+                draft_rows[comment_id][0] = reply_id
+        cursor.execute("""SELECT chain, from_state, to_state, from_type,
+                                 to_type, from_last_commit, to_last_commit,
+                                 from_addressed_by, to_addressed_by
+                            FROM commentchainchanges
+                           WHERE uid=%s
+                             AND chain=ANY (%s)
+                             AND state='draft'""",
+                       (critic.effective_user.id, draft_rows.keys()))
+        for row in cursor:
+            if draft_rows[row[0]][1] is None:
+                draft_rows[row[0]][1] = row[1:]
+        reply_ids = [reply_id for reply_id, _ in draft_rows.values()
+                     if reply_id is not None]
+        if reply_ids:
+            api.reply.fetchMany(critic, reply_ids)
+        for comment_id, (reply_id, row) in draft_rows.items():
+            impls[comment_id].__draft_rows = (reply_id, row)
+
     @staticmethod
     def refresh(critic, tables, cached_comments):
+        if tables.intersection(("commentchainchanges", "commentchainlines")):
+            # Drop data loaded by prefetch() that might now be outdated.
+            for comment in cached_comments.values():
+                comment._impl.__lines = None
+                comment._impl.__draft_rows = None
+
         if not tables.intersection(("commentchains", "comments")):
             return
 
@@ -51,6 +51,29 @@ class Commit(apiobject.APIObject):
         return [fetch(self.repository, None, sha1, None)
                 for sha1 in self.internal.parents]
 
+    @staticmethod
+    def prefetchParents(critic, commits):
+        commits_per_repository = {}
+        for commit in commits:
+            commits_per_repository.setdefault(
+                commit.repository, []).append(commit)
+
+        for repository, commits in commits_per_repository.items():
+            parent_sha1s = set()
+            for commit in commits:
+                for sha1 in commit._impl.internal.parents:
+                    try:
+                        Commit.get_cached(critic, (int(repository), sha1))
+                    except KeyError:
+                        parent_sha1s.add(sha1)
+            if parent_sha1s:
+                try:
+                    fetchMany(repository, None, list(parent_sha1s))
+                except api.commit.InvalidSHA1:
+                    # Leave it to Commit.parents to report the error, if it is
+                    # ever accessed.
+                    pass
+
     def getDescription(self, critic):
         return self.internal.repository.describe(critic.database, self.sha1)
 
@@ -180,8 +203,8 @@ def fetchMany(repository, commit_ids, sha1s):
             for commit_id, sha1 in rows
         }
 
-        return [fetch(repository, commit_id, commits[commit_id], None)
-                for commit_id in commit_ids]
+        return makeMany(repository, [(commit_id, commits[commit_id])
+                                     for commit_id in commit_ids])
     else:
         cursor.execute(
             """SELECT id, sha1
@@ -201,5 +224,41 @@ def fetchMany(repository, commit_ids, sha1s):
             for commit_id, sha1 in rows
         }
 
-        return [fetch(repository, commits[sha1], sha1, None)
-                for sha1 in sha1s]
+        return makeMany(repository, [(commits[sha1], sha1)
+                                     for sha1 in sha1s])
+
+def makeMany(repository, commit_ids_sha1s):
+    """Return commits for a list of (id, SHA-1) tuples
+
+       The commit objects of all commits not already cached are read from the
+       repository in one go."""
+
+    critic = repository.critic
+    uncached = {}
+
+    for commit_id, sha1 in commit_ids_sha1s:
+        try:
+            Commit.get_cached(critic, (int(repository), commit_id))
+        except KeyError:
+            uncached[sha1] = commit_id
+
+    if uncached:
+        internal_repository = repository._impl.getInternal(critic)
+        sha1s = uncached.keys()
+
+        try:
+            gitobjects = list(internal_repository.fetchMany(sha1s))
+        except gitutils.GitReferenceError as error:
+            raise api.commit.InvalidSHA1(error.sha1)
+
+        for sha1, gitobject in zip(sha1s, gitobjects):
+            commit_id = uncached[sha1]
+            internal = gitutils.Commit.fromGitObject(
+                critic.database, internal_repository, gitobject, commit_id)
+            commit = Commit(repository, internal).wrap(critic)
+
+            Commit.add_cached(critic, (int(repository), commit_id), commit)
+            Commit.add_cached(critic, (int(repository), sha1), commit)
+
+    return [fetch(repository, requested_commit_id, requested_sha1, None)
+            for requested_commit_id, requested_sha1 in commit_ids_sha1s]
@@ -14,6 +14,8 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import heapq
+
 import api
 import apiobject
 
@@ -45,85 +47,66 @@ class CommitSet(apiobject.APIObject):
         return self.commits == other.commits
 
     def getFilteredTails(self, critic):
-        if not self.commits:
-            return frozenset()
+        if len(self.tails) < 2:
+            return self.tails
 
         legacy_repository = next(iter(self.commits)).repository._impl.getInternal(critic)
-        candidates = set(self.tails)
-        result = set()
-
-        while candidates:
-            tail = candidates.pop()
-
-            eliminated = set()
-            for other in candidates:
-                base = legacy_repository.mergebase([tail, other])
-                if base == tail:
-                    # Tail is an ancestor of other: tail should not be included
-                    # in the returned set.
-                    break
-                elif base == other:
-                    # Other is an ancestor of tail: other should not be included
-                    # in the returned set.
-                    eliminated.add(other)
-            else:
-                result.add(tail)
-            candidates -= eliminated
-
-        return frozenset(result)
+        tails = dict((str(tail), tail) for tail in self.tails)
 
-    def getDateOrdered(self):
-        queue = sorted(self.commits,
-                       key=lambda commit: commit.committer.timestamp,
-                       reverse=True)
-        included = set()
+        # Tails that are ancestors of other tails should not be included in the
+        # returned set; let Git find the rest in one go.
+        independent = legacy_repository.run(
+            "merge-base", "--independent", *sorted(tails)).split()
 
-        while queue:
-            commit = queue.pop(0)
-            if commit in included:
-                continue
-            if commit in self.__children:
-                remaining_children = self.__children[commit] - included
-                if remaining_children:
-                    # Some descendants of this commit have not yet been emitted;
-                    # we have to delay this commit.  Insert the commit after the
-                    # earliest remaining descendant in the list.  This means
-                    # that as soon as we've processed all descendants, we retry
-                    # the commit.
-                    queue.insert(max(queue.index(child)
-                                     for child in remaining_children) + 1,
-                                 commit)
-                    continue
+        return frozenset(tails[sha1] for sha1 in independent)
+
+    def getDateOrdered(self):
+        # Commits are emitted in timestamp order, except that each commit is
+        # delayed until all of its children (in the set) have been emitted.
+        # |order| maps each commit to its position in timestamp order, and the
+        # heap contains the positions of commits whose children have all been
+        # emitted.
+        ordered = sorted(self.commits,
+                         key=lambda commit: commit.committer.timestamp,
+                         reverse=True)
+        order = dict((commit, index) for index, commit in enumerate(ordered))
+        remaining = dict((commit, len(self.__children.get(commit, ())))
+                         for commit in ordered)
+        heap = [order[commit] for commit in self.heads]
+        heapq.heapify(heap)
+
+        while heap:
+            commit = ordered[heapq.heappop(heap)]
             yield commit
-            included.add(commit)
+            for parent in commit.parents:
+                if parent in remaining:
+                    remaining[parent] -= 1
+                    if not remaining[parent]:
+                        heapq.heappush(heap, order[parent])
 
     def getTopoOrdered(self):
         if not self:
             return
 
-        head = set(self.heads).pop()
+        # Depth-first, starting at the (single) head, visiting the oldest parent
+        # of each commit first.  A commit is only visited once all of its
+        # children (in the set) have been emitted, that is, via its last child.
+        remaining = dict((commit, len(self.__children.get(commit, ())))
+                         for commit in self.commits)
+        stack = [set(self.heads).pop()]
 
-        queue = [head]
-        included = set()
-
-        while queue:
-            commit = queue.pop(0)
-            if commit in included:
-                continue
-            if commit in self.__children and self.__children[commit] - included:
-                # Some descendants of this commit have not yet been emitted; we
-                # have to delay this commit.  We can only delay this commit if
-                # the queue is non-empty, so assert that it isn't.
-                assert queue
-                queue.append(commit)
-                continue
+        while stack:
+            commit = stack.pop()
             yield commit
-            included.add(commit)
+            # Push the oldest parent last, so that it is visited first.  (Parents
+            # with equal timestamps are visited in order.)
             parents = sorted((parent for parent in commit.parents
-                              if parent in self and parent not in included),
-                             key=lambda commit: commit.committer.timestamp,
-                             reverse=False)
-            queue[:0] = parents
+                              if parent in remaining),
+                             key=lambda commit: commit.committer.timestamp)
+            for parent in reversed(parents):
+                remaining[parent] -= 1
+                if not remaining[parent]:
+                    stack.append(parent)
 
     def getChildrenOf(self, commit):
         return set(self.__children.get(commit, []))
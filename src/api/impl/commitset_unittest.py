@@ -144,12 +144,223 @@ def basic(arguments):
 
     print "basic: ok"
 
+class FakeCommitter(object):
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+class FakeCommit(object):
+    """Stand-in for api.commit.Commit, with just what CommitSet uses"""
+
+    def __init__(self, sha1, parents, timestamp):
+        self.sha1 = sha1
+        self.parents = parents
+        self.committer = FakeCommitter(timestamp)
+
+    def __str__(self):
+        return self.sha1
+    def __hash__(self):
+        return hash(self.sha1)
+    def __eq__(self, other):
+        return str(self) == str(other)
+    def __ne__(self, other):
+        return not (self == other)
+
+def createGraph(generator, count, lines=10, merge_probability=0.3,
+                jitter=None):
+    """Create a random, merge-heavy DAG of |count| commits
+
+       Commits are created on |lines| parallel lines of development, which are
+       frequently merged into each other, with committer dates that mostly
+       increase, but are off by up to |jitter| (default: |lines|) steps.  All
+       lines are finally merged into a single head.  Returns the list of
+       commits, excluding the single tail."""
+
+    if jitter is None:
+        jitter = lines
+
+    tail = FakeCommit("tail", [], 0)
+    tips = [tail] * lines
+    commits = []
+
+    def commit(parents):
+        timestamp = len(commits) + generator.randint(-jitter, jitter)
+        created = FakeCommit("%040x" % len(commits), parents, timestamp)
+        commits.append(created)
+        return created
+
+    for _ in range(count - 1):
+        line = generator.randrange(lines)
+        parents = [tips[line]]
+        if generator.random() < merge_probability:
+            other = generator.randrange(lines)
+            if tips[other] is not tips[line]:
+                parents.append(tips[other])
+        tips[line] = commit(parents)
+
+    heads = []
+    for tip in tips:
+        if tip is not tail and tip not in heads:
+            heads.append(tip)
+    commit(heads or [tail])
+
+    return commits
+
+def childrenOf(commits):
+    children = {}
+    for commit in commits:
+        for parent in commit.parents:
+            children.setdefault(parent, set()).add(commit)
+    return children
+
+def oldDateOrdered(commitset, children):
+    # The (quadratic) implementation CommitSet.getDateOrdered() replaced.
+    queue = sorted(commitset.commits,
+                   key=lambda commit: commit.committer.timestamp,
+                   reverse=True)
+    included = set()
+
+    while queue:
+        commit = queue.pop(0)
+        if commit in included:
+            continue
+        if commit in children:
+            remaining_children = children[commit] - included
+            if remaining_children:
+                queue.insert(max(queue.index(child)
+                                 for child in remaining_children) + 1,
+                             commit)
+                continue
+        yield commit
+        included.add(commit)
+
+def oldTopoOrdered(commitset, children):
+    # The implementation CommitSet.getTopoOrdered() replaced.
+    queue = [set(commitset.heads).pop()]
+    included = set()
+
+    while queue:
+        commit = queue.pop(0)
+        if commit in included:
+            continue
+        if commit in children and children[commit] - included:
+            assert queue
+            queue.append(commit)
+            continue
+        yield commit
+        included.add(commit)
+        parents = sorted((parent for parent in commit.parents
+                          if parent in commitset.commits
+                          and parent not in included),
+                         key=lambda commit: commit.committer.timestamp,
+                         reverse=False)
+        queue[:0] = parents
+
+def orderings(arguments):
+    # Compare the orderings with the implementations they replaced, on random
+    # merge-heavy DAGs.
+
+    import random
+
+    import api.impl.commitset
+
+    generator = random.Random(4711)
+
+    for _ in range(200):
+        commits = createGraph(generator, generator.randint(1, 150),
+                              lines=generator.randint(1, 8),
+                              merge_probability=generator.random())
+        commitset = api.impl.commitset.CommitSet(commits)
+        children = childrenOf(commits)
+
+        topo_ordered = list(commitset.getTopoOrdered())
+        assert topo_ordered == list(oldTopoOrdered(commitset, children))
+
+        date_ordered = list(commitset.getDateOrdered())
+        old_date_ordered = list(oldDateOrdered(commitset, children))
+
+        # All orders emit every commit once, after all its children.
+        for ordered in (topo_ordered, date_ordered, old_date_ordered):
+            assert len(ordered) == len(commits)
+            assert set(ordered) == set(commits)
+            emitted = set()
+            for commit in ordered:
+                assert children.get(commit, set()) <= emitted
+                emitted.add(commit)
+
+        # The date order always emits the newest commit whose children have
+        # all been emitted.  The old implementation usually, but not always,
+        # did the same; when it did, the orders are identical.
+        emitted = set()
+        ready = set(commitset.heads)
+        old_is_greedy = True
+        for index, commit in enumerate(date_ordered):
+            newest = max(candidate.committer.timestamp for candidate in ready)
+            assert commit.committer.timestamp == newest
+            if old_date_ordered[index].committer.timestamp != newest:
+                old_is_greedy = False
+            ready.remove(commit)
+            emitted.add(commit)
+            for parent in commit.parents:
+                if parent in commitset.commits \
+                        and children[parent] <= emitted:
+                    ready.add(parent)
+        if old_is_greedy:
+            assert [commit.committer.timestamp for commit in date_ordered] \
+                == [commit.committer.timestamp for commit in old_date_ordered]
+
+    print "orderings: ok"
+
+def benchmark(arguments):
+    # Not run as part of the test suite.  Run manually to measure:
+    #
+    #   python -m run_unittest api/impl/commitset_unittest.py \
+    #       [--sizes=1000,2000,4000] [--compare] benchmark
+    #
+    # With --compare, the replaced implementations are measured as well.  They
+    # are quadratic, so keep the sizes modest.
+
+    import random
+    import time
+
+    import api.impl.commitset
+
+    generator = random.Random(4711)
+
+    for size in map(int, arguments.sizes.split(",")):
+        # Random dates make the replaced date ordering delay many commits.
+        commits = createGraph(generator, size, lines=50, jitter=size)
+        commitset = api.impl.commitset.CommitSet(commits)
+        children = childrenOf(commits)
+
+        def measure(fn):
+            before = time.time()
+            for _ in fn():
+                pass
+            return time.time() - before
+
+        timings = [("date", measure(commitset.getDateOrdered)),
+                   ("topo", measure(commitset.getTopoOrdered))]
+
+        if arguments.compare:
+            timings.extend([
+                ("old date", measure(
+                    lambda: oldDateOrdered(commitset, children))),
+                ("old topo", measure(
+                    lambda: oldTopoOrdered(commitset, children)))])
+
+        print "%6d commits: %s" % (size, ", ".join(
+            "%s %.3fs" % timing for timing in timings))
+
+    print "benchmark: ok"
+
 def main(argv):
     import argparse
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--prefix")
+    parser.add_argument("--sizes", default="1000,2000,4000")
+    parser.add_argument("--compare", action="store_true")
     parser.add_argument("tests", nargs=argparse.REMAINDER)
 
     arguments = parser.parse_args(argv)
@@ -157,3 +368,7 @@ def main(argv):
     for test in arguments.tests:
         if test == "basic":
             basic(arguments)
+        elif test == "orderings":
+            orderings(arguments)
+        elif test == "benchmark":
+            benchmark(arguments)
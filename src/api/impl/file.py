@@ -26,14 +26,26 @@ class File(apiobject.APIObject):
         self.path = path
 
 def _fetch_by_ids(critic, file_ids):
-    # FIXME: Optimize this to do a single database query. Currently, there will
-    # be one (fast) query per file.
-    try:
-        for file_id in file_ids:
-            internal = dbutils.File.fromId(critic.database, file_id)
-            yield (int(internal), str(internal))
-    except dbutils.InvalidFileId:
-        raise api.file.InvalidFileId(file_id)
+    file_ids = list(file_ids)
+    uncached_ids = set()
+    for file_id in file_ids:
+        try:
+            File.get_cached(critic, file_id)
+        except KeyError:
+            uncached_ids.add(file_id)
+    paths = {}
+    if uncached_ids:
+        cursor = critic.getDatabaseCursor()
+        cursor.execute("""SELECT id, path
+                            FROM files
+                           WHERE id=ANY (%s)""",
+                       (list(uncached_ids),))
+        paths.update(cursor)
+    for file_id in file_ids:
+        if file_id in uncached_ids and file_id not in paths:
+            raise api.file.InvalidFileId(file_id)
+        # Cached files are returned by File.make() without looking at the path.
+        yield (file_id, paths.get(file_id))
 
 def _fetch_by_paths(critic, paths, create):
     # FIXME: Optimize this to do a single database query. Currently, there will
@@ -27,18 +27,19 @@ import json
 class Filediff(apiobject.APIObject):
     wrapper_class = api.filediff.Filediff
 
-    def __init__(self, filechange):
+    def __init__(self, filechange, highlight_delayed=None):
         self.filechange = filechange
         self.old_count = None
         self.new_count = None
 
         self.__chunks = None
         self.__macro_chunks = None
-        self.__repository = filechange.changeset.repository
 
-        diff_file = self.__getLegacyFile(filechange.critic)
+        if highlight_delayed is None:
+            diff_file = self.__getLegacyFile(filechange.critic)
+            highlight_delayed = not diff_file.ensureHighlight("json")
 
-        self.__highlight_delayed = not diff_file.ensureHighlight("json")
+        self.__highlight_delayed = highlight_delayed
 
     @staticmethod
     def cache_key(filechange):
@@ -82,12 +83,7 @@ class Filediff(apiobject.APIObject):
         return self.__chunks
 
     def __getLegacyFile(self, critic):
-        return diff.File(
-            self.filechange.file.id, self.filechange.file.path,
-            self.filechange.old_sha1, self.filechange.new_sha1,
-            self.__repository._impl.getInternal(critic),
-            old_mode=self.filechange.old_mode,
-            new_mode=self.filechange.new_mode)
+        return legacy_file(critic, self.filechange)
 
     def getMacroChunks(self, critic, context_lines, comments, ignore_chunks):
         def create_line_filter(location, context_lines):
@@ -276,21 +272,47 @@ class SkinnyCommentChain(object):
 
         self.comments = True
 
-def fetch(critic, filechange):
+def legacy_file(critic, filechange):
+    return diff.File(
+        filechange.file.id, filechange.file.path,
+        filechange.old_sha1, filechange.new_sha1,
+        filechange.changeset.repository._impl.getInternal(critic),
+        old_mode=filechange.old_mode,
+        new_mode=filechange.new_mode)
+
+def fetch(critic, filechange, highlight_delayed=None):
     cache_key = Filediff.cache_key(filechange)
     try:
         return Filediff.get_cached(critic, cache_key)
     except KeyError:
         pass
-    filediff = Filediff(filechange).wrap(critic)
+    filediff = Filediff(filechange, highlight_delayed).wrap(critic)
     Filediff.add_cached(critic, cache_key, filediff)
     return filediff
 
 def fetchAll(critic, changeset):
+    filechanges = list(changeset.files)
+    highlight_delayed = {}
+
+    # Request highlighting of all files that aren't already cached at once,
+    # instead of file by file.
+    uncached = []
+    for filechange in filechanges:
+        try:
+            Filediff.get_cached(critic, Filediff.cache_key(filechange))
+        except KeyError:
+            uncached.append(filechange)
+    if uncached:
+        legacy_files = [legacy_file(critic, filechange)
+                        for filechange in uncached]
+        for filechange, highlighted in zip(
+                uncached, diff.File.ensureHighlights(legacy_files, "json")):
+            highlight_delayed[filechange] = not highlighted
+
     return [
-        fetch(critic, filechange)
+        fetch(critic, filechange, highlight_delayed.get(filechange))
         for filechange
-        in changeset.files
+        in filechanges
     ]
 
 def parts_from_html(content):
@@ -89,3 +89,20 @@ def fetchForComment(critic, chain_id):
                     ORDER BY comments.batch ASC""",
                    (chain_id,))
     return list(Reply.make(critic, cursor))
+
+def fetchForComments(critic, chain_ids):
+    cursor = critic.getDatabaseCursor()
+    cursor.execute("""SELECT comments.id, comments.state, chain, comments.batch,
+                             comments.uid, comments.time, comment
+                        FROM comments
+                        JOIN commentchains ON (commentchains.id=comments.chain)
+                       WHERE comments.state='current'
+                         AND commentchains.id=ANY (%s)
+                         AND commentchains.first_comment!=comments.id
+                    ORDER BY comments.batch ASC""",
+                   (list(chain_ids),))
+    rows = cursor.fetchall()
+    replies = {}
+    for row, reply in zip(rows, Reply.make(critic, rows)):
+        replies.setdefault(row[2], []).append(reply)
+    return replies
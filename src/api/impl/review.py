@@ -16,6 +16,7 @@
 
 import api
 import apiobject
+import api.impl.commit
 import api.impl.filters
 
 import auth
@@ -62,8 +63,8 @@ class Review(apiobject.APIObject):
 
     def getOwners(self, critic):
         self.__fetchOwners(critic)
-        return frozenset(api.user.fetch(critic, user_id=user_id)
-                         for user_id in self.__owners_ids)
+        return frozenset(api.user.fetchMany(
+            critic, user_ids=self.__owners_ids))
 
     def __fetchAssignedReviewers(self, critic):
         if self.__assigned_reviewers_ids is None:
@@ -116,8 +117,8 @@ class Review(apiobject.APIObject):
 
     def getWatchers(self, critic):
         self.__fetchWatchers(critic)
-        return frozenset(api.user.fetch(critic, user_id=user_id)
-                         for user_id in self.__watchers_ids)
+        return frozenset(api.user.fetchMany(
+            critic, user_ids=self.__watchers_ids))
 
     def getFilters(self, critic):
         if self.__filters is None:
@@ -158,8 +159,8 @@ class Review(apiobject.APIObject):
                 (self.id, self.id))
             commit_ids_sha1s.update(cursor)
             repository = self.getRepository(critic)
-            commits = [api.commit.fetch(repository, commit_id, sha1)
-                       for commit_id, sha1 in commit_ids_sha1s]
+            commits = api.impl.commit.makeMany(
+                repository, list(commit_ids_sha1s))
             self.__commits = api.commitset.create(critic, commits)
         return self.__commits
 
@@ -419,6 +419,16 @@ class ModifyReview(object):
                 ('reviewed', critic.actual_user.id, batch.id, 'reviewed'),
                 ('pending', None, batch.id, 'pending')))
 
+        # Let clients that cache the review (and things in it) know that it has
+        # changed.
+        self.transaction.tables.add("reviews")
+        self.transaction.items.append(
+            api.transaction.Query(
+                """UPDATE reviews
+                      SET serial=serial+1
+                    WHERE id=%s""",
+                (self.review.id,)))
+
         if callback:
             self.transaction.callbacks.append(
                 lambda: callback(batch.fetch()))
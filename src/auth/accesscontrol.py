@@ -18,8 +18,60 @@ import re
 
 import base
 import auth
+import dbutils
 import configuration
 
+# These queries are executed for every request, so prepare them.
+ANONYMOUS_PROFILE_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_anonymous",
+    """SELECT profile
+         FROM useraccesscontrolprofiles
+        WHERE access_type='anonymous'""")
+USER_PROFILE_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_user",
+    """SELECT profile
+         FROM useraccesscontrolprofiles
+        WHERE access_type='user'
+          AND uid=%s""")
+LABELED_PROFILE_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_labeled",
+    """SELECT profile
+         FROM labeledaccesscontrolprofiles
+        WHERE labels=%s""")
+DEFAULT_USER_PROFILE_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_default",
+    """SELECT profile
+         FROM useraccesscontrolprofiles
+        WHERE access_type='user'
+          AND uid IS NULL""")
+PROFILE_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_profile",
+    """SELECT http, repositories, extensions
+         FROM accesscontrolprofiles
+        WHERE id=%s""")
+PROFILE_HTTP_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_http",
+    """SELECT request_method, path_pattern
+         FROM accesscontrol_http
+        WHERE profile=%s""")
+PROFILE_REPOSITORIES_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_repositories",
+    """SELECT access_type, repository
+         FROM accesscontrol_repositories
+        WHERE profile=%s""")
+PROFILE_EXTENSIONS_QUERY = dbutils.PreparedQuery(
+    "critic_accesscontrol_extensions",
+    """SELECT access_type, extension_key
+         FROM accesscontrol_extensions
+        WHERE profile=%s""")
+
+# Cache of profile ids by user id (and authentication labels), and of profiles
+# by id.  Profiles are never modified once loaded, so can be shared.
+PROFILE_CACHE = dbutils.SharedCache(
+    ("accesscontrolprofiles", "accesscontrol_http",
+     "accesscontrol_repositories", "accesscontrol_extensions",
+     "useraccesscontrolprofiles", "labeledaccesscontrolprofiles"))
+
 class AccessDenied(Exception):
     """Raised by AccessControl checks on failure"""
     pass
@@ -112,7 +164,6 @@ class AccessControlProfile(object):
 
     @staticmethod
     def forUser(db, user, authentication_labels=()):
-        cursor = db.readonly_cursor()
         if user.isSystem():
             # The system user can always do everything.
             return AccessControlProfile("allow")
@@ -128,67 +179,63 @@ class AccessControlProfile(object):
                         HTTPException("POST", "validatelogin")
                     ])
                 return profile
-            cursor.execute("""SELECT profile
-                                FROM useraccesscontrolprofiles
-                               WHERE access_type='anonymous'""")
+            key = ("anonymous",)
+        else:
+            key = ("user", user.id, "|".join(sorted(authentication_labels)))
+        profile_id = PROFILE_CACHE.get(
+            db, key, lambda: AccessControlProfile.__findProfileId(
+                db, user, authentication_labels))
+        if profile_id is None:
+            # By default, allow everything.
+            return AccessControlProfile("allow")
+        return AccessControlProfile.fromId(db, profile_id)
+
+    @staticmethod
+    def __findProfileId(db, user, authentication_labels):
+        cursor = db.readonly_cursor()
+        if user.isAnonymous():
+            cursor.execute(ANONYMOUS_PROFILE_QUERY)
             row = cursor.fetchone()
         else:
-            cursor.execute("""SELECT profile
-                                FROM useraccesscontrolprofiles
-                               WHERE access_type='user'
-                                 AND uid=%s""",
-                           (user.id,))
+            cursor.execute(USER_PROFILE_QUERY, (user.id,))
             row = cursor.fetchone()
             if not row and authentication_labels:
-                cursor.execute("""SELECT profile
-                                    FROM labeledaccesscontrolprofiles
-                                   WHERE labels=%s""",
+                cursor.execute(LABELED_PROFILE_QUERY,
                                ("|".join(sorted(authentication_labels)),))
                 row = cursor.fetchone()
         if not row:
-            cursor.execute("""SELECT profile
-                                FROM useraccesscontrolprofiles
-                               WHERE access_type='user'
-                                 AND uid IS NULL""")
+            cursor.execute(DEFAULT_USER_PROFILE_QUERY)
             row = cursor.fetchone()
         if not row:
-            # By default, allow everything.
-            return AccessControlProfile("allow")
+            return None
         profile_id, = row
-        return AccessControlProfile.fromId(db, profile_id)
+        return profile_id
 
     @staticmethod
     def fromId(db, profile_id):
+        return PROFILE_CACHE.get(
+            db, ("profile", profile_id),
+            lambda: AccessControlProfile.__loadProfile(db, profile_id))
+
+    @staticmethod
+    def __loadProfile(db, profile_id):
         cursor = db.readonly_cursor()
-        cursor.execute(
-            """SELECT http, repositories, extensions
-                 FROM accesscontrolprofiles
-                WHERE id=%s""",
-            (profile_id,))
+        cursor.execute(PROFILE_QUERY, (profile_id,))
 
         profile = AccessControlProfile(*cursor.fetchone())
 
-        cursor.execute("""SELECT request_method, path_pattern
-                            FROM accesscontrol_http
-                           WHERE profile=%s""",
-                       (profile_id,))
+        cursor.execute(PROFILE_HTTP_QUERY, (profile_id,))
         profile.http_exceptions.extend(
             HTTPException(request_method, path_pattern)
             for request_method, path_pattern in cursor)
 
-        cursor.execute("""SELECT access_type, repository
-                            FROM accesscontrol_repositories
-                           WHERE profile=%s""",
-                       (profile_id,))
+        cursor.execute(PROFILE_REPOSITORIES_QUERY, (profile_id,))
         profile.repositories_exceptions.extend(
             RepositoryException(access_type, repository_id)
             for access_type, repository_id in cursor)
 
         if configuration.extensions.ENABLED:
-            cursor.execute("""SELECT access_type, extension_key
-                                FROM accesscontrol_extensions
-                               WHERE profile=%s""",
-                           (profile_id,))
+            cursor.execute(PROFILE_EXTENSIONS_QUERY, (profile_id,))
             profile.extensions_exceptions.extend(
                 ExtensionException(access_type, extension_key)
                 for access_type, extension_key in cursor)
@@ -19,6 +19,12 @@ import dbutils
 import configuration
 import request
 
+SESSION_QUERY = dbutils.PreparedQuery(
+    "critic_session",
+    """SELECT uid, labels, EXTRACT('epoch' FROM NOW() - atime) AS age
+         FROM usersessions
+        WHERE key=%s""")
+
 def isInsecurePath(req):
     """Check if the request is for an insecure path
 
@@ -124,11 +130,7 @@ def checkSession(db, req):
         sid = req.cookies.get("sid")
         if sid:
             cursor = db.cursor()
-            cursor.execute(
-                """SELECT uid, labels, EXTRACT('epoch' FROM NOW() - atime) AS age
-                     FROM usersessions
-                    WHERE key=%s""",
-                (sid,))
+            cursor.execute(SESSION_QUERY, (sid,))
 
             row = cursor.fetchone()
             if row:
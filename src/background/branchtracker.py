@@ -17,6 +17,7 @@
 import sys
 import os
 import time
+import threading
 import traceback
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), "..")))
@@ -35,109 +36,385 @@ import configuration
 # See https://github.com/git/git/blob/master/sideband.c for details.
 DUMB_SUFFIX = "        "
 
+class TrackedBranch(object):
+    def __init__(self, trackedbranch_id, repository_id, local_name, remote,
+                 remote_name, forced, lag):
+        self.id = trackedbranch_id
+        self.repository_id = repository_id
+        self.local_name = local_name
+        self.remote = remote
+        self.remote_name = remote_name
+        self.forced = forced
+        # Time at which the branch was (or would have been) due for an update.
+        self.due = time.time() - max(0, lag or 0)
+
+    def describe(self):
+        if self.local_name == "*":
+            return "tags in %s" % self.remote
+        else:
+            return "%s in %s" % (self.remote_name, self.remote)
+
+class Job(object):
+    """Update of one or more tracked branches in one repository from one remote
+
+       All branches in a job are checked using a single 'git ls-remote', and
+       the changed ones are fetched using a single 'git fetch'."""
+
+    def __init__(self, repository_id, remote, branches):
+        self.repository_id = repository_id
+        self.remote = remote
+        self.branches = branches
+
 class BranchTracker(background.utils.BackgroundProcess):
     def __init__(self):
-        super(BranchTracker, self).__init__(service=configuration.services.BRANCHTRACKER)
+        service = configuration.services.BRANCHTRACKER
+
+        super(BranchTracker, self).__init__(service=service)
+
+        self.max_workers = service.get("max_workers", 4)
+        self.max_workers_per_remote = service.get("max_workers_per_remote", 2)
+
+        self.__condition = threading.Condition()
+        self.__queue = []
+        self.__running = {}
+        self.__active = set()
+        self.__finished = False
+        self.__stopping = False
+        self.__workers = []
+        self.__worker_dbs = []
+        self.__last_lag = None
+
+    def __takeJob(self):
+        with self.__condition:
+            while not self.__stopping:
+                for index, job in enumerate(self.__queue):
+                    running = self.__running.get(job.remote, 0)
+                    if running < self.max_workers_per_remote:
+                        del self.__queue[index]
+                        self.__running[job.remote] = running + 1
+                        self.__last_lag = max(time.time() - branch.due
+                                              for branch in job.branches)
+                        return job
+                self.__condition.wait()
+            return None
+
+    def __finishJob(self, job):
+        with self.__condition:
+            self.__running[job.remote] -= 1
+            if not self.__running[job.remote]:
+                del self.__running[job.remote]
+            self.__active.difference_update(branch.id for branch in job.branches)
+            self.__finished = True
+            self.__condition.notify_all()
+
+    def __work(self):
+        db = dbutils.Database.forSystem()
+
+        with self.__condition:
+            self.__worker_dbs.append(db)
+
+        while True:
+            job = self.__takeJob()
+            if job is None:
+                break
+            try:
+                self.__process(db, job)
+            except Exception:
+                self.exception()
+                db.rollback()
+            finally:
+                self.__finishJob(job)
+
+        db.close()
+
+    def __process(self, db, job):
+        cursor = db.cursor()
+
+        for branch in job.branches:
+            self.info("checking %s" % branch.describe())
+
+        cursor.execute("""UPDATE trackedbranches
+                             SET previous=NOW(),
+                                 next=NOW() + delay,
+                                 updating=TRUE
+                           WHERE id=ANY (%s)""",
+                       ([branch.id for branch in job.branches],))
+
+        db.commit()
+
+        pending = set(branch.id for branch in job.branches)
 
-    def update(self, trackedbranch_id, repository_id, local_name, remote, remote_name, forced):
-        repository = gitutils.Repository.fromId(self.db, repository_id)
+        try:
+            if job.branches[0].local_name == "*":
+                results = [(branch, self.update(db, branch))
+                           for branch in job.branches]
+            else:
+                results = self.updateBranches(db, job)
+
+            for branch, keep_enabled in results:
+                if keep_enabled:
+                    cursor.execute("""UPDATE trackedbranches
+                                         SET updating=FALSE
+                                       WHERE id=%s""",
+                                   (branch.id,))
+                    cursor.execute("""SELECT next::text
+                                        FROM trackedbranches
+                                       WHERE id=%s""",
+                                   (branch.id,))
+                    self.info("  %s: next scheduled update at %s"
+                              % (branch.describe(), cursor.fetchone()))
+                else:
+                    cursor.execute("""UPDATE trackedbranches
+                                         SET updating=FALSE,
+                                             disabled=TRUE
+                                       WHERE id=%s""",
+                                   (branch.id,))
+                    self.info("  %s: tracking disabled" % branch.describe())
+
+                db.commit()
+
+                pending.discard(branch.id)
+        finally:
+            if pending:
+                # Something failed unexpectedly.  Make sure the branches are
+                # not left marked as being updated, or they would never be
+                # scheduled again.
+                db.rollback()
+                cursor.execute("""UPDATE trackedbranches
+                                     SET updating=FALSE
+                                   WHERE id=ANY (%s)""",
+                               (list(pending),))
+                db.commit()
+
+    def updateBranches(self, db, job):
+        """Update the (non-tag) branches in |job|
+
+           Returns a list of (branch, keep_enabled) tuples."""
+
+        repository = gitutils.Repository.fromId(db, job.repository_id)
+
+        # Check which branches have changed using 'git ls-remote', which is
+        # much cheaper than fetching them.  Branches that are missing in the
+        # remote (or all of them, if 'git ls-remote' fails) are updated one by
+        # one, which reports the problem the usual way.
+        try:
+            output = repository.run(
+                "ls-remote", job.remote,
+                *["refs/heads/%s" % branch.remote_name for branch in job.branches])
+        except gitutils.GitCommandError as error:
+            self.debug("  'git ls-remote' failed: %s" % error)
+            return [(branch, self.update(db, branch))
+                    for branch in job.branches]
+
+        remote_sha1s = {}
+        for line in output.splitlines():
+            sha1, _, ref_name = line.partition("\t")
+            remote_sha1s[ref_name] = sha1
+
+        results = []
+        changed = []
+
+        for branch in job.branches:
+            new = remote_sha1s.get("refs/heads/%s" % branch.remote_name)
+            if new is None:
+                results.append((branch, self.update(db, branch)))
+                continue
+            try:
+                current = repository.revparse("refs/heads/%s" % branch.local_name)
+            except gitutils.GitReferenceError:
+                current = None
+            if current == new:
+                self.debug("  checked %s; no changes" % branch.describe())
+                results.append((branch, True))
+            else:
+                changed.append(branch)
+
+        if not changed:
+            return results
 
         try:
             with repository.relaycopy("branchtracker") as relay:
-                relay.run("remote", "add", "source", remote)
+                relay.run("remote", "add", "source", job.remote)
+
+                try:
+                    relay.run("fetch", "--quiet", "--no-tags", "source",
+                              *["refs/heads/%s:refs/remotes/source/%s"
+                                % (branch.remote_name, branch.remote_name)
+                                for branch in changed])
+                except gitutils.GitCommandError as error:
+                    # Typically a branch that was deleted after the 'git
+                    # ls-remote' above.  Fall back to fetching the branches one
+                    # by one, which reports the failure properly.
+                    self.debug("  fetching from %s failed: %s" % (job.remote, error))
+                    fetched = []
+                else:
+                    fetched = changed
 
-                current = None
-                new = None
-                tags = []
+                for branch in fetched:
+                    results.append((branch, self.push(db, repository, relay, branch)))
+        except Exception:
+            # Branches not yet updated are retried one by one below.
+            self.exception("update from %s failed" % job.remote, as_warning=True)
+
+        done = set(branch.id for branch, _ in results)
+        for branch in changed:
+            if branch.id not in done:
+                results.append((branch, self.update(db, branch)))
+
+        return results
+
+    def update(self, db, branch):
+        """Update a single tracked branch (or the tags) using a fresh fetch
 
-                if local_name == "*":
+           Returns False if the tracking should be disabled."""
+
+        repository = gitutils.Repository.fromId(db, branch.repository_id)
+
+        try:
+            with repository.relaycopy("branchtracker") as relay:
+                relay.run("remote", "add", "source", branch.remote)
+
+                if branch.local_name == "*":
+                    tags = []
                     output = relay.run("fetch", "source", "refs/tags/*:refs/tags/*", include_stderr=True)
                     for line in output.splitlines():
                         if "[new tag]" in line:
                             tags.append(line.rsplit(" ", 1)[-1])
+                    if not tags:
+                        self.debug("  fetched tags in %s; no changes" % branch.remote)
+                        return True
+                    return self.pushTags(db, repository, relay, branch, tags)
                 else:
-                    relay.run("fetch", "--quiet", "--no-tags", "source", "refs/heads/%s:refs/remotes/source/%s" % (remote_name, remote_name))
-                    try:
-                        current = repository.revparse("refs/heads/%s" % local_name)
-                    except gitutils.GitReferenceError:
-                        # It's okay if the local branch doesn't exist (yet).
-                        pass
-                    new = relay.run("rev-parse", "refs/remotes/source/%s" % remote_name).strip()
-
-                if current != new or tags:
-                    if local_name == "*":
-                        refspecs = [("refs/tags/%s" % tag) for tag in tags]
-                    else:
-                        refspecs = ["refs/remotes/source/%s:refs/heads/%s"
-                                    % (remote_name, local_name)]
-
-                    returncode, stdout, stderr = relay.run(
-                        "push", "--force", "origin", *refspecs,
-                        env={ "CRITIC_FLAGS": "trackedbranch_id=%d" % trackedbranch_id,
-                              "TERM": "dumb" },
-                        check_errors=False)
-
-                    stderr_lines = []
-                    remote_lines = []
-
-                    for line in stderr.splitlines():
-                        if line.endswith(DUMB_SUFFIX):
-                            line = line[:-len(DUMB_SUFFIX)]
-                        stderr_lines.append(line)
-                        if line.startswith("remote: "):
-                            line = line[8:]
-                            remote_lines.append(line)
-
-                    if returncode == 0:
-                        if local_name == "*":
-                            for tag in tags:
-                                self.info("  updated tag: %s" % tag)
-                        elif current:
-                            self.info("  updated branch: %s: %s..%s" % (local_name, current[:8], new[:8]))
-                        else:
-                            self.info("  created branch: %s: %s" % (local_name, new[:8]))
-
-                        hook_output = ""
-
-                        for line in remote_lines:
-                            self.debug("  [hook] " + line)
-                            hook_output += line + "\n"
-
-                        if local_name != "*":
-                            cursor = self.db.cursor()
-                            cursor.execute("INSERT INTO trackedbranchlog (branch, from_sha1, to_sha1, hook_output, successful) VALUES (%s, %s, %s, %s, %s)",
-                                           (trackedbranch_id, current if current else '0' * 40, new if new else '0' * 40, hook_output, True))
-                            self.db.commit()
-                    else:
-                        if local_name == "*":
-                            error = "update of tags from %s failed" % remote
-                        else:
-                            error = "update of branch %s from %s in %s failed" % (local_name, remote_name, remote)
-
-                        hook_output = ""
-
-                        for line in stderr_lines:
-                            error += "\n    " + line
-
-                        for line in remote_lines:
-                            hook_output += line + "\n"
-
-                        self.error(error)
-
-                        cursor = self.db.cursor()
-
-                        if local_name != "*":
-                            cursor.execute("""INSERT INTO trackedbranchlog (branch, from_sha1, to_sha1, hook_output, successful)
-                                                   VALUES (%s, %s, %s, %s, %s)""",
-                                           (trackedbranch_id, current, new, hook_output, False))
-                            self.db.commit()
-
-                        cursor.execute("SELECT uid FROM trackedbranchusers WHERE branch=%s", (trackedbranch_id,))
-                        recipients = [dbutils.User.fromId(self.db, user_id) for (user_id,) in cursor]
-
-                        if local_name == "*":
-                            mailutils.sendMessage(recipients, "%s: update of tags from %s stopped!" % (repository.name, remote),
-                                                  """\
+                    relay.run("fetch", "--quiet", "--no-tags", "source", "refs/heads/%s:refs/remotes/source/%s" % (branch.remote_name, branch.remote_name))
+                    return self.push(db, repository, relay, branch)
+        except Exception:
+            self.reportFailure(branch)
+            return True
+
+    def reportFailure(self, branch):
+        exception = traceback.format_exc()
+
+        if branch.local_name == "*":
+            error = "  update of tags from %s failed" % branch.remote
+        else:
+            error = "  update of branch %s from %s in %s failed" % (branch.local_name, branch.remote_name, branch.remote)
+
+        for line in exception.splitlines():
+            error += "\n    " + line
+
+        self.error(error)
+
+        # The expected failure (in case of diverged branches, or review branch
+        # irregularities) is a failed "git push" and is handled in pushRefs().
+        # This is an unexpected failure, so might be intermittent.  Leave the
+        # tracking enabled and spam the system administrator(s).
+
+    def push(self, db, repository, relay, branch):
+        """Push a branch fetched into |relay| to the repository, if changed"""
+
+        try:
+            try:
+                current = repository.revparse("refs/heads/%s" % branch.local_name)
+            except gitutils.GitReferenceError:
+                # It's okay if the local branch doesn't exist (yet).
+                current = None
+
+            new = relay.run("rev-parse", "refs/remotes/source/%s" % branch.remote_name).strip()
+
+            if current == new:
+                self.debug("  fetched %s; no changes" % branch.describe())
+                return True
+
+            return self.pushRefs(db, repository, relay, branch,
+                                 ["refs/remotes/source/%s:refs/heads/%s"
+                                  % (branch.remote_name, branch.local_name)],
+                                 current=current, new=new)
+        except Exception:
+            self.reportFailure(branch)
+            return True
+
+    def pushTags(self, db, repository, relay, branch, tags):
+        return self.pushRefs(db, repository, relay, branch,
+                             [("refs/tags/%s" % tag) for tag in tags],
+                             tags=tags)
+
+    def pushRefs(self, db, repository, relay, branch, refspecs,
+                 current=None, new=None, tags=None):
+        trackedbranch_id = branch.id
+        local_name = branch.local_name
+        remote = branch.remote
+        remote_name = branch.remote_name
+
+        returncode, stdout, stderr = relay.run(
+            "push", "--force", "origin", *refspecs,
+            env={ "CRITIC_FLAGS": "trackedbranch_id=%d" % trackedbranch_id,
+                  "TERM": "dumb" },
+            check_errors=False)
+
+        stderr_lines = []
+        remote_lines = []
+
+        for line in stderr.splitlines():
+            if line.endswith(DUMB_SUFFIX):
+                line = line[:-len(DUMB_SUFFIX)]
+            stderr_lines.append(line)
+            if line.startswith("remote: "):
+                line = line[8:]
+                remote_lines.append(line)
+
+        if returncode == 0:
+            if local_name == "*":
+                for tag in tags:
+                    self.info("  updated tag: %s" % tag)
+            elif current:
+                self.info("  updated branch: %s: %s..%s" % (local_name, current[:8], new[:8]))
+            else:
+                self.info("  created branch: %s: %s" % (local_name, new[:8]))
+
+            hook_output = ""
+
+            for line in remote_lines:
+                self.debug("  [hook] " + line)
+                hook_output += line + "\n"
+
+            if local_name != "*":
+                cursor = db.cursor()
+                cursor.execute("INSERT INTO trackedbranchlog (branch, from_sha1, to_sha1, hook_output, successful) VALUES (%s, %s, %s, %s, %s)",
+                               (trackedbranch_id, current if current else '0' * 40, new if new else '0' * 40, hook_output, True))
+                db.commit()
+
+            # Everything went well; keep the tracking enabled.
+            return True
+
+        if local_name == "*":
+            error = "update of tags from %s failed" % remote
+        else:
+            error = "update of branch %s from %s in %s failed" % (local_name, remote_name, remote)
+
+        hook_output = ""
+
+        for line in stderr_lines:
+            error += "\n    " + line
+
+        for line in remote_lines:
+            hook_output += line + "\n"
+
+        self.error(error)
+
+        cursor = db.cursor()
+
+        if local_name != "*":
+            cursor.execute("""INSERT INTO trackedbranchlog (branch, from_sha1, to_sha1, hook_output, successful)
+                                   VALUES (%s, %s, %s, %s, %s)""",
+                           (trackedbranch_id, current, new, hook_output, False))
+            db.commit()
+
+        cursor.execute("SELECT uid FROM trackedbranchusers WHERE branch=%s", (trackedbranch_id,))
+        recipients = [dbutils.User.fromId(db, user_id) for (user_id,) in cursor]
+
+        if local_name == "*":
+            mailutils.sendMessage(recipients, "%s: update of tags from %s stopped!" % (repository.name, remote),
+                                  """\
 The automatic update of tags in
   %s:%s
 from the remote
@@ -149,9 +426,9 @@ Output from Critic's git hook
 -----------------------------
 
 %s""" % (configuration.base.HOSTNAME, repository.path, remote, hook_output))
-                        else:
-                            mailutils.sendMessage(recipients, "%s: update from %s in %s stopped!" % (local_name, remote_name, remote),
-                                                  """\
+        else:
+            mailutils.sendMessage(recipients, "%s: update from %s in %s stopped!" % (local_name, remote_name, remote),
+                                  """\
 The automatic update of the branch '%s' in
   %s:%s
 from the branch '%s' in
@@ -164,123 +441,172 @@ Output from Critic's git hook
 
 %s""" % (local_name, configuration.base.HOSTNAME, repository.path, remote_name, remote, hook_output))
 
-                        # Disable the tracking.
-                        return False
-                else:
-                    self.debug("  fetched %s in %s; no changes" % (remote_name, remote))
-
-            # Everything went well; keep the tracking enabled.
-            return True
-        except:
-            exception = traceback.format_exc()
-
-            if local_name == "*":
-                error = "  update of tags from %s failed" % remote
-            else:
-                error = "  update of branch %s from %s in %s failed" % (local_name, remote_name, remote)
-
-            for line in exception.splitlines():
-                error += "\n    " + line
-
-            self.error(error)
-
-            # The expected failure (in case of diverged branches, or review branch
-            # irregularities) is a failed "git push" and is handled above.  This is
-            # an unexpected failure, so might be intermittent.  Leave the tracking
-            # enabled and spam the system administrator(s).
-            return True
+        # Disable the tracking.
+        return False
+
+    def schedule(self):
+        """Queue updates of all tracked branches that are due
+
+           Branches already queued or being updated are skipped.  Returns the
+           number of seconds until the next branch is due, or None if no
+           branches are tracked."""
+
+        cursor = self.db.cursor()
+        cursor.execute("""SELECT id, repository, local_name, remote, remote_name, forced,
+                                 EXTRACT('epoch' FROM NOW() - next)
+                            FROM trackedbranches
+                           WHERE NOT disabled
+                             AND (next IS NULL OR next < NOW())
+                        ORDER BY next ASC NULLS FIRST""")
+        rows = cursor.fetchall()
+
+        with self.__condition:
+            self.__finished = False
+            jobs = {}
+
+            for row in rows:
+                if row[0] in self.__active:
+                    continue
+                branch = TrackedBranch(*row)
+                self.__active.add(branch.id)
+                if branch.local_name == "*":
+                    # Tags are fetched using a separate 'git fetch' per remote.
+                    self.__queue.append(Job(branch.repository_id, branch.remote, [branch]))
+                    continue
+                key = (branch.repository_id, branch.remote)
+                if key not in jobs:
+                    jobs[key] = Job(branch.repository_id, branch.remote, [])
+                    self.__queue.append(jobs[key])
+                jobs[key].branches.append(branch)
+
+            self.__condition.notify_all()
+
+            active = list(self.__active)
+
+        cursor.execute("""SELECT COUNT(*), EXTRACT('epoch' FROM (MIN(next) - NOW()))
+                            FROM trackedbranches
+                           WHERE NOT disabled
+                             AND NOT (id=ANY (%s))""",
+                       (active,))
+
+        enabled_branches, update_delay = cursor.fetchone()
+
+        self.db.commit()
+
+        if not enabled_branches:
+            return None
+        if update_delay is None:
+            # Some branch has next=NULL, meaning an update was requested.
+            return 0
+        return max(0, int(update_delay))
+
+    def publishMetrics(self):
+        now = time.time()
+
+        with self.__condition:
+            queued = [branch for job in self.__queue for branch in job.branches]
+            metrics = { "max_workers": self.max_workers,
+                        "queued_jobs": len(self.__queue),
+                        "queued_branches": len(queued),
+                        "running_jobs": sum(self.__running.values()),
+                        "active_branches": len(self.__active),
+                        "lag": max([now - branch.due for branch in queued] or [0]),
+                        "last_lag": self.__last_lag }
+
+        self.publish_metrics(metrics)
+
+    def isIdle(self):
+        with self.__condition:
+            return not self.__active
+
+    def wait(self, delay):
+        """Sleep for |delay| seconds, or until interrupted
+
+           The sleep is cut short by signals and by finished jobs, and by
+           requests to synchronize, once no jobs are running."""
+
+        deadline = time.time() + delay
+
+        while not (self.terminated or self.interrupted):
+            with self.__condition:
+                # A pending synchronization is only handled when idle (see
+                # run()), so don't let it cut the sleep short while jobs are
+                # still running; run() would just end up spinning.
+                if self.synchronize_when_idle and not self.__active:
+                    break
+                if self.__finished:
+                    self.__finished = False
+                    break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            # Signals are only handled by the main thread, between (not during)
+            # waits on the condition, so wait in short steps.
+            with self.__condition:
+                self.__condition.wait(min(remaining, 1))
 
     def run(self):
         self.db = dbutils.Database.forSystem()
 
-        while not self.terminated:
-            self.interrupted = False
+        for _ in range(self.max_workers):
+            worker = threading.Thread(target=self.__work)
+            worker.daemon = True
+            worker.start()
+            self.__workers.append(worker)
 
-            cursor = self.db.cursor()
-            cursor.execute("""SELECT id, repository, local_name, remote, remote_name, forced
-                                FROM trackedbranches
-                               WHERE NOT disabled
-                                 AND (next IS NULL OR next < NOW())
-                            ORDER BY next ASC NULLS FIRST""")
-            rows = cursor.fetchall()
+        try:
+            while not self.terminated:
+                self.interrupted = False
 
-            for trackedbranch_id, repository_id, local_name, remote, remote_name, forced in rows:
-                if local_name == "*":
-                    self.info("checking tags in %s" % remote)
-                else:
-                    self.info("checking %s in %s" % (remote_name, remote))
+                update_delay = self.schedule()
 
-                cursor.execute("""UPDATE trackedbranches
-                                     SET previous=NOW(),
-                                         next=NOW() + delay,
-                                         updating=TRUE
-                                   WHERE id=%s""",
-                               (trackedbranch_id,))
+                self.publishMetrics()
 
-                self.db.commit()
+                if update_delay == 0:
+                    # Some branch became due just now.
+                    continue
 
-                if self.update(trackedbranch_id, repository_id, local_name, remote, remote_name, forced):
-                    cursor.execute("""UPDATE trackedbranches
-                                         SET updating=FALSE
-                                       WHERE id=%s""",
-                                   (trackedbranch_id,))
-                    cursor.execute("""SELECT next::text
-                                        FROM trackedbranches
-                                       WHERE id=%s""",
-                                   (trackedbranch_id,))
-                    self.info("  next scheduled update at %s" % cursor.fetchone())
-                else:
-                    cursor.execute("""UPDATE trackedbranches
-                                         SET updating=FALSE,
-                                             disabled=TRUE
-                                       WHERE id=%s""",
-                                   (trackedbranch_id,))
-                    self.info("  tracking disabled")
+                if self.isIdle():
+                    maintenance_delay = self.run_maintenance()
 
-                self.db.commit()
+                    if maintenance_delay is None:
+                        maintenance_delay = 3600
 
-                if self.terminated: break
+                    if update_delay is None:
+                        self.info("nothing to do")
+                        update_delay = 3600
 
-            cursor.execute("""SELECT 1
-                                FROM trackedbranches
-                               WHERE NOT disabled
-                                 AND next IS NULL""")
+                    delay = min(maintenance_delay, update_delay)
 
-            if not cursor.fetchone():
-                maintenance_delay = self.run_maintenance()
+                    if delay:
+                        self.signal_idle_state()
 
-                if maintenance_delay is None:
-                    maintenance_delay = 3600
+                        self.debug("sleeping %d seconds" % delay)
 
-                cursor.execute("""SELECT COUNT(*), EXTRACT('epoch' FROM (MIN(next) - NOW()))
-                                    FROM trackedbranches
-                                   WHERE NOT disabled""")
+                        with self.__condition:
+                            worker_dbs = self.__worker_dbs[:]
+                        for db in [self.db] + worker_dbs:
+                            gitutils.Repository.forEach(db, lambda db, repository: repository.stopBatch())
 
-                enabled_branches, update_delay = cursor.fetchone()
+                        self.db.commit()
 
-                if not enabled_branches:
-                    self.info("nothing to do")
-                    update_delay = 3600
+                        before = time.time()
+                        self.wait(delay)
+                        if self.interrupted:
+                            self.debug("sleep interrupted after %.2f seconds" % (time.time() - before))
                 else:
-                    update_delay = max(0, int(update_delay))
-
-                delay = min(maintenance_delay, update_delay)
+                    self.wait(3600 if update_delay is None else update_delay)
 
-                if delay:
-                    self.signal_idle_state()
-
-                    self.debug("sleeping %d seconds" % delay)
-
-                    gitutils.Repository.forEach(self.db, lambda db, repository: repository.stopBatch())
-
-                    self.db.commit()
-
-                    before = time.time()
-                    time.sleep(delay)
-                    if self.interrupted:
-                        self.debug("sleep interrupted after %.2f seconds" % (time.time() - before))
-
-            self.db.commit()
+                self.db.commit()
+        finally:
+            with self.__condition:
+                self.__stopping = True
+                del self.__queue[:]
+                self.__condition.notify_all()
+
+            # Let updates in progress finish.
+            for worker in self.__workers:
+                worker.join()
 
 def start_service():
     tracker = BranchTracker()
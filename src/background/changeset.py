@@ -27,7 +27,7 @@ from textutils import json_decode, json_encode
 
 if "--json-job" in sys.argv[1:]:
     from resource import getrlimit, setrlimit, RLIMIT_RSS
-    from traceback import print_exc
+    from traceback import format_exc
 
     def perform_job():
         soft_limit, hard_limit = getrlimit(RLIMIT_RSS)
@@ -35,24 +35,28 @@ if "--json-job" in sys.argv[1:]:
         if soft_limit < rss_limit:
             setrlimit(RLIMIT_RSS, (rss_limit, hard_limit))
 
-        from changeset.create import createChangeset
+        from changeset.create import createChangeset, closePool
 
-        request = json_decode(sys.stdin.read())
+        results = []
 
-        try:
-            db = dbutils.Database.forSystem()
+        for request in json_decode(sys.stdin.read()):
+            try:
+                db = dbutils.Database.forSystem()
 
-            createChangeset(db, request)
+                createChangeset(db, request)
 
-            db.close()
+                db.close()
+
+                results.append(request)
+            except:
+                result = request.copy()
+                result["error"] = ("Request:\n%s\n\n%s"
+                                   % (json_encode(request, indent=2), format_exc()))
+                results.append(result)
 
-            sys.stdout.write(json_encode(request))
-        except:
-            print "Request:"
-            print json_encode(request, indent=2)
-            print
+        closePool()
 
-            print_exc(file=sys.stdout)
+        sys.stdout.write(json_encode(results))
 
     background.utils.call("changeset_job", perform_job)
 else:
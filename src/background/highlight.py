@@ -16,26 +16,33 @@
 
 import sys
 import os
-import time
-from subprocess import Popen as process
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), "..")))
 
 import background.utils
 from textutils import json_decode, json_encode
 
-if "--json-job" in sys.argv[1:]:
-    def perform_job():
-        import syntaxhighlight.generate
+def perform_job():
+    import syntaxhighlight.generate
+    from traceback import format_exc
+
+    results = []
+
+    for request in json_decode(sys.stdin.read()):
+        result = request.copy()
+        try:
+            result["highlighted"] = syntaxhighlight.generate.generateHighlight(
+                repository_path=request["repository_path"],
+                sha1=request["sha1"],
+                language=request["language"],
+                mode=request["mode"])
+        except Exception:
+            result["error"] = format_exc()
+        results.append(result)
 
-        request = json_decode(sys.stdin.read())
-        request["highlighted"] = syntaxhighlight.generate.generateHighlight(
-            repository_path=request["repository_path"],
-            sha1=request["sha1"],
-            language=request["language"],
-            mode=request["mode"])
-        sys.stdout.write(json_encode(request))
+    sys.stdout.write(json_encode(results))
 
+if "--json-job" in sys.argv[1:]:
     background.utils.call("highlight_job", perform_job)
 else:
     import background.utils
@@ -57,6 +64,19 @@ else:
                 hour, minute = service["compact_at"]
                 self.register_maintenance(hour=hour, minute=minute, callback=self.__compact)
 
+        def startup(self):
+            super(HighlightServer, self).startup()
+
+            # Import the highlighters, and thus Pygments, once and for all, so
+            # that jobs forked from this process don't have to.  The module is
+            # only imported for this side-effect, and isn't used here.
+            __import__("syntaxhighlight.generate")
+
+        def start_job(self):
+            process = background.utils.ForkedProcess(perform_job)
+            self.debug("forked child process (pid=%d)" % process.pid)
+            return process
+
         def request_result(self, request):
             if isHighlighted(request["sha1"], request["language"], request["mode"]):
                 result = request.copy()
@@ -81,100 +101,48 @@ else:
 
         def execute_command(self, client, command):
             if command["command"] == "compact":
-                uncompressed_count, compressed_count, purged_files_count, purged_contexts_count = self.__compact()
+                entries_count, purged_entries_count, purged_contexts_count = self.__compact()
 
                 client.write(json_encode({ "status": "ok",
-                                           "uncompressed": uncompressed_count,
-                                           "compressed": compressed_count,
-                                           "purged_files": purged_files_count,
+                                           "entries": entries_count,
+                                           "purged_entries": purged_entries_count,
                                            "purged_contexts": purged_contexts_count }))
                 client.close()
             else:
                 super(HighlightServer, self).execute_command(client, command)
 
         def __compact(self):
-            import syntaxhighlight
-
-            cache_dir = configuration.services.HIGHLIGHT["cache_dir"]
-
-            if not os.path.isdir(cache_dir):
-                # Newly installed system that hasn't highlighted anything.
-                return 0, 0, 0, 0
+            from syntaxhighlight.store import getStore
 
             self.info("cache compacting started")
 
-            now = time.time()
+            # Entries that haven't been read in this long are purged.
+            max_age = 90 * 24 * 60 * 60
 
-            max_age_uncompressed = 7 * 24 * 60 * 60
-            max_age_compressed = 90 * 24 * 60 * 60
+            kept, purged_entries = getStore().compact(max_age)
+            cached_sha1s = set(sha1 for sha1, _, _ in kept)
 
-            uncompressed_count = 0
-            compressed_count = 0
-
-            purged_paths = []
+            self.info("cache compacting finished: entries=%d / purged=%d"
+                      % (len(kept), purged_entries))
 
             db = dbutils.Database.forSystem()
 
             cursor = db.cursor()
+            cursor.execute("SELECT DISTINCT sha1 FROM codecontexts")
+
+            purged_sha1s = [sha1 for (sha1,) in cursor
+                            if sha1 not in cached_sha1s]
 
-            cursor.execute("CREATE TEMPORARY TABLE purged (sha1 CHAR(40) PRIMARY KEY)")
-            cursor.execute("INSERT INTO purged (sha1) SELECT DISTINCT sha1 FROM codecontexts")
-
-            for section in sorted(os.listdir(cache_dir)):
-                if len(section) == 2:
-                    for filename in os.listdir("%s/%s" % (cache_dir, section)):
-                        fullname = "%s/%s/%s" % (cache_dir, section, filename)
-                        age = now - os.stat(fullname).st_mtime
-
-                        parts = filename.split(".")
-
-                        if len(parts) < 2 \
-                                or len(parts[0]) != 38 \
-                                or parts[1] not in syntaxhighlight.LANGUAGES:
-                            os.unlink(fullname)
-                            continue
-
-                        sha1 = section + parts[0]
-
-                        if parts[-1] == "bz2":
-                            if age > max_age_compressed:
-                                self.debug("purging: %s/%s" % (section, filename))
-                                purged_paths.append(fullname)
-                            else:
-                                cursor.execute("DELETE FROM purged WHERE sha1=%s", (sha1,))
-                                compressed_count += 1
-                        elif parts[-1] == "ctx":
-                            self.debug("deleting context file: %s/%s" % (section, filename))
-                            os.unlink(fullname)
-                        else:
-                            cursor.execute("DELETE FROM purged WHERE sha1=%s", (sha1,))
-                            if age > max_age_uncompressed:
-                                self.debug("compressing: %s/%s" % (section, filename))
-                                worker = process(["/bin/bzip2", fullname])
-                                worker.wait()
-                                compressed_count += 1
-                            else:
-                                uncompressed_count += 1
-
-            self.info("cache compacting finished: uncompressed=%d / compressed=%d / purged=%d"
-                      % (uncompressed_count, compressed_count, len(purged_paths)))
-
-            if purged_paths:
-                for path in purged_paths: os.unlink(path)
-
-            cursor.execute("SELECT COUNT(*) FROM purged")
-
-            purged_contexts = cursor.fetchone()[0]
-
-            cursor.execute("""DELETE
-                                FROM codecontexts
-                               WHERE sha1 IN (SELECT sha1
-                                                FROM purged)""")
+            if purged_sha1s:
+                cursor.execute("""DELETE
+                                    FROM codecontexts
+                                   WHERE sha1=ANY (%s)""",
+                               (purged_sha1s,))
 
             db.commit()
             db.close()
 
-            return uncompressed_count, compressed_count, len(purged_paths), purged_contexts
+            return len(kept), purged_entries, len(purged_sha1s)
 
     def start_service():
         server = HighlightServer()
@@ -62,6 +62,17 @@ if "--slave" in sys.argv:
                 self.started = None
                 self.process = None
                 self.callbacks = []
+                self.pidfile_path = service_data["pidfile_path"]
+
+            def metrics(self):
+                # Published by background.utils.BackgroundProcess.publish_metrics().
+                if not self.process:
+                    return None
+                try:
+                    with open(self.pidfile_path + ".metrics") as metrics_file:
+                        return background.utils.json_decode(metrics_file.read())
+                except (IOError, ValueError):
+                    return None
 
             def signal_callbacks(self, event):
                 self.callbacks = filter(lambda callback: callback(event), self.callbacks)
@@ -139,6 +150,9 @@ if "--slave" in sys.argv:
                         services[service.name] = { "module": service.module,
                                                    "uptime": uptime,
                                                    "pid": pid }
+                        metrics = service.metrics()
+                        if metrics is not None:
+                            services[service.name]["metrics"] = metrics
 
                     return result({ "status": "ok", "services": services })
                 elif request.get("command") == "restart":
@@ -132,6 +132,8 @@ class BackgroundProcess(object):
         if self.manage_pidfile:
             try: os.unlink(self.__pidfile_path)
             except: pass
+            try: os.unlink(self.__pidfile_path + ".metrics")
+            except: pass
 
     def __signal_started(self):
         try:
@@ -182,6 +184,18 @@ class BackgroundProcess(object):
             os.unlink(self.__pidfile_path + ".busy")
             self.synchronize_when_idle = False
 
+    def publish_metrics(self, metrics):
+        """Make |metrics| available to the service manager
+
+           The metrics (a JSON compatible dictionary) are written to the file
+           "<pidfile_path>.metrics", and included in the service manager's
+           response to status queries."""
+
+        path = self.__pidfile_path + ".metrics"
+        with open(path + ".tmp", "w") as metrics_file:
+            metrics_file.write(json_encode(metrics))
+        os.rename(path + ".tmp", path)
+
     def error(self, message):
         self.__logger.error(message)
 
@@ -648,23 +662,108 @@ class SlaveProcessServer(PeerServer):
     def handle_peer(self, peersocket, peeraddress):
         return SlaveProcessServer.SlaveClient(self, peersocket)
 
+class ForkedProcess(object):
+    """Minimal subprocess.Popen look-alike for a forked child process
+
+       The child process calls |fn| with stdin reading from, and stdout and
+       stderr writing to, pipes connected to the parent process.  It then
+       exits without running any clean-up code inherited from the parent."""
+
+    def __init__(self, fn):
+        stdin_read, stdin_write = os.pipe()
+        stdout_read, stdout_write = os.pipe()
+
+        self.pid = os.fork()
+
+        if self.pid == 0:
+            returncode = 1
+            try:
+                os.dup2(stdin_read, 0)
+                os.dup2(stdout_write, 1)
+                os.dup2(stdout_write, 2)
+                # Close everything else, in particular the pipes of other
+                # child processes, which would otherwise be kept open by us.
+                os.closerange(3, subprocess.MAXFD)
+                for signum in (signal.SIGHUP, signal.SIGTERM,
+                               signal.SIGUSR1, signal.SIGUSR2):
+                    signal.signal(signum, signal.SIG_DFL)
+                fn()
+                returncode = 0
+            except:
+                traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(returncode)
+
+        os.close(stdin_read)
+        os.close(stdout_write)
+
+        self.stdin = os.fdopen(stdin_write, "w")
+        self.stdout = os.fdopen(stdout_read, "r")
+        self.stderr = None
+        self.returncode = None
+
+    def send_signal(self, signum):
+        os.kill(self.pid, signum)
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                _, status = os.waitpid(self.pid, 0)
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                raise
+            if os.WIFSIGNALED(status):
+                self.returncode = -os.WTERMSIG(status)
+            else:
+                self.returncode = os.WEXITSTATUS(status)
+        return self.returncode
+
 class JSONJobServer(PeerServer):
-    class Job(PeerServer.ChildProcess):
-        def __init__(self, server, client, request):
-            super(JSONJobServer.Job, self).__init__(server, [sys.executable, sys.argv[0], "--json-job"], stderr=subprocess.STDOUT)
-            self.clients = [client]
-            self.request = request
-            self.write(json_encode(request))
+    """Server that processes JSON requests from clients in child processes
+
+       Requests are processed in batches of up to |batch_size| (from the
+       service configuration) requests per child process.  Requests from
+       synchronous clients are processed before requests from asynchronous
+       ones, and unless |max_workers| is one, one worker is reserved for them.
+
+       Identical requests from different clients are only processed once."""
+
+    class Job(PeerServer.SpawnedProcess):
+        def __init__(self, server, process, requests, clients):
+            super(JSONJobServer.Job, self).__init__(server, process)
+            self.requests = requests
+            # Map from frozen request to list of clients waiting for its
+            # result.  More clients may be added while the job is running.
+            self.clients = clients
+            self.write(json_encode(requests))
             self.close()
 
         def handle_input(self, _file, value):
-            try: result = json_decode(value)
+            try:
+                results = json_decode(value)
+                if not isinstance(results, list) \
+                        or len(results) != len(self.requests):
+                    raise ValueError
             except ValueError:
                 self.server.error("invalid response:\n" + indent(value))
-                result = self.request.copy()
-                result["error"] = value
-            for client in self.clients: client.add_result(result)
-            self.server.request_finished(self, self.request, result)
+                results = []
+                for request in self.requests:
+                    result = request.copy()
+                    result["error"] = value
+                    results.append(result)
+            else:
+                for result in results:
+                    if "error" in result:
+                        self.server.error("request failed:\n" + indent(result["error"]))
+            for request, result in zip(self.requests, results):
+                for client in self.clients[freeze(request)]:
+                    client.add_result(result)
+                self.server.request_finished(self, request, result)
 
     class JobClient(PeerServer.SocketPeer):
         def handle_input(self, _file, value):
@@ -681,6 +780,9 @@ class JSONJobServer(PeerServer):
             if self.__async:
                 self.close()
 
+        def is_async(self):
+            return self.__async
+
         def has_requests(self):
             return bool(self.__pending_requests)
 
@@ -699,28 +801,36 @@ class JSONJobServer(PeerServer):
 
     def __init__(self, service):
         super(JSONJobServer, self).__init__(service)
-        self.__clients_with_requests = []
+        self.__sync_clients_with_requests = []
+        self.__async_clients_with_requests = []
         self.__started_requests = {}
+        self.__jobs = set()
         self.__max_workers = service.get("max_workers", 4)
+        self.__batch_size = service.get("batch_size", 1)
 
-    def __startJobs(self):
-        # Repeat "start a job" while there are jobs to start and we haven't
-        # reached the limit on number of concurrent jobs to run.
-        while self.__clients_with_requests and len(self.__started_requests) < self.__max_workers:
+    def __collectRequests(self, clients_with_requests):
+        requests = []
+        clients = {}
+
+        while clients_with_requests and len(requests) < self.__batch_size:
             # Fetch next request from first client in list of clients with
             # pending requests.
-            client = self.__clients_with_requests.pop(0)
+            client = clients_with_requests.pop(0)
             frozen = client.get_request()
 
             if client.has_requests():
                 # Client has more pending requests, so put it back at the end of
                 # the list of clients with pending requests.
-                self.__clients_with_requests.append(client)
+                clients_with_requests.append(client)
 
             if frozen in self.__started_requests:
                 # Another client has requested the same thing, piggy-back on
-                # that job instead of starting another.
-                self.__started_requests[frozen].clients.append(client)
+                # that job instead of processing it again.
+                self.__started_requests[frozen].clients[frozen].append(client)
+                continue
+            elif frozen in clients:
+                # Same thing, but the other request is in this batch.
+                clients[frozen].append(client)
                 continue
 
             request = thaw(frozen)
@@ -730,18 +840,61 @@ class JSONJobServer(PeerServer):
             result = self.request_result(request)
 
             if result:
-                # Request is already finished; don't bother starting a child
-                # process, just report result directly to the client.
+                # Request is already finished; don't bother processing it, just
+                # report result directly to the client.
                 client.add_result(result)
             else:
-                # Start child process.
-                job = JSONJobServer.Job(self, client, request)
-                self.add_peer(job)
+                requests.append(request)
+                clients[frozen] = [client]
+
+        return requests, clients
+
+    def __startJobs(self):
+        # Repeat "start a job" while there are jobs to start and we haven't
+        # reached the limit on number of concurrent jobs to run.
+        while len(self.__jobs) < self.__max_workers:
+            if self.__sync_clients_with_requests:
+                clients_with_requests = self.__sync_clients_with_requests
+            elif self.__async_clients_with_requests \
+                    and (self.__max_workers == 1
+                         or len(self.__jobs) < self.__max_workers - 1):
+                # Keep one worker free for synchronous requests.
+                clients_with_requests = self.__async_clients_with_requests
+            else:
+                break
+
+            requests, clients = self.__collectRequests(clients_with_requests)
+
+            if not requests:
+                continue
+
+            job = JSONJobServer.Job(self, self.start_job(), requests, clients)
+            self.__jobs.add(job)
+            self.add_peer(job)
+
+            for request in requests:
                 self.request_started(job, request)
 
+    def start_job(self):
+        """Start a child process that processes a list of requests
+
+           Returns a subprocess.Popen-like object.  The child process reads a
+           JSON encoded list of requests from stdin, and writes a JSON encoded
+           list of results to stdout.  The default implementation runs the
+           server's script again, with the argument --json-job."""
+        process = subprocess.Popen(
+            [sys.executable, sys.argv[0], "--json-job"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        self.debug("spawned child process (pid=%d)" % process.pid)
+        return process
+
     def add_requests(self, client):
         assert client.has_requests()
-        self.__clients_with_requests.append(client)
+        if client.is_async():
+            self.__async_clients_with_requests.append(client)
+        else:
+            self.__sync_clients_with_requests.append(client)
         self.__startJobs()
 
     def execute_command(self, client, command):
@@ -752,7 +905,9 @@ class JSONJobServer(PeerServer):
         return JSONJobServer.JobClient(self, peersocket)
 
     def peer_destroyed(self, peer):
-        if isinstance(peer, JSONJobServer.Job): self.__startJobs()
+        if isinstance(peer, JSONJobServer.Job):
+            self.__jobs.discard(peer)
+            self.__startJobs()
 
     def request_result(self, request):
         pass
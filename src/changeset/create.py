@@ -14,61 +14,233 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import itertools
+import multiprocessing
+
+import configuration
 import dbutils
 import gitutils
+import diff
+import diff.lineindex
 import diff.merge
 import diff.parse
 
+# Number of files whose ids are looked up, and of rows inserted into the
+# database, per query.
+INSERT_BATCH_SIZE = 100
+
+# Pool of worker processes analyzing chunks, shared by all changesets created
+# by this (job) process.  Created on first use.
+_POOL = None
+
+# Blobs recently loaded by this (worker) process.  Consecutive changesets
+# typically share blobs, since the new version of a file in one commit is the
+# old version in the next.
+_BLOBS = None
+
+def getAnalysisWorkers():
+    """Return the number of worker processes each changeset job may use
+
+       This is separate from CHANGESET["max_workers"], which limits the number
+       of changeset jobs running in parallel."""
+    return configuration.services.CHANGESET.get("analysis_workers", 1)
+
+def getPool():
+    global _POOL
+    if _POOL is None:
+        _POOL = multiprocessing.Pool(processes=getAnalysisWorkers())
+    return _POOL
+
+def closePool():
+    """Stop the worker processes, if any were started"""
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL.join()
+        _POOL = None
+
+def _terminatePool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.terminate()
+        _POOL.join()
+        _POOL = None
+
+def loadBlobLines(repository, sha1):
+    global _BLOBS
+    if _BLOBS is None:
+        _BLOBS = gitutils.ObjectCache(configuration.limits.GIT_OBJECT_CACHE_SIZE)
+    key = (repository.path, sha1)
+    git_object = _BLOBS.get(key)
+    if git_object is None:
+        git_object = repository.fetch(sha1)
+        _BLOBS.set(key, git_object)
+    return diff.lineindex.LineIndex(git_object.data)
+
+def analyzeChunks(arguments):
+    """Analyze a file's chunks, and return the resulting analyses
+
+       Called in pool worker processes, and thus takes and returns only simple
+       values."""
+
+    repository_path, path, old_sha1, new_sha1, old_mode, new_mode, chunks = arguments
+
+    file = diff.File(None, path, old_sha1, new_sha1,
+                     gitutils.Repository(path=repository_path),
+                     old_mode=old_mode, new_mode=new_mode,
+                     chunks=[diff.Chunk(delete_offset, delete_count,
+                                        insert_offset, insert_count,
+                                        is_whitespace=is_whitespace,
+                                        analysis=analysis)
+                             for (delete_offset, delete_count,
+                                  insert_offset, insert_count,
+                                  is_whitespace, analysis) in chunks])
+
+    # Only files with both deleted and inserted lines are analyzed, so both
+    # versions exist.  (Submodules are left to diff.File.)
+    if old_mode != "160000":
+        file.old_plain = loadBlobLines(file.repository, old_sha1)
+        file.old_eof_eol = file.old_plain.eof_eol
+    if new_mode != "160000":
+        file.new_plain = loadBlobLines(file.repository, new_sha1)
+        file.new_eof_eol = file.new_plain.eof_eol
+
+    for index, chunk in enumerate(file.chunks):
+        chunk.analyze(file, index == len(file.chunks) - 1)
+
+    return [chunk.analysis for chunk in file.chunks]
+
+def needsAnalysis(file):
+    return any(not chunk.analysis and chunk.delete_count and chunk.insert_count
+               for chunk in file.chunks)
+
+def analyzeFiles(repository, files):
+    """Analyze the chunks of all files, yielding each file once done
+
+       Files are yielded in no particular order.  If there are multiple files
+       that need analysis, the work is distributed over a pool of (at most
+       CHANGESET["analysis_workers"]) worker processes."""
+
+    pending = []
+
+    for file in files:
+        if needsAnalysis(file):
+            pending.append(file)
+        else:
+            yield file
+
+    if not pending:
+        return
+
+    if getAnalysisWorkers() < 2 or len(pending) < 2:
+        for file in pending:
+            for index, chunk in enumerate(file.chunks):
+                chunk.analyze(file, index == len(file.chunks) - 1)
+            yield file
+        return
+
+    arguments = [(repository.path, file.path, file.old_sha1, file.new_sha1,
+                  file.old_mode, file.new_mode,
+                  [(chunk.delete_offset, chunk.delete_count,
+                    chunk.insert_offset, chunk.insert_count,
+                    chunk.is_whitespace, chunk.analysis)
+                   for chunk in file.chunks])
+                 for file in pending]
+
+    try:
+        for index, analyses in getPool().imap_unordered(
+                _analyzeWithIndex, enumerate(arguments)):
+            file = pending[index]
+            for chunk, analysis in itertools.izip(file.chunks, analyses):
+                chunk.analysis = analysis
+            yield file
+    except:
+        # Also when the caller stops iterating (GeneratorExit), since the
+        # remaining results would otherwise be left in the pool.
+        _terminatePool()
+        raise
+
+def _analyzeWithIndex(item):
+    index, arguments = item
+    return index, analyzeChunks(arguments)
+
 def createChangeset(db, request):
     repository_name = request["repository_name"]
     changeset_type = request["changeset_type"]
 
     repository = gitutils.Repository.fromName(db, repository_name)
 
-    def insertChangeset(db, parent, child, files):
+    def findFiles(db, files):
+        """Look up (or create) the ids of |files|, yielding each file once done
+
+           |files| can be any iterable, and is consumed in batches of
+           INSERT_BATCH_SIZE files, so that a stream of files produced by
+           diff.parse.streamDifferences() is never all held in memory."""
+
+        files = iter(files)
+
         while True:
-            # Inserting new files will often clash when creating multiple
-            # related changesets in parallel.  It's a simple operation, so if it
-            # fails with an integrity error, just try again until it doesn't
-            # fail.  (It will typically succeed the second time because then the
-            # new files already exist, and it doesn't need to insert anything.)
-            try:
-                dbutils.find_files(db, files)
-                db.commit()
+            batch = list(itertools.islice(files, INSERT_BATCH_SIZE))
+            if not batch:
                 break
-            except dbutils.IntegrityError:
-                db.rollback()
 
-        cursor = db.cursor()
-        cursor.execute("INSERT INTO changesets (type, parent, child) VALUES (%s, %s, %s) RETURNING id",
-                       (changeset_type, parent.getId(db) if parent else None, child.getId(db)))
-        changeset_id = cursor.fetchone()[0]
+            while True:
+                # Inserting new files will often clash when creating multiple
+                # related changesets in parallel.  It's a simple operation, so
+                # if it fails with an integrity error, just try again until it
+                # doesn't fail.  (It will typically succeed the second time
+                # because then the new files already exist, and it doesn't need
+                # to insert anything.)
+                try:
+                    dbutils.find_files(db, batch)
+                    db.commit()
+                    break
+                except dbutils.IntegrityError:
+                    db.rollback()
 
+            for file in batch:
+                yield file
+
+    def insertChangeset(db, parent, child, files):
+        # The files are parsed, analyzed and reduced to plain rows before the
+        # changeset itself is inserted, since findFiles() commits after each
+        # batch, which must not commit a partially inserted changeset.
         fileversions_values = []
         chunks_values = []
 
         file_ids = set()
 
-        for file in files:
+        for file in analyzeFiles(repository, findFiles(db, files)):
             if file.id in file_ids: raise Exception("duplicate:%d:%s" % (file.id, file.path))
             file_ids.add(file.id)
 
-            fileversions_values.append((changeset_id, file.id, file.old_sha1, file.new_sha1, file.old_mode, file.new_mode))
+            fileversions_values.append((file.id, file.old_sha1, file.new_sha1, file.old_mode, file.new_mode))
 
-            for index, chunk in enumerate(file.chunks):
-                chunk.analyze(file, index == len(file.chunks) - 1)
-                chunks_values.append((changeset_id, file.id, chunk.delete_offset, chunk.delete_count, chunk.insert_offset, chunk.insert_count, chunk.analysis, 1 if chunk.is_whitespace else 0))
+            for chunk in file.chunks:
+                chunks_values.append((file.id, chunk.delete_offset, chunk.delete_count, chunk.insert_offset, chunk.insert_count, chunk.analysis, 1 if chunk.is_whitespace else 0))
 
             file.clean()
+            file.chunks = None
+
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO changesets (type, parent, child) VALUES (%s, %s, %s) RETURNING id",
+                       (changeset_type, parent.getId(db) if parent else None, child.getId(db)))
+        changeset_id = cursor.fetchone()[0]
 
-        if fileversions_values:
+        def batches(values):
+            for offset in xrange(0, len(values), INSERT_BATCH_SIZE):
+                yield [(changeset_id,) + row
+                       for row in values[offset:offset + INSERT_BATCH_SIZE]]
+
+        for batch in batches(fileversions_values):
             cursor.executemany("""INSERT INTO fileversions (changeset, file, old_sha1, new_sha1, old_mode, new_mode)
                                        VALUES (%s, %s, %s, %s, %s, %s)""",
-                               fileversions_values)
-        if chunks_values:
+                               batch)
+
+        for batch in batches(chunks_values):
             cursor.executemany("""INSERT INTO chunks (changeset, file, deleteOffset, deleteCount, insertOffset, insertCount, analysis, whitespace)
                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-                               chunks_values)
+                               batch)
 
         return changeset_id
 
@@ -118,9 +290,16 @@ def createChangeset(db, request):
         if changeset_type == "merge":
             changes = diff.merge.parseMergeDifferences(db, repository, child)
         elif changeset_type == "direct":
-            changes = diff.parse.parseDifferences(repository, commit=child)
+            if child.parents:
+                assert len(child.parents) == 1
+                parent_sha1 = child.parents[0]
+            else:
+                parent_sha1 = None
+            changes = { parent_sha1: diff.parse.streamDifferences(
+                    repository, commit=child) }
         else:
-            changes = diff.parse.parseDifferences(repository, from_commit=parent, to_commit=child)
+            changes = { parent.sha1 if parent else None: diff.parse.streamDifferences(
+                    repository, from_commit=parent, to_commit=child) }
 
         for parent_sha1, files in changes.items():
             if parent_sha1 is None:
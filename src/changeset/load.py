@@ -18,13 +18,14 @@ import diff
 import dbutils
 import gitutils
 
-def loadChangeset(db, repository, changeset_id, filtered_file_ids=None, load_chunks=True):
+def loadChangeset(db, repository, changeset_id, filtered_file_ids=None, load_chunks=True, load_lines=False):
     return loadChangesets(db, repository,
                           changesets=[diff.Changeset.fromId(db, repository, changeset_id)],
                           filtered_file_ids=filtered_file_ids,
-                          load_chunks=load_chunks)[0]
+                          load_chunks=load_chunks,
+                          load_lines=load_lines)[0]
 
-def loadChangesetsForCommits(db, repository, commits, filtered_file_ids=None, load_chunks=True):
+def loadChangesetsForCommits(db, repository, commits, filtered_file_ids=None, load_chunks=True, load_lines=False):
     commit_ids = dict([(commit.getId(db), commit) for commit in commits])
 
     def getCommit(commit_id):
@@ -38,9 +39,9 @@ def loadChangesetsForCommits(db, repository, commits, filtered_file_ids=None, lo
     for changeset_id, parent_id, child_id in cursor:
         changesets.append(diff.Changeset(changeset_id, getCommit(parent_id), getCommit(child_id), "direct"))
 
-    return loadChangesets(db, repository, changesets, filtered_file_ids=filtered_file_ids, load_chunks=load_chunks)
+    return loadChangesets(db, repository, changesets, filtered_file_ids=filtered_file_ids, load_chunks=load_chunks, load_lines=load_lines)
 
-def loadChangesets(db, repository, changesets, filtered_file_ids=None, load_chunks=True):
+def loadChangesets(db, repository, changesets, filtered_file_ids=None, load_chunks=True, load_lines=False):
     cursor = db.cursor()
 
     changeset_ids = [changeset.id for changeset in changesets]
@@ -95,4 +96,8 @@ def loadChangesets(db, repository, changesets, filtered_file_ids=None, load_chun
     for changeset in changesets:
         changeset.files = diff.File.sorted(files[changeset.id].values())
 
+    if load_lines:
+        diff.File.loadPlainLines(
+            file for changeset in changesets for file in changeset.files)
+
     return changesets
@@ -14,8 +14,13 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import collections
+import os
+import subprocess
+import threading
+
+import configuration
 import gitutils
-import stat
 
 def joinPaths(dirname, basename):
     return "%s/%s" % (dirname, basename) if dirname else basename
@@ -26,83 +31,154 @@ class ChangedPath:
         self.oldEntry = oldEntry
         self.newEntry = newEntry
 
-def removedTree(repository, path, sha1):
-    changedPaths = []
-    for entry in gitutils.Tree.fromSHA1(repository, sha1):
-        changedPaths.extend(
-            removedEntry(repository, path, entry))
-    return changedPaths
-
-def removedEntry(repository, path, entry):
-    path = joinPaths(path, entry.name)
+class DiffCache(object):
+    """LRU cache of tree differences, keyed by (path, old tree, new tree)
+
+       The total number of cached changed paths is bounded, rather than the
+       number of cached differences."""
+
+    def __init__(self, max_paths):
+        self.max_paths = max_paths
+        self.paths = 0
+        self.__diffs = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            changedPaths = self.__diffs.pop(key, None)
+            if changedPaths is not None:
+                self.__diffs[key] = changedPaths
+            return changedPaths
+
+    def set(self, key, changedPaths):
+        if len(changedPaths) > self.max_paths:
+            return
+        with self.__lock:
+            if key in self.__diffs:
+                return
+            self.__diffs[key] = changedPaths
+            self.paths += len(changedPaths)
+            while self.paths > self.max_paths:
+                _, evicted = self.__diffs.popitem(last=False)
+                self.paths -= len(evicted)
+
+DIFF_CACHE = DiffCache(100000)
+
+def readRecords(source, separator="\0", block_size=65536):
+    """Yield separator-terminated records read incrementally from |source|"""
+    buffered = ""
+    while True:
+        data = source.read(block_size)
+        if not data:
+            break
+        records = (buffered + data).split(separator)
+        buffered = records.pop()
+        for record in records:
+            yield record
+    if buffered:
+        yield buffered
+
+def makeEntry(path, mode, sha1):
+    if mode == "000000":
+        return None
+    if mode == "040000":
+        entry_type = "tree"
+    elif mode == "160000":
+        entry_type = "commit"
+    else:
+        entry_type = "blob"
+    # Sizes are not reported by 'git diff-tree', and are rarely needed, so
+    # they are left as None rather than fetched for every entry.
+    return gitutils.Tree.Entry(os.path.basename(path), mode, entry_type, sha1, None)
+
+def streamDiffTree(repository, oldTreeSHA1, newTreeSHA1):
+    """Yield ChangedPath objects as 'git diff-tree' produces them
+
+       A path whose type changed (for instance, from a tree to a blob) is
+       reported by 'git diff-tree' as a deletion and an addition; these are
+       merged into a single ChangedPath."""
+
+    argv = [configuration.executables.GIT, "diff-tree", "-r", "-t", "-z",
+            "--raw", oldTreeSHA1, newTreeSHA1]
+    git = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE, cwd=repository.path)
+
+    # Deletions and additions that might be half of a type change, by path.
+    # Git sorts a tree entry "foo" as if it was named "foo/", so other paths,
+    # such as "foo.c", may be reported between the two halves.  A pending
+    # record can thus only be yielded once the stream has passed "foo/".
+    pending = collections.OrderedDict()
+
+    try:
+        records = readRecords(git.stdout)
+
+        for header in records:
+            path = next(records)
+
+            oldMode, newMode, oldSHA1, newSHA1, _ = header.lstrip(":").split(" ")
+            changedPath = ChangedPath(path,
+                                      makeEntry(path, oldMode, oldSHA1),
+                                      makeEntry(path, newMode, newSHA1))
+
+            if "040000" in (oldMode, newMode):
+                sortKey = path + "/"
+            else:
+                sortKey = path
+
+            while pending:
+                pendingPath = next(iter(pending))
+                if pendingPath + "/" >= sortKey:
+                    break
+                yield pending.pop(pendingPath)
+
+            if (changedPath.oldEntry is None) == (changedPath.newEntry is None):
+                yield changedPath
+                continue
+
+            other = pending.pop(path, None)
+            if other is None:
+                pending[path] = changedPath
+            elif (other.oldEntry is None) != (changedPath.oldEntry is None):
+                other.oldEntry = other.oldEntry or changedPath.oldEntry
+                other.newEntry = other.newEntry or changedPath.newEntry
+                yield other
+            else:
+                yield other
+                pending[path] = changedPath
+
+        for changedPath in pending.values():
+            yield changedPath
+    finally:
+        git.stdout.close()
+        stderr = git.stderr.read()
+        git.wait()
+
+    if git.returncode != 0:
+        raise gitutils.GitCommandError(" ".join(argv), stderr.strip(),
+                                       repository.path)
+
+def diffTrees(repository, oldTreeSHA1, newTreeSHA1):
+    """Yield ChangedPath objects for all differences between two trees
+
+       Changed sub-trees are included, as are (recursively) all entries in added
+       or removed sub-trees.  Differences are memoized per process, so
+       repeatedly comparing the same trees is cheap."""
+
+    key = (repository.path, oldTreeSHA1, newTreeSHA1)
+    changedPaths = DIFF_CACHE.get(key)
+
+    if changedPaths is not None:
+        for changedPath in changedPaths:
+            yield changedPath
+        return
 
-    changedPaths = [ChangedPath(path, entry, None)]
-    if stat.S_ISDIR(entry.mode):
-        changedPaths.extend(
-            removedTree(repository, path, entry.sha1))
-    return changedPaths
-
-def addedTree(repository, path, sha1):
     changedPaths = []
-    for entry in gitutils.Tree.fromSHA1(repository, sha1):
-        changedPaths.extend(
-            addedEntry(repository, path, entry))
-    return changedPaths
-
-def addedEntry(repository, path, entry):
-    path = joinPaths(path, entry.name)
 
-    changedPaths = [ChangedPath(path, None, entry)]
-    if stat.S_ISDIR(entry.mode):
-        changedPaths.extend(
-            addedTree(repository, path, entry.sha1))
-    return changedPaths
-
-def diffTrees(repository, path, oldTree, newTree):
-    oldNames = set(oldTree.keys())
-    newNames = set(newTree.keys())
-
-    commonNames = oldNames & newNames
-    removedNames = oldNames - commonNames
-    addedNames = newNames - commonNames
-
-    changedPaths = []
+    for changedPath in streamDiffTree(repository, oldTreeSHA1, newTreeSHA1):
+        changedPaths.append(changedPath)
+        yield changedPath
 
-    for name in removedNames:
-        changedPaths.extend(
-            removedEntry(repository, joinPaths(path, name), oldTree[name]))
-    for name in addedNames:
-        changedPaths.extend(
-            addedEntry(repository, joinPaths(path, name), newTree[name]))
-
-    for name in commonNames:
-        oldEntry = oldTree[name]
-        newEntry = newTree[name]
-
-        if oldEntry.sha1 != newEntry.sha1 or oldEntry.mode != newEntry.mode:
-            changedPath = joinPaths(path, name)
-            changedPaths.append(ChangedPath(changedPath, oldEntry, newEntry))
-
-            commonMode = oldEntry.mode & newEntry.mode
-            removedMode = oldEntry.mode - commonMode
-            addedMode = newEntry.mode - commonMode
-
-            if stat.S_ISDIR(removedMode):
-                changedPaths.extend(
-                    removedTree(repository, changedPath, oldEntry.sha1))
-            elif stat.S_ISDIR(addedMode):
-                changedPaths.extend(
-                    addedTree(repository, changedPath, newEntry.sha1))
-            elif stat.S_ISDIR(commonMode) and oldEntry.sha1 != newEntry.sha1:
-                changedPaths.extend(
-                    diffTrees(repository, changedPath,
-                              gitutils.Tree.fromSHA1(repository, oldEntry.sha1),
-                              gitutils.Tree.fromSHA1(repository, newEntry.sha1)))
-
-    return changedPaths
+    DIFF_CACHE.set(key, changedPaths)
 
 def diffCommits(repository, commitA, commitB):
-    return diffTrees(repository,
-                     None,
-                     gitutils.Tree.fromSHA1(repository, commitA.tree),
-                     gitutils.Tree.fromSHA1(repository, commitB.tree))
+    return diffTrees(repository, commitA.tree, commitB.tree)
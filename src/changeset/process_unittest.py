@@ -0,0 +1,85 @@
+def typechanges():
+    # Check that streamDiffTree() merges the deletion and addition that 'git
+    # diff-tree' reports for a path whose type changed, also when other paths
+    # are reported between them.
+
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    import gitutils
+    import changeset.process
+
+    path = tempfile.mkdtemp()
+
+    try:
+        def git(*args):
+            return subprocess.check_output(("git",) + args, cwd=path)
+
+        def write(filename, data):
+            filename = os.path.join(path, filename)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            with open(filename, "w") as file:
+                file.write(data)
+
+        def snapshot():
+            git("add", "--all", ".")
+            return git("write-tree").strip()
+
+        git("init", "--quiet")
+
+        # "foo" and "bar" are files, "foo.c" and "bar-x" sort between "foo"
+        # and "foo/" (and "bar" and "bar/".)
+        write("foo", "file\n")
+        write("foo.c", "one\n")
+        write("bar", "file\n")
+        write("bar-x", "one\n")
+        write("zzz", "one\n")
+        old_tree = snapshot()
+
+        # Turn "foo" and "bar" into directories, and modify the siblings.
+        os.unlink(os.path.join(path, "foo"))
+        os.unlink(os.path.join(path, "bar"))
+        write("foo/file", "contents\n")
+        write("foo.c", "two\n")
+        write("bar/file", "contents\n")
+        write("bar-x", "two\n")
+        write("zzz", "two\n")
+        new_tree = snapshot()
+
+        repository = gitutils.Repository(path=path)
+
+        def diff(old_sha1, new_sha1):
+            changed = {}
+            for changed_path in changeset.process.streamDiffTree(
+                    repository, old_sha1, new_sha1):
+                assert changed_path.path not in changed, changed_path.path
+                changed[changed_path.path] = (
+                    changed_path.oldEntry and changed_path.oldEntry.type,
+                    changed_path.newEntry and changed_path.newEntry.type)
+            return changed
+
+        expected = { "foo": ("blob", "tree"),
+                     "foo/file": (None, "blob"),
+                     "foo.c": ("blob", "blob"),
+                     "bar": ("blob", "tree"),
+                     "bar/file": (None, "blob"),
+                     "bar-x": ("blob", "blob"),
+                     "zzz": ("blob", "blob") }
+
+        actual = diff(old_tree, new_tree)
+        assert actual == expected, "%r != %r" % (actual, expected)
+
+        # And the other way around.
+        expected = dict((changed_path, (new_type, old_type))
+                        for changed_path, (old_type, new_type)
+                        in expected.items())
+
+        actual = diff(new_tree, old_tree)
+        assert actual == expected, "%r != %r" % (actual, expected)
+    finally:
+        shutil.rmtree(path)
+
+    print "typechanges: ok"
@@ -49,24 +49,132 @@ def createFullMergeChangeset(db, user, repository, commit, **kwargs):
 
     return changesets
 
-def createChangesets(db, repository, commits):
+def createChangesets(db, repository, commits, do_highlight=False, load_chunks=True):
+    """Create (if necessary) and load the changesets of |commits|
+
+       Existing changesets are looked up using a single query, the missing
+       ones are created using a single request to the changeset service, and
+       all of them are then loaded using a single call to loadChangesets().
+
+       Returns a list of changesets: for each commit in order, one per parent
+       (or a single one for root commits.)"""
+
+    commits = list(commits)
+
+    if not commits:
+        return []
+
     cursor = db.cursor()
-    requests = []
 
+    sha1s = set()
     for commit in commits:
-        if len(commit.parents) > 1: changeset_type = 'merge'
-        else: changeset_type = 'direct'
+        sha1s.add(commit.sha1)
+        sha1s.update(commit.parents)
 
-        cursor.execute("SELECT 1 FROM changesets WHERE child=%s AND type=%s", (commit.getId(db), changeset_type))
+    cursor.execute("SELECT sha1, id FROM commits WHERE sha1=ANY (%s)",
+                   (list(sha1s),))
+    commit_ids = dict(cursor)
 
-        if not cursor.fetchone():
+    for commit in commits:
+        if commit.id is None:
+            commit.id = commit_ids[commit.sha1]
+
+    def changesetType(commit):
+        return 'merge' if len(commit.parents) > 1 else 'direct'
+
+    def findExisting():
+        cursor.execute("""SELECT id, parent, child, type
+                            FROM changesets
+                           WHERE child=ANY (%s)
+                             AND type IN ('direct', 'merge')""",
+                       (list(set(commit_ids[commit.sha1] for commit in commits)),))
+        return dict(((parent_id, child_id, changeset_type), changeset_id)
+                    for changeset_id, parent_id, child_id, changeset_type in cursor)
+
+    def findChangesetIds(existing, commit):
+        child_id = commit_ids[commit.sha1]
+        changeset_type = changesetType(commit)
+        changeset_ids = []
+        for parent_sha1 in commit.parents or [None]:
+            parent_id = commit_ids[parent_sha1] if parent_sha1 else None
+            changeset_id = existing.get((parent_id, child_id, changeset_type))
+            if changeset_id is None:
+                return None
+            changeset_ids.append(changeset_id)
+        return changeset_ids
+
+    existing = findExisting()
+    requests = []
+    requested = set()
+
+    for commit in commits:
+        if commit.sha1 not in requested \
+                and findChangesetIds(existing, commit) is None:
             requests.append({ "repository_name": repository.name,
-                              "changeset_type": changeset_type,
+                              "changeset_type": changesetType(commit),
                               "child_sha1": commit.sha1 })
+            requested.add(commit.sha1)
 
     if requests:
+        db.commit()
+
         client.requestChangesets(requests)
 
+        db.commit()
+
+        existing = findExisting()
+
+    # Fetch all parent commits not already at hand in one go.
+    commits_by_sha1 = dict((commit.sha1, commit) for commit in commits)
+    cached_commits = db.storage["Commit"]
+    missing_sha1s = []
+
+    for commit in commits:
+        for parent_sha1 in commit.parents:
+            if parent_sha1 in commits_by_sha1:
+                continue
+            parent = cached_commits.get(parent_sha1)
+            if parent:
+                commits_by_sha1[parent_sha1] = parent
+            elif parent_sha1 not in missing_sha1s:
+                missing_sha1s.append(parent_sha1)
+
+    for gitobject in repository.fetchMany(missing_sha1s):
+        commits_by_sha1[gitobject.sha1] = gitutils.Commit.fromGitObject(
+            db, repository, gitobject, commit_ids.get(gitobject.sha1))
+
+    changesets = []
+
+    for commit in commits:
+        changeset_ids = findChangesetIds(existing, commit)
+        assert changeset_ids is not None, \
+            "changeset service failed to create changesets for %s" % commit.sha1
+        changeset_type = changesetType(commit)
+        for parent_sha1, changeset_id in zip(commit.parents or [None], changeset_ids):
+            changesets.append(diff.Changeset(
+                changeset_id, commits_by_sha1.get(parent_sha1), commit,
+                changeset_type))
+
+    load.loadChangesets(db, repository, changesets, load_chunks=load_chunks)
+
+    if do_highlight:
+        requestHighlights(repository, changesets)
+
+    return changesets
+
+def requestHighlights(repository, changesets):
+    highlights = {}
+
+    for changeset in changesets:
+        for file in changeset.files:
+            if file.canHighlight():
+                if file.old_sha1 and file.old_sha1 != '0' * 40:
+                    highlights[file.old_sha1] = (file.path, file.getLanguage())
+                if file.new_sha1 and file.new_sha1 != '0' * 40:
+                    highlights[file.new_sha1] = (file.path, file.getLanguage())
+
+    syntaxhighlight.request.requestHighlights(repository, highlights, "legacy")
+
 def createChangeset(db, user, repository, commit=None, from_commit=None, to_commit=None, rescan=False, reanalyze=False, conflicts=False, filtered_file_ids=None, review=None, do_highlight=True, load_chunks=True):
     cursor = db.cursor()
 
@@ -216,17 +324,7 @@ def createChangeset(db, user, repository, commit=None, from_commit=None, to_comm
             changesets.append(changeset)
 
     if do_highlight:
-        highlights = {}
-
-        for changeset in changesets:
-            for file in changeset.files:
-                if file.canHighlight():
-                    if file.old_sha1 and file.old_sha1 != '0' * 40:
-                        highlights[file.old_sha1] = (file.path, file.getLanguage())
-                    if file.new_sha1 and file.new_sha1 != '0' * 40:
-                        highlights[file.new_sha1] = (file.path, file.getLanguage())
-
-        syntaxhighlight.request.requestHighlights(repository, highlights, "legacy")
+        requestHighlights(repository, changesets)
 
     return changesets
 
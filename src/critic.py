@@ -26,7 +26,7 @@ import calendar
 
 from htmlutils import htmlify, Document
 from profiling import formatDBProfiling
-from textutils import json_encode, reflow
+from textutils import reflow
 
 import request
 import dbutils
@@ -732,26 +732,15 @@ def process_request(environ, start_response):
                     result = jsonapi.handleRequest(critic, req)
                 except jsonapi.Error as error:
                     req.setStatus(error.http_status)
-                    result = { "error": { "title": error.title,
-                                          "message": error.message }}
+                    result = jsonapi.render(
+                        req, { "error": { "title": error.title,
+                                          "message": error.message }})
                 else:
                     req.setStatus(200)
 
-                accept_header = req.getRequestHeader("Accept")
-                if accept_header == "application/vnd.api+json":
-                    default_indent = None
-                else:
-                    default_indent = 2
-                indent = req.getParameter("indent", default_indent, filter=int)
-                if indent == 0:
-                    # json.encode(..., indent=0) still gives line-breaks, just
-                    # no indentation.  This is not so useful, so set indent to
-                    # None instead, which disables formatting entirely.
-                    indent = None
-
                 req.setContentType("application/vnd.api+json")
                 req.start()
-                return [json_encode(result, indent=indent)]
+                return [result]
 
             operationfn = OPERATIONS.get(req.path)
             if operationfn:
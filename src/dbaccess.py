@@ -14,22 +14,34 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import os
+import time
+import atexit
+import threading
+
 try:
     import configuration
 except ImportError:
     IntegrityError = ProgrammingError = OperationalError = Exception
     TransactionRollbackError = Exception
 
+    DRIVER = None
+    POOL_SIZE = 0
+    POOL_CHECK_INTERVAL = 0
+
     def connect():
         raise Exception("not supported")
 else:
-    if configuration.database.DRIVER == "postgresql":
+    DRIVER = configuration.database.DRIVER
+    POOL_SIZE = configuration.database.POOL_SIZE
+    POOL_CHECK_INTERVAL = configuration.database.POOL_CHECK_INTERVAL
+
+    if DRIVER == "postgresql":
         import psycopg2 as driver
 
         TransactionRollbackError = driver.extensions.TransactionRollbackError
     else:
         import sys
-        import os
 
         sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
@@ -45,3 +57,126 @@ else:
 
     def connect():
         return driver.connect(**configuration.database.PARAMETERS)
+
+class PooledConnection(object):
+    def __init__(self, connection):
+        self.connection = connection
+        # Names of server-side prepared statements created on this connection.
+        self.prepared = set()
+        self.last_used = time.time()
+        self.pid = os.getpid()
+
+class ConnectionPool(object):
+    """Per-process pool of idle database connections
+
+       Connections are reset (rolled back, with session settings reset and
+       temporary tables dropped) when returned to the pool, and checked with
+       a trivial query before being reused if they have been idle for a
+       while.  At most POOL_SIZE idle connections are kept."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__idle = []
+        self.__pid = os.getpid()
+        # Connections inherited from our parent process.  They must not be
+        # used, and not closed either, since closing them would disconnect the
+        # parent process' connections too.  So keep them referenced forever.
+        self.__inherited = []
+
+    def __checkFork(self):
+        if self.__pid != os.getpid():
+            self.__inherited.extend(self.__idle)
+            self.__idle = []
+            self.__pid = os.getpid()
+
+    def __check(self, pooled):
+        try:
+            if getattr(pooled.connection, "closed", False):
+                return False
+            if time.time() - pooled.last_used > POOL_CHECK_INTERVAL:
+                cursor = pooled.connection.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                pooled.connection.rollback()
+            return True
+        except Exception:
+            self.__close(pooled)
+            return False
+
+    def __reset(self, pooled):
+        try:
+            pooled.connection.rollback()
+            cursor = pooled.connection.cursor()
+            if DRIVER == "postgresql":
+                # Reset any session settings, such as the role, and drop
+                # temporary tables.  Note that this, unlike DISCARD ALL, keeps
+                # prepared statements.
+                cursor.execute("RESET ALL")
+                cursor.execute("DISCARD TEMP")
+            else:
+                cursor.execute("""SELECT name
+                                    FROM sqlite_temp_master
+                                   WHERE type='table'""")
+                for (name,) in cursor.fetchall():
+                    cursor.execute('DROP TABLE temp."%s"' % name)
+            pooled.connection.commit()
+            return True
+        except Exception:
+            self.__close(pooled)
+            return False
+
+    def __close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Return a tuple (pooled, reused)
+
+           |pooled| is a PooledConnection object, and |reused| is True if it
+           was taken from the pool."""
+
+        while True:
+            with self.__lock:
+                self.__checkFork()
+                if not self.__idle:
+                    break
+                pooled = self.__idle.pop()
+            if self.__check(pooled):
+                return pooled, True
+
+        return PooledConnection(connect()), False
+
+    def release(self, pooled):
+        """Return a connection to the pool, or close it if the pool is full"""
+
+        if pooled.pid != os.getpid():
+            with self.__lock:
+                self.__inherited.append(pooled)
+            return
+
+        if not self.__reset(pooled):
+            return
+
+        with self.__lock:
+            if len(self.__idle) < POOL_SIZE:
+                pooled.last_used = time.time()
+                self.__idle.append(pooled)
+                return
+
+        self.__close(pooled)
+
+    def clear(self):
+        """Close all idle connections"""
+
+        with self.__lock:
+            self.__checkFork()
+            idle, self.__idle = self.__idle, []
+
+        for pooled in idle:
+            self.__close(pooled)
+
+POOL = ConnectionPool()
+
+atexit.register(POOL.clear)
@@ -19,7 +19,8 @@ from dbaccess import (IntegrityError, OperationalError, ProgrammingError,
 
 from dbutils.session import Session
 from dbutils.database import (InvalidCursorError, FailedToLock, NOWAIT,
-                              Database, boolean)
+                              Database, PreparedQuery, boolean)
+from dbutils.sharedcache import SharedCache
 from dbutils.user import InvalidUserId, NoSuchUser, User
 from dbutils.review import NoSuchReview, ReviewState, Review
 from dbutils.branch import Branch
@@ -0,0 +1,353 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import heapq
+import threading
+
+# Number of rounds of (breadth-first) edge lookups made when loading the
+# ancestry of commits, before the whole remaining history is loaded using a
+# single recursive query instead.  Newly added commits are typically children
+# of already loaded commits, and then only need a round or two.
+INCREMENTAL_ROUNDS = 8
+
+# Maximum number of cached merge-bases.
+MAX_MERGEBASES = 10000
+
+# Flags used when walking the graph.
+_ONE = 1
+_TWO = 2
+_STALE = 4
+
+class AncestryGraph(object):
+    """In-memory graph of commits, loaded from the commits/edges tables
+
+       Commits are added on demand, along with all their ancestors, and are
+       then kept for the lifetime of the process.  Since a commit's parents
+       never change, nothing ever needs to be invalidated.  Each commit is
+       assigned a generation number (one more than the highest generation
+       number of its parents) which is used to cut walks short.
+
+       Commits not (yet) in the database are unknown, and queries involving
+       them return None; the caller is expected to ask Git instead."""
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__ids = {}
+        self.__sha1s = {}
+        self.__parents = {}
+        self.__generations = {}
+        self.__mergebases = {}
+
+    def __lookup(self, db, sha1s):
+        missing = [sha1 for sha1 in set(sha1s) if sha1 not in self.__ids]
+
+        if missing:
+            cursor = db.cursor()
+            cursor.execute("SELECT id, sha1 FROM commits WHERE sha1=ANY (%s)",
+                           (missing,))
+            for commit_id, sha1 in cursor:
+                self.__ids[sha1] = commit_id
+                self.__sha1s[commit_id] = sha1
+
+        commit_ids = [self.__ids.get(sha1) for sha1 in sha1s]
+
+        if None in commit_ids:
+            return None
+
+        self.__load(db, commit_ids)
+        return commit_ids
+
+    def __load(self, db, commit_ids):
+        generations = self.__generations
+        frontier = set(commit_id for commit_id in commit_ids
+                       if commit_id not in generations)
+
+        if not frontier:
+            return
+
+        cursor = db.cursor()
+        parents = {}
+        rounds = 0
+
+        while frontier:
+            if rounds < INCREMENTAL_ROUNDS:
+                cursor.execute("""SELECT commits.id, commits.sha1, edges.parent
+                                    FROM commits
+                         LEFT OUTER JOIN edges ON (edges.child=commits.id)
+                                   WHERE commits.id=ANY (%s)""",
+                               (list(frontier),))
+            else:
+                cursor.execute("""WITH RECURSIVE ancestors (id) AS (
+                                      SELECT id
+                                        FROM commits
+                                       WHERE id=ANY (%s)
+                                    UNION
+                                      SELECT edges.parent
+                                        FROM edges
+                                        JOIN ancestors ON (edges.child=ancestors.id)
+                                  )
+                                  SELECT commits.id, commits.sha1, edges.parent
+                                    FROM ancestors
+                                    JOIN commits ON (commits.id=ancestors.id)
+                         LEFT OUTER JOIN edges ON (edges.child=ancestors.id)""",
+                               (list(frontier),))
+
+            for commit_id, sha1, parent_id in cursor:
+                if commit_id in generations:
+                    continue
+                self.__ids[sha1] = commit_id
+                self.__sha1s[commit_id] = sha1
+                commit_parents = parents.setdefault(commit_id, [])
+                if parent_id is not None:
+                    commit_parents.append(parent_id)
+
+            # Commits that have gone missing from the database are treated as
+            # having no parents, rather than looked up forever.
+            for commit_id in frontier:
+                parents.setdefault(commit_id, [])
+
+            frontier = set(parent_id
+                           for commit_parents in parents.itervalues()
+                           for parent_id in commit_parents
+                           if parent_id not in generations
+                           and parent_id not in parents)
+            rounds += 1
+
+        self.__add(parents)
+
+    def __add(self, parents):
+        """Assign generation numbers to commits whose parents are all known"""
+
+        generations = self.__generations
+
+        for commit_id in parents:
+            stack = [commit_id]
+
+            while stack:
+                current_id = stack[-1]
+
+                if current_id in generations:
+                    stack.pop()
+                    continue
+
+                missing = [parent_id for parent_id in parents[current_id]
+                           if parent_id not in generations]
+
+                if missing:
+                    stack.extend(missing)
+                    continue
+
+                self.__parents[current_id] = tuple(parents[current_id])
+                generations[current_id] = 1 + max(
+                    [generations[parent_id]
+                     for parent_id in parents[current_id]] or [0])
+                stack.pop()
+
+    def __isAncestor(self, ancestor_id, descendant_id):
+        if ancestor_id == descendant_id:
+            return True
+
+        generations = self.__generations
+        parents = self.__parents
+        limit = generations[ancestor_id]
+
+        if generations[descendant_id] <= limit:
+            return False
+
+        seen = set([descendant_id])
+        stack = [descendant_id]
+
+        while stack:
+            for parent_id in parents[stack.pop()]:
+                if parent_id == ancestor_id:
+                    return True
+                if parent_id not in seen and generations[parent_id] > limit:
+                    seen.add(parent_id)
+                    stack.append(parent_id)
+
+        return False
+
+    def __paint(self, one_ids, two_ids, process):
+        """Walk from |one_ids| and |two_ids| towards the roots
+
+           Commits are visited in order of decreasing generation number, which
+           guarantees that all descendants of a commit that the walk reaches
+           have been visited before it.  process(commit_id, flags) is called
+           for each visited commit and returns the flags to propagate to its
+           parents.  The walk ends when only _STALE commits remain."""
+
+        generations = self.__generations
+        parents = self.__parents
+        flags = {}
+
+        for commit_id in one_ids:
+            flags[commit_id] = flags.get(commit_id, 0) | _ONE
+        for commit_id in two_ids:
+            flags[commit_id] = flags.get(commit_id, 0) | _TWO
+
+        queue = [(-generations[commit_id], commit_id) for commit_id in flags]
+        heapq.heapify(queue)
+        active = len(queue)
+
+        while active:
+            _, commit_id = heapq.heappop(queue)
+            commit_flags = flags[commit_id]
+
+            if not commit_flags & _STALE:
+                active -= 1
+
+            propagated = process(commit_id, commit_flags)
+
+            for parent_id in parents[commit_id]:
+                parent_flags = flags.get(parent_id)
+                if parent_flags is None:
+                    flags[parent_id] = propagated
+                    heapq.heappush(queue, (-generations[parent_id], parent_id))
+                    if not propagated & _STALE:
+                        active += 1
+                elif parent_flags | propagated != parent_flags:
+                    flags[parent_id] = parent_flags | propagated
+                    if propagated & _STALE and not parent_flags & _STALE:
+                        active -= 1
+
+    def __mergeBases(self, one_id, two_ids):
+        candidates = []
+
+        def process(commit_id, flags):
+            if flags & (_ONE | _TWO) == (_ONE | _TWO) and not flags & _STALE:
+                candidates.append(commit_id)
+                flags |= _STALE
+            return flags
+
+        self.__paint([one_id], two_ids, process)
+
+        # Drop candidates that are ancestors of other candidates.
+        return [candidate_id for candidate_id in candidates
+                if not any(other_id != candidate_id
+                           and self.__isAncestor(candidate_id, other_id)
+                           for other_id in candidates)]
+
+    def isAncestor(self, db, ancestor_sha1, descendant_sha1):
+        """Return true if |ancestor_sha1| is an ancestor of |descendant_sha1|
+
+           A commit is considered to be an ancestor of itself."""
+
+        with self.__lock:
+            commit_ids = self.__lookup(db, [ancestor_sha1, descendant_sha1])
+            if commit_ids is None:
+                return None
+            return self.__isAncestor(*commit_ids)
+
+    def mergeBase(self, db, sha1s):
+        """Return the best common ancestor of the first commit and any other
+
+           Works like 'git merge-base', and returns None if any commit is
+           unknown, or if there is no common ancestor.  If there are multiple
+           equally good common ancestors, the one with the highest generation
+           number is returned."""
+
+        with self.__lock:
+            commit_ids = self.__lookup(db, sha1s)
+            if commit_ids is None:
+                return None
+
+            key = (commit_ids[0], frozenset(commit_ids[1:]))
+
+            try:
+                mergebase_id = self.__mergebases[key]
+            except KeyError:
+                mergebases = self.__mergeBases(commit_ids[0], commit_ids[1:])
+                if mergebases:
+                    mergebase_id = max(
+                        mergebases,
+                        key=lambda commit_id: (self.__generations[commit_id],
+                                               self.__sha1s[commit_id]))
+                else:
+                    mergebase_id = None
+                if len(self.__mergebases) >= MAX_MERGEBASES:
+                    self.__mergebases.clear()
+                self.__mergebases[key] = mergebase_id
+
+            if mergebase_id is None:
+                return None
+            return self.__sha1s[mergebase_id]
+
+    def commitRange(self, db, included_sha1s, excluded_sha1s):
+        """Return the set of commits 'git rev-list' would list
+
+           That is, the SHA-1s of all commits that are ancestors of (or equal
+           to) any of |included_sha1s| but not of any of |excluded_sha1s|."""
+
+        with self.__lock:
+            included_ids = self.__lookup(db, included_sha1s)
+            excluded_ids = self.__lookup(db, excluded_sha1s)
+            if included_ids is None or excluded_ids is None:
+                return None
+
+            result = set()
+
+            def process(commit_id, flags):
+                # _TWO marks excluded commits; they are propagated as stale,
+                # so that the walk ends once only excluded commits remain.
+                if flags & _TWO:
+                    return _TWO | _STALE
+                result.add(self.__sha1s[commit_id])
+                return flags
+
+            self.__paint(included_ids, excluded_ids, process)
+
+            return result
+
+    def addCommits(self, commits):
+        """Add commits to the graph, without querying the database
+
+           |commits| should be an iterable of (id, sha1, parent ids) tuples.
+           Commits whose parents are not already in the graph (or among
+           |commits|) are ignored; they are loaded on demand instead."""
+
+        with self.__lock:
+            parents = {}
+
+            for commit_id, sha1, parent_ids in commits:
+                self.__ids[sha1] = commit_id
+                self.__sha1s[commit_id] = sha1
+                parents[commit_id] = list(parent_ids)
+
+            while True:
+                unknown = set(commit_id for commit_id, parent_ids in parents.items()
+                              if any(parent_id not in self.__generations
+                                     and parent_id not in parents
+                                     for parent_id in parent_ids))
+                if not unknown:
+                    break
+                for commit_id in unknown:
+                    del parents[commit_id]
+
+            self.__add(parents)
+
+GRAPH = AncestryGraph()
+
+def isAncestor(db, ancestor_sha1, descendant_sha1):
+    return GRAPH.isAncestor(db, ancestor_sha1, descendant_sha1)
+
+def mergeBase(db, sha1s):
+    return GRAPH.mergeBase(db, sha1s)
+
+def commitRange(db, included_sha1s, excluded_sha1s):
+    return GRAPH.commitRange(db, included_sha1s, excluded_sha1s)
+
+def addCommits(commits):
+    GRAPH.addCommits(commits)
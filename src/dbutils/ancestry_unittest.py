@@ -0,0 +1,53 @@
+def createGraph(generator, count):
+    from dbutils.ancestry import AncestryGraph
+
+    parents = {}
+    for index in xrange(count):
+        candidates = range(max(0, index - 10), index)
+        parents[index] = generator.sample(
+            candidates, min(len(candidates), generator.choice([0, 1, 1, 1, 2, 3])))
+
+    graph = AncestryGraph()
+    # Add in reverse order, to exercise the ordering done by addCommits().
+    graph.addCommits((index + 1, "%040x" % index,
+                      [parent + 1 for parent in parents[index]])
+                     for index in reversed(xrange(count)))
+
+    ancestors = {}
+    for index in xrange(count):
+        ancestors[index] = set([index])
+        for parent in parents[index]:
+            ancestors[index] |= ancestors[parent]
+
+    return graph, ancestors
+
+def graph():
+    import random
+
+    generator = random.Random(0)
+    graph, ancestors = createGraph(generator, 200)
+
+    def sha1(index):
+        return "%040x" % index
+
+    for _ in xrange(2000):
+        one, two = generator.randrange(200), generator.randrange(200)
+
+        assert graph.isAncestor(None, sha1(one), sha1(two)) \
+            == (one in ancestors[two]), (one, two)
+
+        common = ancestors[one] & ancestors[two]
+        best = set(candidate for candidate in common
+                   if not any(candidate in ancestors[other]
+                              for other in common if other != candidate))
+        mergebase = graph.mergeBase(None, [sha1(one), sha1(two)])
+        if best:
+            assert mergebase in set(map(sha1, best)), (one, two, mergebase)
+        else:
+            assert mergebase is None, (one, two, mergebase)
+
+        expected = set(map(sha1, ancestors[two] - ancestors[one]))
+        assert graph.commitRange(None, [sha1(two)], [sha1(one)]) == expected, \
+            (one, two)
+
+    print "graph: ok"
@@ -21,6 +21,7 @@ import time
 import base
 import dbaccess
 
+from dbutils import sharedcache
 from dbutils.session import Session
 
 class InvalidCursorError(base.ImplementationError):
@@ -38,6 +39,31 @@ class NoWait:
     pass
 NOWAIT = NoWait()
 
+class PreparedQuery(object):
+    """Fixed query executed as a server-side prepared statement
+
+       The statement is prepared the first time it is executed on each database
+       connection, and since connections are pooled, typically reused by many
+       sessions.  With database drivers that don't support it, the query is
+       executed normally.
+
+       Execute it by passing this object as the query to a cursor's execute()
+       method."""
+
+    def __init__(self, name, query):
+        self.name = name
+        self.query = query
+
+        parts = query.split("%s")
+        self.prepare = "PREPARE %s AS %s" % (
+            name, "".join(part + ("$%d" % index if index < len(parts) else "")
+                          for index, part in enumerate(parts, start=1)))
+        if len(parts) > 1:
+            self.execute = "EXECUTE %s (%s)" % (
+                name, ", ".join(["%s"] * (len(parts) - 1)))
+        else:
+            self.execute = "EXECUTE %s" % name
+
 class _CursorIterator(object):
     def __init__(self, base):
         self.__base = base
@@ -96,7 +122,14 @@ class _CursorBase(object):
             return self.__rows
 
     def execute(self, query, params=(), for_update=False):
-        self.validate(query, for_update)
+        if isinstance(query, PreparedQuery):
+            assert not for_update
+            self.validate(query.query, for_update)
+            profiling_query = query.query
+            query = self.db.prepared(self.__cursor, query)
+        else:
+            self.validate(query, for_update)
+            profiling_query = query
         if for_update:
             assert query.upper().startswith("SELECT ")
             query += " FOR UPDATE"
@@ -115,7 +148,7 @@ class _CursorBase(object):
                 except dbaccess.ProgrammingError:
                     self.__rows = None
                 after = time.time()
-                self.db.recordProfiling(query, after - before, rows=len(self.__rows) if self.__rows else 0)
+                self.db.recordProfiling(profiling_query, after - before, rows=len(self.__rows) if self.__rows else 0)
         except dbaccess.OperationalError:
             if for_update is NOWAIT:
                 raise FailedToLock()
@@ -141,11 +174,13 @@ class _CursorBase(object):
 class _UnsafeCursor(_CursorBase):
     def validate(self, query, for_update):
         try:
-            command, _ = Database.analyzeQuery(query)
+            command, table = Database.analyzeQuery(query)
         except ValueError:
-            command = None
+            command = table = None
         if command != "SELECT" or for_update:
             self.db.unsafe_queries = True
+        if table is not None:
+            self.db.tableModified(table)
 
 class _ReadOnlyCursor(_CursorBase):
     def validate(self, query, for_update):
@@ -184,6 +219,7 @@ class _UpdatingCursor(_ReadOnlyCursor):
             raise InvalidCursorError(
                 "invalid table for updating cursor: " + table)
         else:
+            self.db.tableModified(table)
             return True
 
     def disable(self):
@@ -201,7 +237,17 @@ class Database(Session):
     def __init__(self, critic=None, allow_unsafe_cursors=True):
         super(Database, self).__init__(critic)
 
-        self.__connection = dbaccess.connect()
+        before = time.time()
+        self.__pooled, reused = dbaccess.POOL.acquire()
+        after = time.time()
+        self.recordProfiling("<connect (pooled)>" if reused else "<connect>",
+                             after - before, 0)
+
+        self.__connection = self.__pooled.connection
+
+        sharedcache.synchronize(self.__connection, reused)
+
+        self.__modified_tables = set()
         self.__transaction_callbacks = []
         self.__allow_unsafe_cursors = allow_unsafe_cursors
         self.__updating_cursor = None
@@ -253,16 +299,24 @@ class Database(Session):
     def commit(self):
         if self.__updating_cursor:
             raise InvalidCursorError("manual commit when using updating cursor")
+        modified_tables = self.__modified_tables & sharedcache.WATCHED_TABLES
+        self.__modified_tables = set()
         before = time.time()
+        if modified_tables:
+            sharedcache.announce(self.__connection, modified_tables)
         self.__connection.commit()
         after = time.time()
         self.recordProfiling("<commit>", after - before, 0)
+        if modified_tables:
+            sharedcache.invalidate(modified_tables)
+        sharedcache.synchronize(self.__connection)
         self.__call_transaction_callbacks("commit")
         self.unsafe_queries = False
 
     def rollback(self):
         if self.__updating_cursor:
             self.__updating_cursor.disable()
+        self.__modified_tables = set()
         before = time.time()
         self.__connection.rollback()
         after = time.time()
@@ -273,9 +327,11 @@ class Database(Session):
     def close(self):
         super(Database, self).close()
         if self.__connection:
-            self.__connection.rollback()
-            self.__connection.close()
+            # Rolls back the current transaction, and either keeps the
+            # connection for reuse or closes it.
+            dbaccess.POOL.release(self.__pooled)
             self.__connection = None
+            self.__pooled = None
 
     def closed(self):
         return self.__connection is None
@@ -287,6 +343,28 @@ class Database(Session):
         self.close()
         return False
 
+    def prepared(self, cursor, query):
+        """Prepare |query| (a PreparedQuery) unless already prepared
+
+           Returns the query to execute in its place."""
+        if dbaccess.DRIVER != "postgresql":
+            return query.query
+        if query.name not in self.__pooled.prepared:
+            before = time.time()
+            cursor.execute(query.prepare)
+            after = time.time()
+            self.recordProfiling("<prepare>", after - before, 0)
+            self.__pooled.prepared.add(query.name)
+        return query.execute
+
+    @property
+    def modified_tables(self):
+        """Tables modified in the current transaction"""
+        return self.__modified_tables
+
+    def tableModified(self, table):
+        self.__modified_tables.add(table)
+
     def registerTransactionCallback(self, callback):
         self.__transaction_callbacks.append(callback)
 
@@ -186,6 +186,78 @@ def cursors():
 
     print "cursors: ok"
 
+def sharedcache():
+    import api
+    import dbutils
+
+    critic = api.critic.startSession(for_testing=True)
+
+    with dbutils.Database.forTesting(critic) as db:
+        db.cursor().execute(
+            "CREATE TABLE playground3 ( x INTEGER PRIMARY KEY, y INTEGER )")
+        db.cursor().execute("INSERT INTO playground3 (x, y) VALUES (1, 1)")
+        db.commit()
+
+    cache = dbutils.SharedCache(["playground3"])
+    loads = []
+
+    def fetchY(db):
+        def load():
+            loads.append(None)
+            cursor = db.readonly_cursor()
+            cursor.execute("SELECT y FROM playground3 WHERE x=1")
+            return cursor.fetchone()[0]
+        return cache.get(db, "y", load)
+
+    with dbutils.Database.forTesting(critic) as db:
+        assert fetchY(db) == 1
+        assert fetchY(db) == 1
+        assert len(loads) == 1
+
+        # Committed modifications invalidate cached values.
+        with db.updating_cursor("playground3") as cursor:
+            cursor.execute("UPDATE playground3 SET y=2 WHERE x=1")
+        assert fetchY(db) == 2
+        assert fetchY(db) == 2
+        assert len(loads) == 2
+
+        # Uncommitted modifications bypass the cache.
+        db.cursor().execute("UPDATE playground3 SET y=3 WHERE x=1")
+        assert fetchY(db) == 3
+        assert fetchY(db) == 3
+        assert len(loads) == 4
+
+        db.rollback()
+        assert fetchY(db) == 2
+
+    # Drop the playground table.
+    with dbutils.Database.forTesting(critic) as db:
+        db.cursor().execute("DROP TABLE playground3")
+        db.commit()
+
+    print "sharedcache: ok"
+
+def pooling():
+    import api
+    import dbutils
+
+    critic = api.critic.startSession(for_testing=True)
+
+    # Temporary tables must not survive a connection's return to the pool,
+    # even if committed.
+    for _ in range(2):
+        with dbutils.Database.forTesting(critic) as db:
+            db.cursor().execute(
+                "CREATE TEMPORARY TABLE playground4 ( x INTEGER )")
+            db.cursor().execute("INSERT INTO playground4 (x) VALUES (1)")
+            db.commit()
+
+            cursor = db.cursor()
+            cursor.execute("SELECT x FROM playground4")
+            assert cursor.fetchall() == [(1,)]
+
+    print "pooling: ok"
+
 def analyzeQuery():
     import dbutils
 
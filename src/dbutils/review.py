@@ -18,6 +18,12 @@ import time
 
 import base
 
+from dbutils.sharedcache import SharedCache
+
+# Graphs of the commits in reviews (log.commitset.CommitGraph objects), keyed by
+# review id and serial.  Graphs of large reviews are big, so keep few of them.
+COMMIT_GRAPH_CACHE = SharedCache(("reviewchangesets",), max_size=100)
+
 def countDraftItems(db, user, review):
     cursor = db.cursor()
 
@@ -316,20 +322,19 @@ class Review(object):
         import gitutils
         import log.commitset
 
-        cursor = db.cursor()
-        cursor.execute("""SELECT DISTINCT commits.id, commits.sha1
-                            FROM commits
-                            JOIN changesets ON (changesets.child=commits.id)
-                            JOIN reviewchangesets ON (reviewchangesets.changeset=changesets.id)
-                           WHERE reviewchangesets.review=%s""",
-                       (self.id,))
-
-        commits = []
+        graph = COMMIT_GRAPH_CACHE.get(
+            db, (self.id, self.serial),
+            lambda: log.commitset.CommitGraph.fromReview(db, self.id))
 
-        for commit_id, commit_sha1 in cursor:
-            commits.append(gitutils.Commit.fromSHA1(db, self.repository, commit_sha1, commit_id))
+        cache = db.storage["Commit"]
+        commits = [cache[sha1] for sha1 in graph.sha1s if sha1 in cache]
+        commits.extend(
+            gitutils.Commit.fromGitObject(db, self.repository, gitobject,
+                                          graph.commit_ids.get(gitobject.sha1))
+            for gitobject in self.repository.fetchMany(
+                [sha1 for sha1 in graph.sha1s if sha1 not in cache]))
 
-        return log.commitset.CommitSet(commits)
+        return log.commitset.CommitSet(commits, graph=graph)
 
     def containsCommit(self, db, commit, include_head_and_tails=False, include_actual_log=False):
         import gitutils
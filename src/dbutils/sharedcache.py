@@ -0,0 +1,131 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import threading
+
+import dbaccess
+
+# Channel on which modifications of watched tables are announced to other
+# processes, using PostgreSQL's LISTEN/NOTIFY.  The payload is a comma-separated
+# list of table names.
+CHANNEL = "critic_sharedcache"
+
+# Tables that any cache depends on.  Modifications of other tables are not
+# announced.
+WATCHED_TABLES = set()
+
+_CACHES = []
+_LOCK = threading.Lock()
+
+class SharedCache(object):
+    """Process-wide cache of rarely modified data
+
+       Values are cached under arbitrary (hashable) keys, and are shared by all
+       database sessions in the process.  All values are dropped when any of
+       |tables| is modified, either by this process, or (with PostgreSQL) by
+       any other process.
+
+       Cached values must not be modified by the caller."""
+
+    def __init__(self, tables, max_size=10000):
+        self.tables = frozenset(tables)
+        self.max_size = max_size
+        self.__values = {}
+        self.__generation = 0
+        with _LOCK:
+            _CACHES.append(self)
+            WATCHED_TABLES.update(self.tables)
+
+    def get(self, db, key, load):
+        """Return the value cached under |key|, or call load() to fetch it
+
+           If |db| has made uncommitted modifications to any of the tables the
+           cache depends on, load() is always called, and the value it returns
+           is not cached."""
+
+        if not self.tables.isdisjoint(db.modified_tables):
+            return load()
+        with _LOCK:
+            try:
+                return self.__values[key]
+            except KeyError:
+                generation = self.__generation
+        value = load()
+        with _LOCK:
+            # Don't cache the value if the cache was invalidated while it was
+            # being loaded, since it might then be stale.
+            if generation == self.__generation:
+                if len(self.__values) >= self.max_size:
+                    self.__values.clear()
+                self.__values[key] = value
+        return value
+
+    def clear(self):
+        with _LOCK:
+            self.__values.clear()
+            self.__generation += 1
+
+def invalidate(tables):
+    """Drop all values cached by caches that depend on any of |tables|"""
+    for cache in _CACHES:
+        if not cache.tables.isdisjoint(tables):
+            cache.clear()
+
+def invalidateAll():
+    for cache in _CACHES:
+        cache.clear()
+
+def announce(connection, tables):
+    """Announce modifications of |tables| to other processes
+
+       Must be called before the transaction that made the modifications is
+       committed; the announcement is delivered when (and if) it is."""
+
+    if dbaccess.DRIVER == "postgresql":
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_notify(%s, %s)",
+                       (CHANNEL, ",".join(sorted(tables))))
+
+def synchronize(connection, reused=True):
+    """Process announcements received on |connection|
+
+       If |reused| is False, the connection is new, and starts listening for
+       announcements.  Since announcements made earlier may then have been
+       missed, all caches are invalidated."""
+
+    if dbaccess.DRIVER != "postgresql":
+        # There's no way to know what other processes have modified, so don't
+        # keep cached values between sessions.
+        invalidateAll()
+        return
+
+    if not reused:
+        cursor = connection.cursor()
+        cursor.execute("LISTEN " + CHANNEL)
+        connection.commit()
+        invalidateAll()
+        return
+
+    # Receive pending notifications without issuing any query.
+    connection.poll()
+
+    if connection.notifies:
+        tables = set()
+        for notification in connection.notifies:
+            if notification.channel == CHANNEL:
+                tables.update(notification.payload.split(","))
+        del connection.notifies[:]
+        invalidate(tables)
@@ -17,6 +17,9 @@
 import os
 import base
 
+from dbutils.database import PreparedQuery
+from dbutils.sharedcache import SharedCache
+
 def _preferenceCacheKey(item, repository, filter_id):
     cache_key = item
     if filter_id is not None:
@@ -25,6 +28,41 @@ def _preferenceCacheKey(item, repository, filter_id):
         cache_key += ":r%d" % repository.id
     return cache_key
 
+PREFERENCE_TYPE_QUERY = PreparedQuery(
+    "critic_preference_type",
+    "SELECT type FROM preferences WHERE item=%s")
+
+# There are only a few variants of the preference value query, depending on
+# which arguments are used, so prepare each of them.
+_PREFERENCE_QUERIES = {}
+
+def _preferenceQuery(columns, where):
+    key = (tuple(columns), tuple(where))
+    if key not in _PREFERENCE_QUERIES:
+        _PREFERENCE_QUERIES[key] = PreparedQuery(
+            "critic_preference_%d" % len(_PREFERENCE_QUERIES),
+            """SELECT %(columns)s
+                 FROM userpreferences
+                WHERE %(where)s"""
+            % { "columns": ", ".join(columns),
+                "where": " AND ".join("(%s)" % condition
+                                      for condition in where) })
+    return _PREFERENCE_QUERIES[key]
+
+# Cache of preference types, of users' global preference values, and of
+# individual preference values.
+PREFERENCE_CACHE = SharedCache(("preferences", "userpreferences"))
+
+def _fetchPreferenceType(db, item):
+    def load():
+        cursor = db.cursor()
+        cursor.execute(PREFERENCE_TYPE_QUERY, (item,))
+        row = cursor.fetchone()
+        if not row:
+            raise base.ImplementationError("invalid preference: %s" % item)
+        return row[0]
+    return PREFERENCE_CACHE.get(db, ("type", item), load)
+
 class InvalidUserId(base.Error):
     def __init__(self, user_id):
         super(InvalidUserId, self).__init__("Invalid user id: %d" % user_id)
@@ -88,35 +126,49 @@ class User(object):
 
     def loadPreferences(self, db):
         if not self.preferences:
-            cursor = db.cursor()
-            cursor.execute("""SELECT uid, item, type, integer, string
-                                FROM preferences
-                                JOIN userpreferences USING (item)
-                               WHERE (uid=%s OR uid IS NULL)
-                                 AND repository IS NULL
-                                 AND filter IS NULL""",
-                           (self.id,))
-
-            rows = sorted(cursor, key=lambda row: row[0], reverse=True)
-
-            for _, item, preference_type, integer, string in rows:
-                cache_key = _preferenceCacheKey(item, None, None)
-                if cache_key not in self.preferences:
-                    if preference_type == "boolean":
-                        self.preferences[cache_key] = bool(integer)
-                    elif preference_type == "integer":
-                        self.preferences[cache_key] = integer
-                    else:
-                        self.preferences[cache_key] = string
+            self.preferences.update(PREFERENCE_CACHE.get(
+                db, ("global", self.id), lambda: self.__loadPreferences(db)))
+
+    def __loadPreferences(self, db):
+        preferences = {}
+        cursor = db.cursor()
+        cursor.execute("""SELECT uid, item, type, integer, string
+                            FROM preferences
+                            JOIN userpreferences USING (item)
+                           WHERE (uid=%s OR uid IS NULL)
+                             AND repository IS NULL
+                             AND filter IS NULL""",
+                       (self.id,))
+
+        rows = sorted(cursor, key=lambda row: row[0], reverse=True)
+
+        for _, item, preference_type, integer, string in rows:
+            cache_key = _preferenceCacheKey(item, None, None)
+            if cache_key not in preferences:
+                if preference_type == "boolean":
+                    preferences[cache_key] = bool(integer)
+                elif preference_type == "integer":
+                    preferences[cache_key] = integer
+                else:
+                    preferences[cache_key] = string
+        return preferences
 
     @staticmethod
     def fetchPreference(db, item, user=None, repository=None, filter_id=None):
+        if user is not None and not user.isAnonymous():
+            user_id = user.id
+        else:
+            user_id = None
+        repository_id = repository.id if repository is not None else None
+        return PREFERENCE_CACHE.get(
+            db, ("value", item, user_id, repository_id, filter_id),
+            lambda: User.__loadPreference(
+                db, item, user, repository, filter_id))
+
+    @staticmethod
+    def __loadPreference(db, item, user, repository, filter_id):
         cursor = db.cursor()
-        cursor.execute("SELECT type FROM preferences WHERE item=%s", (item,))
-        row = cursor.fetchone()
-        if not row:
-            raise base.ImplementationError("invalid preference: %s" % item)
-        preference_type = row[0]
+        preference_type = _fetchPreferenceType(db, item)
 
         arguments = [item]
         where = ["item=%s"]
@@ -147,14 +199,7 @@ class User(object):
         else:
             where.append("filter IS NULL")
 
-        query = ("""SELECT %(columns)s
-                      FROM userpreferences
-                     WHERE %(where)s"""
-                 % { "columns": ", ".join(columns),
-                     "where": " AND ".join("(%s)" % condition
-                                           for condition in where) })
-
-        cursor.execute(query, arguments)
+        cursor.execute(_preferenceQuery(columns, where), arguments)
 
         rows = cursor.fetchall()
         if not rows:
@@ -215,9 +260,7 @@ class User(object):
             cursor.execute(query, arguments)
 
             if value is not None:
-                cursor.execute("SELECT type FROM preferences WHERE item=%s", (item,))
-
-                (value_type,) = cursor.fetchone()
+                value_type = _fetchPreferenceType(db, item)
                 integer = string = None
 
                 if value_type == "boolean":
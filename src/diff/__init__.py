@@ -18,6 +18,7 @@ import re
 
 import gitutils
 import diff.analyze
+import diff.lineindex
 import syntaxhighlight
 import syntaxhighlight.request
 import htmlutils
@@ -239,8 +240,9 @@ class File:
         # List of macro chunks affecting the file.
         self.macro_chunks = kwargs.get("macro_chunks")
 
-        # Lists of actual lines in the old and new versions of the file.  Each
-        # line is a string, not including the linebreak character.
+        # Sequences of actual lines in the old and new versions of the file:
+        # lists, or diff.lineindex.LineIndex objects.  Each line is a string,
+        # not including the linebreak character.
         self.old_plain = kwargs.get("old_plain")
         self.new_plain = kwargs.get("new_plain")
         self.old_highlighted = kwargs.get("old_highlighted")
@@ -325,11 +327,8 @@ class File:
         else:
             return None
 
-    def ensureHighlight(self, highlight_mode="legacy"):
-        """Ensure that the old and new version are syntax highlighted
-
-           If they are, True is returned. If they are not, an asynchronous
-           request to syntax highlight them is made, and False is returned."""
+    def highlightSHA1s(self):
+        """Return a dictionary of sha1 => (path, language) to highlight"""
         sha1s = {}
         if self.old_sha1 \
                 and self.old_sha1 != "0" * 40 \
@@ -343,8 +342,39 @@ class File:
             new_language = self.getLanguage(use_content="new")
             if new_language:
                 sha1s[self.new_sha1] = (self.path, new_language)
-        return not syntaxhighlight.request.requestHighlights(
-            self.repository, sha1s, highlight_mode, async=True)
+        return sha1s
+
+    def ensureHighlight(self, highlight_mode="legacy"):
+        """Ensure that the old and new version are syntax highlighted
+
+           If they are, True is returned. If they are not, an asynchronous
+           request to syntax highlight them is made, and False is returned."""
+        return File.ensureHighlights([self], highlight_mode)[0]
+
+    @staticmethod
+    def ensureHighlights(files, highlight_mode="legacy"):
+        """Ensure that the old and new versions of all files are highlighted
+
+           Returns a list of booleans, True for each file that is highlighted.
+           Highlighting of the rest is requested asynchronously, using a single
+           request per repository."""
+
+        per_file = []
+        per_repository = {}
+
+        for file in files:
+            sha1s = dict(
+                (sha1, (path, language))
+                for sha1, (path, language) in file.highlightSHA1s().items()
+                if not syntaxhighlight.isHighlighted(sha1, language, highlight_mode))
+            per_file.append(sha1s)
+            per_repository.setdefault(file.repository, {}).update(sha1s)
+
+        for repository, sha1s in per_repository.items():
+            syntaxhighlight.request.requestHighlights(
+                repository, sha1s, highlight_mode, async=True)
+
+        return [not sha1s for sha1s in per_file]
 
     def loadOldLines(self, highlighted=False, request_highlight=False, highlight_mode="legacy"):
         """Load the lines of the old version of the file, optionally highlighted."""
@@ -367,17 +397,18 @@ class File:
             else:
                 self.old_is_highlighted = True
                 language = self.getLanguage(use_content="old")
-                data = syntaxhighlight.readHighlight(
+                lines = syntaxhighlight.readHighlightLines(
                     self.repository, self.old_sha1, self.path, language,
                     request=request_highlight, mode=highlight_mode)
-                self.old_highlighted = splitlines(data)
-                self.old_eof_eol = data and data[-1] in "\n\r"
+                self.old_highlighted = lines
+                self.old_eof_eol = lines.eof_eol
         else:
             if self.old_plain: return
             else:
-                data = self.repository.fetch(self.old_sha1).data
-                self.old_plain = splitlines(data)
-                self.old_eof_eol = data and data[-1] in "\n\r"
+                lines = diff.lineindex.LineIndex(
+                    self.repository.fetch(self.old_sha1).data)
+                self.old_plain = lines
+                self.old_eof_eol = lines.eof_eol
 
     def loadNewLines(self, highlighted=False, request_highlight=False, highlight_mode="legacy"):
         """Load the lines of the new version of the file, optionally highlighted."""
@@ -400,17 +431,50 @@ class File:
             else:
                 self.new_is_highlighted = True
                 language = self.getLanguage(use_content="new")
-                data = syntaxhighlight.readHighlight(
+                lines = syntaxhighlight.readHighlightLines(
                     self.repository, self.new_sha1, self.path, language,
                     request=request_highlight, mode=highlight_mode)
-                self.new_highlighted = splitlines(data)
-                self.new_eof_eol = data and data[-1] in "\n\r"
+                self.new_highlighted = lines
+                self.new_eof_eol = lines.eof_eol
         else:
             if self.new_plain: return
             else:
-                data = self.repository.fetch(self.new_sha1).data
-                self.new_plain = splitlines(data)
-                self.new_eof_eol = data and data[-1] in "\n\r"
+                lines = diff.lineindex.LineIndex(
+                    self.repository.fetch(self.new_sha1).data)
+                self.new_plain = lines
+                self.new_eof_eol = lines.eof_eol
+
+    @staticmethod
+    def loadPlainLines(files):
+        """Load the plain lines of the old and new versions of all files.
+
+           The blobs are fetched using Repository.fetchMany(), that is, in one
+           pipelined batch per repository instead of one at a time."""
+
+        per_repository = {}
+
+        for file in files:
+            for side in ("old", "new"):
+                sha1 = getattr(file, side + "_sha1")
+                if getattr(file, side + "_plain"):
+                    continue
+                elif sha1 is None or sha1 == '0' * 40 \
+                        or getattr(file, side + "_mode") == "160000":
+                    # Nothing to fetch; let the regular loader handle these.
+                    if side == "old": file.loadOldLines()
+                    else: file.loadNewLines()
+                else:
+                    per_repository.setdefault(file.repository, []).append((file, side))
+
+        for repository, items in per_repository.items():
+            sha1s = [getattr(file, side + "_sha1") for file, side in items]
+            # Read all objects, so that the 'git cat-file' process is returned
+            # to the pool in a usable state.
+            for (file, side), gitobject in zip(
+                    items, list(repository.fetchMany(sha1s))):
+                lines = diff.lineindex.LineIndex(gitobject.data)
+                setattr(file, side + "_plain", lines)
+                setattr(file, side + "_eof_eol", lines.eof_eol)
 
     def getOldLines(self, chunk, highlighted=False):
         begin = chunk.delete_offset - 1
@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import bisect
 import difflib
 import re
 
@@ -68,6 +69,44 @@ def analyzeChunk(deletedLines, insertedLines, moved=False):
     if analysis: return analysis
     else: return None
 
+class AnalyzedLine(object):
+    """Per-line data used by analyzeChunk1(), computed once per line"""
+
+    def __init__(self, line):
+        self.line = line
+        self.stripped = line.strip()
+        self.ignored = bool(re_ignore.match(line))
+        if not self.ignored:
+            self.words = re_words.findall(line)
+            self.length = len(re_ws.sub("", self.stripped))
+            # Multiset of words, weighted by their stripped length, used to
+            # compute an upper bound of the matching computed by ratio().
+            self.weights = {}
+            for word in self.words:
+                weight = len(word.strip())
+                if weight:
+                    self.weights[word] = self.weights.get(word, 0) + weight
+            self.weight = sum(self.weights.values())
+
+def maximumRatio(matching, aLength, bLength):
+    """Upper bound of ratio(), given an upper bound of the matching"""
+    if aLength > 5:
+        return max(float(matching) / aLength,
+                   2.0 * matching / (aLength + bLength))
+    else:
+        return 2.0 * matching / (aLength + bLength)
+
+def commonWeight(a, b):
+    """Total weight of the words that occur in both |a| and |b|"""
+    if len(a.weights) > len(b.weights):
+        a, b = b, a
+    common = 0
+    for word, weight in a.weights.iteritems():
+        other = b.weights.get(word)
+        if other:
+            common += min(weight, other)
+    return common
+
 def analyzeChunk1(deletedLines, insertedLines, offsetA=0, offsetB=0):
     matches = []
     equals = []
@@ -76,49 +115,74 @@ def analyzeChunk1(deletedLines, insertedLines, offsetA=0, offsetB=0):
 
     def ratio(sm, a, b, aLength, bLength):
         matching = 0
-        for i, j, n in sm.get_matching_blocks():
+        blocks = sm.get_matching_blocks()
+        for i, j, n in blocks:
             matching += sum(map(len, map(unicode.strip, a[i:i+n])))
-        if aLength > 5 and len(sm.get_matching_blocks()) == 2:
+        if aLength > 5 and len(blocks) == 2:
             return float(matching) / aLength
         else:
             return 2.0 * matching / (aLength + bLength)
 
-    for deletedIndex, deleted in enumerate(deletedLines):
-        deletedStripped = deleted.strip()
-        deletedNoWS = re_ws.sub("", deletedStripped)
+    inserted = map(AnalyzedLine, insertedLines)
 
+    for deletedIndex, deletedLine in enumerate(deletedLines):
         # Don't match conflict lines against anything.
-        if re_conflict.match(deleted): continue
-
-        if not re_ignore.match(deleted):
-            deletedWords = re_words.findall(deleted)
-
-            for insertedIndex, inserted in enumerate(insertedLines):
-                insertedStripped = inserted.strip()
-                insertedNoWS = re_ws.sub("", insertedStripped)
-
-                if not re_ignore.match(inserted):
-                    insertedWords = re_words.findall(inserted)
-                    sm = difflib.SequenceMatcher(None, deletedWords, insertedWords)
-                    r = ratio(sm, deletedWords, insertedWords, len(deletedNoWS), len(insertedNoWS))
-                    if r > 0.5: matches.append((r, deletedIndex, insertedIndex, deletedWords, insertedWords, sm))
-                elif deletedStripped == insertedStripped:
+        if re_conflict.match(deletedLine): continue
+
+        deleted = AnalyzedLine(deletedLine)
+
+        if not deleted.ignored:
+            for insertedIndex, candidate in enumerate(inserted):
+                if not candidate.ignored:
+                    # The words that match can't weigh more than the words the
+                    # lines have in common, which in turn can't weigh more than
+                    # all words in either line.  If even that isn't enough for
+                    # a ratio above 0.5, skip the expensive comparison.
+                    if maximumRatio(min(deleted.weight, candidate.weight),
+                                    deleted.length, candidate.length) <= 0.5:
+                        continue
+                    if maximumRatio(commonWeight(deleted, candidate),
+                                    deleted.length, candidate.length) <= 0.5:
+                        continue
+
+                    sm = difflib.SequenceMatcher(None, deleted.words, candidate.words)
+                    r = ratio(sm, deleted.words, candidate.words, deleted.length, candidate.length)
+                    if r > 0.5: matches.append((r, deletedIndex, insertedIndex, deleted.words, candidate.words, sm))
+                elif deleted.stripped == candidate.stripped:
                     equals.append((deletedIndex, insertedIndex))
         else:
-            for insertedIndex, inserted in enumerate(insertedLines):
-                if deletedStripped == inserted.strip():
+            for insertedIndex, candidate in enumerate(inserted):
+                if deleted.stripped == candidate.stripped:
                     equals.append((deletedIndex, insertedIndex))
 
     if matches:
         matches.sort(key=lambda x: x[0], reverse=True)
 
+        # Select matches greedily, best first, skipping any that would cross or
+        # share a line with an already selected match.  The selected matches
+        # form an increasing chain, so the compatibility check is a matter of
+        # finding the neighbours of the candidate in the chain.
         final = []
-
-        while matches:
-            r, deletedIndex, insertedIndex, deletedWords, insertedWords, sm = matches.pop(0)
+        chainDeleted = []
+        chainInserted = []
+
+        for r, deletedIndex, insertedIndex, deletedWords, insertedWords, sm in matches:
+            position = bisect.bisect_left(chainDeleted, deletedIndex)
+            if position < len(chainDeleted) and chainDeleted[position] == deletedIndex:
+                continue
+            if position > 0 and chainInserted[position - 1] >= insertedIndex:
+                continue
+            if position < len(chainInserted) and chainInserted[position] <= insertedIndex:
+                continue
+            chainDeleted.insert(position, deletedIndex)
+            chainInserted.insert(position, insertedIndex)
             final.append((deletedIndex, insertedIndex, deletedWords, insertedWords, sm))
-            matches = filter(lambda data: data[1] != deletedIndex and data[2] != insertedIndex and (data[1] < deletedIndex) == (data[2] < insertedIndex), matches)
-            equals = filter(lambda data: (data[0] < deletedIndex) == (data[1] < insertedIndex), equals)
+
+        # Keep only equal lines that are on the same side of every selected
+        # match.
+        equals = [(di, ii) for di, ii in equals
+                  if (bisect.bisect_right(chainDeleted, di)
+                      == bisect.bisect_right(chainInserted, ii))]
 
         final.sort()
         equals.sort()
@@ -129,9 +193,13 @@ def analyzeChunk1(deletedLines, insertedLines, offsetA=0, offsetB=0):
 
         final.append((len(deletedLines), len(insertedLines), None, None, None))
 
+        nequals = len(equals)
+        position = 0
+
         for deletedIndex, insertedIndex, deletedWords, insertedWords, sm in final:
-            while equals and (equals[0][0] < deletedIndex or equals[0][1] < insertedIndex):
-                di, ii = equals.pop(0)
+            while position < nequals and (equals[position][0] < deletedIndex or equals[position][1] < insertedIndex):
+                di, ii = equals[position]
+                position += 1
                 if previousDeletedIndex < di < deletedIndex and previousInsertedIndex < ii < insertedIndex:
                     deletedLine = deletedLines[di]
                     insertedLine = insertedLines[ii]
@@ -140,7 +208,7 @@ def analyzeChunk1(deletedLines, insertedLines, offsetA=0, offsetB=0):
                     else: result.append("%d=%d" % (di + offsetA, ii + offsetB))
                     previousDeletedIndex = di
                     previousInsertedIndex = ii
-                while equals and (di == equals[0][0] or ii == equals[0][1]): equals.pop(0)
+                while position < nequals and (di == equals[position][0] or ii == equals[position][1]): position += 1
 
             if sm is None: break
 
@@ -0,0 +1,43 @@
+def basic():
+    from diff.analyze import analyzeChunk
+
+    # These are the analyses produced by the original (unpruned) analysis
+    # engine.  Analyses are stored in the database, so the output must never
+    # change.
+    def check(deleted, inserted, expected):
+        analysis = analyzeChunk(deleted, inserted)
+        assert analysis == expected, "%r != %r" % (analysis, expected)
+
+    check(["    def fetch(self, sha1):",
+           "        return self.__fetch(sha1)"],
+          ["    def fetch(self, sha1, fetchData=True):",
+           "        return self.__fetch(sha1, fetchData)"],
+          "0=0:i24-40;1=1:i32-43")
+
+    check(["if (a) {", "  foo(a);", "}", "bar();"],
+          ["if (a && b) {", "    foo(a, b);", "}", "baz();"],
+          "0=0:i5-10;1=1:r0-2=0-4,i9-12;2=2")
+
+    # Crossing matches: only the best one is kept.
+    check(["x = 1", "y = 2", "z = 3"],
+          ["z = 3", "y = 2", "x = 1"],
+          "0=2")
+
+    # Conflict markers are never matched against anything.
+    check(["<<<<<<< HEAD", "value = compute(1)"],
+          ["value = compute(2)"],
+          "1=0:r16-17=16-17")
+
+    check(["first line", "second line"],
+          ["something else entirely", "second line"],
+          "1=1")
+
+    check(["\treturn result"],
+          ["        return result"],
+          "0=0:ws,r0-1=0-8")
+
+    # Pure deletions/insertions aren't analyzed.
+    check(["foo"], [], None)
+    check([], ["foo"], None)
+
+    print "basic: ok"
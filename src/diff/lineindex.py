@@ -0,0 +1,85 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import array
+
+def computeOffsets(source):
+    """Return the offsets at which each line in |source| begins
+
+       The returned array has one more item than there are lines, such that
+       line N is source[offsets[N]:offsets[N + 1] - 1].  Lines are split the
+       same way as diff.parse.splitlines() splits them."""
+
+    offsets = array.array("L", [0])
+    append = offsets.append
+    find = source.find
+    offset = find("\n")
+    while offset != -1:
+        append(offset + 1)
+        offset = find("\n", offset + 1)
+    if source and source[-1] != "\n":
+        append(len(source) + 1)
+    return offsets
+
+class LineIndex(object):
+    """Read-only sequence of the lines in a string
+
+       Behaves like the list returned by diff.parse.splitlines(), but only
+       stores the offsets of the lines, and creates line strings on demand,
+       meaning that fetching a small range of lines from a large source only
+       costs as much as the lines actually fetched."""
+
+    def __init__(self, source, offsets=None):
+        self.source = source
+        if offsets is None:
+            offsets = computeOffsets(source)
+        self.offsets = offsets
+        self.eof_eol = bool(source) and source[-1] in "\n\r"
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        source = self.source
+        offsets = self.offsets
+        for index in xrange(len(offsets) - 1):
+            yield source[offsets[index]:offsets[index + 1] - 1]
+
+    def __getitem__(self, index):
+        offsets = self.offsets
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(offsets) - 1)
+            if step != 1:
+                return [self[item] for item in xrange(start, stop, step)]
+            source = self.source
+            return [source[offsets[item]:offsets[item + 1] - 1]
+                    for item in xrange(start, stop)]
+        if index < 0:
+            index += len(offsets) - 1
+        if not 0 <= index < len(offsets) - 1:
+            raise IndexError("line index out of range")
+        return self.source[offsets[index]:offsets[index + 1] - 1]
+
+    def __getslice__(self, start, stop):
+        # Python 2 calls this instead of __getitem__() for simple slices.
+        return self.__getitem__(slice(max(0, start), max(0, stop)))
+
+    def read(self):
+        """Return the whole source as a string"""
+        return self.source
+
+    def __repr__(self):
+        return "LineIndex(lines=%d)" % len(self)
@@ -0,0 +1,93 @@
+def basic():
+    from diff.parse import splitlines
+    from diff.lineindex import LineIndex
+
+    def check(source):
+        expected = splitlines(source) or []
+        lines = LineIndex(source)
+        assert len(lines) == len(expected), "%r: %d != %d" % (source, len(lines), len(expected))
+        assert list(lines) == expected, "%r: %r != %r" % (source, list(lines), expected)
+        assert [lines[index] for index in range(len(lines))] == expected
+        assert lines[1:3] == expected[1:3]
+        assert lines[-2:] == expected[-2:]
+        assert lines[5:] == expected[5:]
+        assert lines.read() == source
+        assert lines.eof_eol == (source[-1:] in ("\n", "\r") and source != "")
+
+    check("")
+    check("\n")
+    check("\n\n")
+    check("a")
+    check("a\n")
+    check("a\nb")
+    check("a\nb\n")
+    check("a\n\nb\n\n")
+    check("first line\r\nsecond line\r\n")
+
+    try:
+        LineIndex("a\nb\n")[2]
+    except IndexError:
+        pass
+    else:
+        assert False, "IndexError not raised"
+
+    print "basic: ok"
+
+def loaders():
+    # Check that File.loadPlainLines() and File.loadOldLines()/loadNewLines()
+    # load the same lines, the same way.
+
+    import shutil
+    import subprocess
+    import tempfile
+
+    import diff
+    import gitutils
+
+    path = tempfile.mkdtemp()
+
+    try:
+        subprocess.check_call(["git", "init", "--quiet", path])
+
+        sources = ["", "\n", "a", "a\nb\n", "a\r\nb", "a\n" * 1000]
+        hash_object = subprocess.Popen(
+            ["git", "hash-object", "-w", "--stdin-paths"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=path)
+        filenames = []
+        for index, source in enumerate(sources):
+            filename = "%s/file%d" % (path, index)
+            with open(filename, "w") as file:
+                file.write(source)
+            filenames.append(filename)
+        stdout, _ = hash_object.communicate("".join(
+            filename + "\n" for filename in filenames))
+        sha1s = stdout.split()
+
+        repository = gitutils.Repository(path=path)
+        pairs = [(sha1s[index], sha1s[-index - 1])
+                 for index in range(len(sha1s))]
+
+        individually = [diff.File(None, "file", old_sha1, new_sha1, repository)
+                        for old_sha1, new_sha1 in pairs]
+        for file in individually:
+            file.loadOldLines()
+            file.loadNewLines()
+
+        batched = [diff.File(None, "file", old_sha1, new_sha1, repository)
+                   for old_sha1, new_sha1 in pairs]
+        diff.File.loadPlainLines(batched)
+
+        for expected, actual in zip(individually, batched):
+            for side in ("old", "new"):
+                expected_lines = getattr(expected, side + "_plain")
+                actual_lines = getattr(actual, side + "_plain")
+                assert isinstance(actual_lines, diff.lineindex.LineIndex)
+                assert list(actual_lines) == list(expected_lines)
+                assert getattr(actual, side + "_eof_eol") \
+                    == getattr(expected, side + "_eof_eol")
+
+        gitutils.CAT_FILE_POOL.evict()
+    finally:
+        shutil.rmtree(path)
+
+    print "loaders: ok"
@@ -126,9 +126,8 @@ def createChunks(delete_offset, deleted_lines, insert_offset, inserted_lines):
 
 def mergeChunks(file):
     if len(file.chunks) > 1:
-        file.loadOldLines(False)
+        diff.File.loadPlainLines([file])
         old_lines = file.oldLines(False)
-        file.loadNewLines(False)
         new_lines = file.newLines(False)
 
         merged = []
@@ -171,10 +170,13 @@ def mergeChunks(file):
         file.clean()
         file.chunks = merged
 
-def parseDifferences(repository, commit=None, from_commit=None, to_commit=None, filter_paths=None, selected_path=None, simple=False):
-    """parseDifferences(repository, [commit] | [from_commit, to_commit][, selected_path]) =>
-         dict(parent_sha1 => [diff.File, ...] (if selected_path is None)
-         diff.File                            (if selected_path is not None)"""
+def streamDifferences(repository, commit=None, from_commit=None, to_commit=None, filter_paths=None, selected_path=None, simple=False):
+    """streamDifferences(repository, [commit] | [from_commit, to_commit][, selected_path]) =>
+         generator of diff.File
+
+       Like parseDifferences(), but reads Git's output incrementally and yields
+       each file as soon as its differences have been parsed, so that only the
+       file currently being parsed is held in memory."""
 
     options = []
 
@@ -197,11 +199,13 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
         command = 'diff'
         what = [commit.parents[0] + '..' + commit.sha1]
 
-    if filter_paths is None and selected_path is None and not simple:
-        names = repository.run(command, *(options + ["--name-only"] + what))
-        paths = set(filter(None, map(str.strip, names.splitlines())))
-    else:
-        paths = set()
+    # Paths whose changes are all ignored by --ignore-space-change are not
+    # mentioned in the patch at all, so ask for a raw list of all modified
+    # paths as well.  It precedes the patch in the output.
+    list_paths = filter_paths is None and selected_path is None and not simple
+
+    if list_paths:
+        options.extend(['--raw', '-p', '--no-abbrev', '--no-renames'])
 
     if not simple:
         options.append('--ignore-space-change')
@@ -215,8 +219,7 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
         options.append('--')
         options.append(selected_path)
 
-    stdout = repository.run(command, '--full-index', '--unified=1', '--patience', *options)
-    selected_file = None
+    lines = repository.runLines(command, '--full-index', '--unified=1', '--patience', *options)
 
     re_chunk = re.compile('^@@ -(\\d+)(?:,\\d+)? \\+(\\d+)(?:,\\d+)? @@')
     re_binary = re.compile('^Binary files (["\']?)(?:a/(.+)\\1|/dev/null) and (["\']?)(?:b/(.+)\\3|/dev/null) differ')
@@ -224,31 +227,35 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
     re_old_path = re.compile("--- ([\"']?)a/(.*?)\\1\t?$")
     re_new_path = re.compile("\\+\\+\\+ ([\"']?)b/(.*?)\\1\t?$")
 
-    def isplitlines(text):
-        start = 0
-        length = len(text)
-
-        while start < length:
-            try:
-                end = text.index('\n', start)
-                yield text[start:end]
-                start = end + 1
-            except ValueError:
-                yield text[start:]
-                break
-
-    lines = isplitlines(stdout)
-
+    paths = []
     included = set()
-    files = []
-    files_by_path = {}
+
+    # The file most recently added.  It's kept until a file with a different
+    # path is added, since a path whose type changed is reported as a deletion
+    # directly followed by an addition, which are merged into a single file.
+    current = []
+    # Files that are complete, and should be yielded.
+    finished = []
 
     def addFile(new_file):
-        assert new_file.path not in files_by_path, "duplicate path: %s" % new_file.path
-        files.append(new_file)
-        files_by_path[new_file.path] = new_file
+        assert new_file.path not in included, "duplicate path: %s" % new_file.path
+        finished.extend(current)
+        current[:] = [new_file]
         included.add(new_file.path)
 
+    def currentFile(path):
+        if current and current[0].path == path:
+            return current[0]
+        return None
+
+    def completed():
+        files = finished[:]
+        del finished[:]
+        if not simple:
+            for file in files:
+                mergeChunks(file)
+        return files
+
     old_mode = None
     new_mode = None
 
@@ -258,6 +265,9 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
         names = None
 
         while True:
+            for file in completed():
+                yield file
+
             old_mode = None
             new_mode = None
 
@@ -275,6 +285,13 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                     if match.group(3):
                         new_name = demunge(new_name)
                     names = (old_name, new_name)
+                elif line.startswith(":"):
+                    # ':<old mode> <new mode> <old sha1> <new sha1> <status>\t<path>'
+                    information, _, path = line[1:].partition("\t")
+                    if path.startswith('"'):
+                        path = demunge(path[1:-1])
+                    raw_old_mode, raw_new_mode, raw_old_sha1, raw_new_sha1, _ = information.split(" ")
+                    paths.append((path, raw_old_mode, raw_new_mode, raw_old_sha1, raw_new_sha1))
                 elif line.startswith("old mode "):
                     old_mode = line[9:]
                 elif line.startswith("new mode "):
@@ -316,8 +333,7 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                 if '0' * 40 == old_sha1 or '0' * 40 == new_sha1:
                     new_file.chunks = [diff.Chunk(0, 0, 0, 0)]
                 else:
-                    new_file.loadOldLines()
-                    new_file.loadNewLines()
+                    diff.File.loadPlainLines([new_file])
                     new_file.chunks = []
 
                     detectWhiteSpaceChanges(new_file,
@@ -335,8 +351,8 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
             if binary:
                 path = (binary.group(2) or binary.group(4)).strip()
 
-                if path in files_by_path:
-                    new_file = files_by_path[path]
+                new_file = currentFile(path)
+                if new_file:
                     if old_sha1 != '0' * 40:
                         assert new_file.old_sha1 == '0' * 40
                         new_file.old_sha1 = old_sha1
@@ -395,7 +411,7 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                                      old_mode=old_mode, new_mode=new_mode,
                                      chunks=[diff.Chunk(1, 1, 1, 1, analysis="0=0:r18-58=18-58")])
 
-                if path not in files_by_path: addFile(new_file)
+                if path not in included: addFile(new_file)
 
                 old_mode = new_mode = None
 
@@ -410,14 +426,15 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                 inserted_lines = []
 
                 if old_path and new_path and not simple:
-                    old_lines = splitlines(repository.fetch(old_sha1).data)
-                    new_lines = splitlines(repository.fetch(new_sha1).data)
+                    old_lines, new_lines = (
+                        splitlines(gitobject.data)
+                        for gitobject in repository.fetchMany([old_sha1, new_sha1]))
                 else:
                     old_lines = None
                     new_lines = None
 
-                if path in files_by_path:
-                    new_file = files_by_path[path]
+                new_file = currentFile(path)
+                if new_file:
                     if old_sha1 != '0' * 40:
                         assert new_file.old_sha1 == '0' * 40
                         new_file.old_sha1 = old_sha1
@@ -429,14 +446,10 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                     new_file.chunks = []
                 else:
                     new_file = diff.File(None, path, old_sha1, new_sha1, repository, old_mode=old_mode, new_mode=new_mode, chunks=[])
+                    addFile(new_file)
 
                 old_mode = new_mode = None
 
-                if selected_path is not None and selected_path == path:
-                    selected_file = new_file
-
-                if path not in files_by_path: addFile(new_file)
-
                 previous_delete_offset = 1
                 previous_insert_offset = 1
 
@@ -460,7 +473,7 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                         if line[0] not in (' ', '-', '+'): break
 
                         if line[0] != ' ' and previous_delete_offset is not None and old_lines and new_lines and not simple:
-                            detectWhiteSpaceChanges(files[-1], old_lines, previous_delete_offset, delete_offset, True, new_lines, previous_insert_offset, insert_offset, True)
+                            detectWhiteSpaceChanges(new_file, old_lines, previous_delete_offset, delete_offset, True, new_lines, previous_insert_offset, insert_offset, True)
                             previous_delete_offset = None
 
                         if line[0] == ' ' and previous_delete_offset is None:
@@ -481,7 +494,7 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                                                       deleted_lines,
                                                       insert_offset - len(inserted_lines),
                                                       inserted_lines)
-                                files[-1].chunks.extend(chunks)
+                                new_file.chunks.extend(chunks)
                                 deleted_lines = []
                                 inserted_lines = []
 
@@ -493,12 +506,12 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                                               deleted_lines,
                                               insert_offset - len(inserted_lines),
                                               inserted_lines)
-                        files[-1].chunks.extend(chunks)
+                        new_file.chunks.extend(chunks)
                         deleted_lines = []
                         inserted_lines = []
 
                 if previous_delete_offset is not None and old_lines and new_lines and not simple:
-                    detectWhiteSpaceChanges(files[-1], old_lines, previous_delete_offset, len(old_lines) + 1, True, new_lines, previous_insert_offset, len(new_lines) + 1, True)
+                    detectWhiteSpaceChanges(new_file, old_lines, previous_delete_offset, len(old_lines) + 1, True, new_lines, previous_insert_offset, len(new_lines) + 1, True)
                     previous_delete_offset = None
             except StopIteration:
                 if deleted_lines or inserted_lines:
@@ -506,12 +519,12 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
                                           deleted_lines,
                                           insert_offset - len(inserted_lines),
                                           inserted_lines)
-                    files[-1].chunks.extend(chunks)
+                    new_file.chunks.extend(chunks)
                     deleted_lines = []
                     inserted_lines = []
 
                 if previous_delete_offset is not None and old_lines and new_lines and not simple:
-                    detectWhiteSpaceChanges(files[-1], old_lines, previous_delete_offset, len(old_lines) + 1, True, new_lines, previous_insert_offset, len(new_lines) + 1, True)
+                    detectWhiteSpaceChanges(new_file, old_lines, previous_delete_offset, len(old_lines) + 1, True, new_lines, previous_insert_offset, len(new_lines) + 1, True)
 
                 raise
     except StopIteration:
@@ -520,48 +533,55 @@ def parseDifferences(repository, commit=None, from_commit=None, to_commit=None,
 
             addFile(diff.File(None, names[0], None, None, repository, old_mode=old_mode, new_mode=new_mode, chunks=[]))
 
-    for path in (paths - included):
-        lines = isplitlines(repository.run(command, '--full-index', '--unified=1', *(what + ['--', path])))
+    finished.extend(current)
+    del current[:]
 
-        try:
-            line = lines.next()
+    for file in completed():
+        yield file
 
-            while not line.startswith("index "): line = lines.next()
+    def endsWithLinebreak(data): return data and data[-1] in "\n\r"
 
-            try:
-                sha1range, mode = line[6:].split(' ')
-                if mode == "160000":
-                    continue
-                old_sha1, new_sha1 = sha1range.split("..")
-            except:
-                old_sha1, new_sha1 = line[6:].split(' ', 1)[0].split("..")
+    for path, old_mode, new_mode, old_sha1, new_sha1 in paths:
+        if path in included:
+            continue
 
-            if old_sha1 == '0' * 40 or new_sha1 == '0' * 40:
-                # Added or removed empty file.
-                continue
+        if old_mode == new_mode == "160000":
+            continue
 
-            addFile(diff.File(None, path, old_sha1, new_sha1, repository, chunks=[]))
+        if old_sha1 == '0' * 40 or new_sha1 == '0' * 40:
+            # Added or removed empty file.
+            continue
 
-            old_data = repository.fetch(old_sha1).data
-            old_lines = splitlines(old_data)
-            new_data = repository.fetch(new_sha1).data
-            new_lines = splitlines(new_data)
+        new_file = diff.File(None, path, old_sha1, new_sha1, repository, chunks=[])
+        included.add(path)
 
-            assert len(old_lines) == len(new_lines), "%s:%d != %s:%d" % (old_sha1, len(old_lines), new_sha1, len(new_lines))
+        old_data, new_data = (
+            gitobject.data
+            for gitobject in repository.fetchMany([old_sha1, new_sha1]))
+        old_lines = splitlines(old_data)
+        new_lines = splitlines(new_data)
 
-            def endsWithLinebreak(data): return data and data[-1] in "\n\r"
+        assert len(old_lines) == len(new_lines), "%s:%d != %s:%d" % (old_sha1, len(old_lines), new_sha1, len(new_lines))
 
-            detectWhiteSpaceChanges(files[-1], old_lines, 1, len(old_lines) + 1, endsWithLinebreak(old_data), new_lines, 1, len(new_lines) + 1, endsWithLinebreak(new_data))
-        except StopIteration:
-            pass
+        detectWhiteSpaceChanges(new_file, old_lines, 1, len(old_lines) + 1, endsWithLinebreak(old_data), new_lines, 1, len(new_lines) + 1, endsWithLinebreak(new_data))
+        mergeChunks(new_file)
 
-    if not simple:
-        for file in files:
-            mergeChunks(file)
+        yield new_file
+
+def parseDifferences(repository, commit=None, from_commit=None, to_commit=None, filter_paths=None, selected_path=None, simple=False):
+    """parseDifferences(repository, [commit] | [from_commit, to_commit][, selected_path]) =>
+         dict(parent_sha1 => [diff.File, ...] (if selected_path is None)
+         diff.File                            (if selected_path is not None)"""
+
+    files = list(streamDifferences(repository, commit, from_commit, to_commit,
+                                   filter_paths, selected_path, simple))
 
     if to_commit:
         if selected_path is not None:
-            return selected_file
+            for file in files:
+                if file.path == selected_path:
+                    return file
+            return None
         elif from_commit:
             return { from_commit.sha1: files }
         else:
@@ -26,6 +26,7 @@ import shutil
 import stat
 import contextlib
 import base64
+import collections
 
 import base
 import configuration
@@ -129,6 +130,308 @@ class NoSuchRepository(base.Error):
         super(NoSuchRepository, self).__init__("No such repository: %s" % str(value))
         self.value = value
 
+class ObjectCache(object):
+    """Size-bounded LRU cache of GitObject instances
+
+       The size of a cached object is estimated from its size in the
+       repository (or zero, for objects fetched without data) plus a fixed
+       overhead.  When the total exceeds the cache's budget, the least recently
+       used objects are evicted.
+
+       Instances are thread-safe, so that a single instance can be shared by all
+       sessions in a process."""
+
+    OVERHEAD = 256
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__objects = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def estimateSize(git_object):
+        if git_object.data is None:
+            return ObjectCache.OVERHEAD
+        return ObjectCache.OVERHEAD + len(git_object.data)
+
+    def get(self, key):
+        with self.__lock:
+            git_object = self.__objects.pop(key, None)
+            if git_object is None:
+                self.misses += 1
+                return None
+            self.__objects[key] = git_object
+            self.hits += 1
+            return git_object
+
+    def set(self, key, git_object):
+        """Insert an object, and return the number of evicted objects
+
+           An already cached object with data is never replaced by one without
+           data."""
+        object_size = ObjectCache.estimateSize(git_object)
+        if object_size > self.max_size:
+            return 0
+        evicted = 0
+        with self.__lock:
+            previous = self.__objects.pop(key, None)
+            if previous is not None:
+                if git_object.data is None and previous.data is not None:
+                    self.__objects[key] = previous
+                    return 0
+                self.size -= ObjectCache.estimateSize(previous)
+            self.__objects[key] = git_object
+            self.size += object_size
+            while self.size > self.max_size:
+                _, evicted_object = self.__objects.popitem(last=False)
+                self.size -= ObjectCache.estimateSize(evicted_object)
+                evicted += 1
+            self.evictions += evicted
+        return evicted
+
+    def clear(self):
+        with self.__lock:
+            self.__objects.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.__objects)
+
+# Process-wide cache shared by all sessions.  Since Git objects are immutable,
+# this can safely outlive the sessions, but it is keyed by repository path as
+# well as SHA-1, so that objects are only ever returned for the repository they
+# were read from (and which the user has been granted access to.)
+SHARED_OBJECT_CACHE = ObjectCache(configuration.limits.GIT_SHARED_OBJECT_CACHE_SIZE)
+
+def getObjectCache(db):
+    """Return the session's object cache, creating it if needed"""
+    cache = db.storage.get("ObjectCache")
+    if cache is None:
+        cache = db.storage["ObjectCache"] = ObjectCache(
+            configuration.limits.GIT_OBJECT_CACHE_SIZE)
+    return cache
+
+class CatFileProcess(object):
+    """A long-lived 'git cat-file --batch' (or '--batch-check') process
+
+       Instances are owned by a CatFilePool, and should only be used by one
+       thread at a time, between CatFilePool.checkout() and the end of the
+       corresponding with statement."""
+
+    def __init__(self, path, check=False):
+        self.path = path
+        self.check = check
+        self.broken = False
+        self.last_used = time.time()
+        self.process = subprocess.Popen(
+            [configuration.executables.GIT, "cat-file",
+             "--batch-check" if check else "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, cwd=path)
+
+    def isAlive(self):
+        return not self.broken and self.process.poll() is None
+
+    def terminate(self):
+        try: os.kill(self.process.pid, 9)
+        except: pass
+        try: self.process.wait()
+        except: pass
+
+    def __write(self, data):
+        try:
+            self.process.stdin.write(data)
+        except:
+            self.broken = True
+            raise GitError("failed when writing to 'git cat-file' stdin: %s"
+                           % self.process.stdout.read())
+
+    def __read(self, sha1):
+        stdout = self.process.stdout
+        line = stdout.readline()
+
+        if line in ("%s missing\n" % sha1, "%s ambiguous\n" % sha1):
+            return None
+
+        try:
+            object_sha1, object_type, object_size = line.split()
+            object_size = int(object_size)
+        except ValueError:
+            self.broken = True
+            raise GitError("unexpected output from 'git cat-file --batch': %s"
+                           % line)
+
+        if self.check:
+            object_data = None
+        else:
+            object_data = stdout.read(object_size)
+            stdout.read(1)
+
+            if len(object_data) != object_size:
+                self.broken = True
+                raise GitError("truncated output from 'git cat-file --batch'")
+
+        return GitObject(object_sha1, object_type, object_size, object_data)
+
+    def fetch(self, sha1):
+        """Fetch a single object, or return None if it is missing"""
+        self.__write(sha1 + "\n")
+        return self.__read(sha1)
+
+    def fetchMany(self, sha1s):
+        """Fetch multiple objects, yielding each (or None) in order
+
+           All SHA-1s are written to the process by a separate thread, so that
+           git never has to wait for us to ask for the next object."""
+        sha1s = list(sha1s)
+
+        if not sha1s:
+            return
+
+        def write():
+            try:
+                self.process.stdin.write("".join(sha1 + "\n" for sha1 in sha1s))
+            except:
+                self.broken = True
+
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+
+        remaining = len(sha1s)
+
+        try:
+            for sha1 in sha1s:
+                if self.broken:
+                    raise GitError("failed when writing to 'git cat-file' stdin")
+                git_object = self.__read(sha1)
+                remaining -= 1
+                yield git_object
+        except GeneratorExit:
+            # If the caller stopped iterating before we read all replies, the
+            # process' output is no longer in sync with its input.
+            if remaining:
+                self.broken = True
+            raise
+        finally:
+            writer.join()
+
+class CatFilePool(object):
+    """Per-process pool of long-lived 'git cat-file' processes
+
+       Processes are keyed by repository path and mode (--batch or
+       --batch-check), checked out for exclusive use by a single thread, and
+       returned to the pool afterwards.  Processes that have died or whose
+       protocol state is unknown are discarded, and processes that have been
+       idle for longer than the configured timeout are terminated."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__pid = os.getpid()
+
+    def __maxIdle(self):
+        return configuration.limits.GIT_BATCH_POOL_SIZE
+
+    def __idleTimeout(self):
+        return configuration.limits.GIT_BATCH_IDLE_TIMEOUT
+
+    def __checkFork(self):
+        # Processes started by our parent process share pipes with it; never
+        # use them in a forked child.  Note: the processes are not ours to
+        # terminate either, so just forget about them.
+        if self.__pid != os.getpid():
+            self.__idle = {}
+            self.__pid = os.getpid()
+
+    def __expire(self, now):
+        expired = []
+        deadline = now - self.__idleTimeout()
+        for key, processes in self.__idle.items():
+            keep = []
+            for process in processes:
+                if process.last_used < deadline:
+                    expired.append(process)
+                else:
+                    keep.append(process)
+            if keep:
+                self.__idle[key] = keep
+            else:
+                del self.__idle[key]
+        return expired
+
+    def __acquire(self, key):
+        discard = []
+        process = None
+
+        with self.__lock:
+            self.__checkFork()
+            discard.extend(self.__expire(time.time()))
+            processes = self.__idle.get(key, [])
+            while processes:
+                candidate = processes.pop()
+                if candidate.isAlive():
+                    process = candidate
+                    break
+                discard.append(candidate)
+
+        map(CatFileProcess.terminate, discard)
+
+        if process is None:
+            process = CatFileProcess(*key)
+
+        return process
+
+    def __release(self, key, process):
+        with self.__lock:
+            if process.isAlive() and self.__pid == os.getpid():
+                processes = self.__idle.setdefault(key, [])
+                if len(processes) < self.__maxIdle():
+                    process.last_used = time.time()
+                    processes.append(process)
+                    return
+
+        process.terminate()
+
+    @contextlib.contextmanager
+    def checkout(self, path, check=False):
+        key = (path, check)
+        process = self.__acquire(key)
+        try:
+            yield process
+        except GeneratorExit:
+            # The caller is a generator, such as Repository.fetchMany(), that
+            # was closed.  This is a normal way to stop, and if it happened
+            # while reading the output of CatFileProcess.fetchMany(), closing
+            # that generator has already marked the process as broken.
+            raise
+        except:
+            # The process' protocol state is unknown, for instance if the
+            # caller stopped reading the output of fetchMany(), so make sure it
+            # is never reused.
+            process.broken = True
+            raise
+        finally:
+            self.__release(key, process)
+
+    def evict(self, path=None):
+        """Terminate idle processes for |path|, or for all repositories"""
+        discard = []
+        with self.__lock:
+            self.__checkFork()
+            for key in self.__idle.keys():
+                if path is None or key[0] == path:
+                    discard.extend(self.__idle.pop(key))
+        map(CatFileProcess.terminate, discard)
+
+CAT_FILE_POOL = CatFilePool()
+
+atexit.register(CAT_FILE_POOL.evict)
+
 class Repository:
     class FromParameter:
         def __init__(self, db): self.db = db
@@ -142,17 +445,10 @@ class Repository:
         self.path = path
         self.parent = parent
 
-        self.__batch = None
-        self.__batchCheck = None
         self.__cacheBlobs = False
         self.__cacheDisabled = False
-
-        if db:
-            self.__db = db
-            db.atexit(self.__terminate)
-        else:
-            self.__db = None
-            atexit.register(self.__terminate)
+        self.__db = db
+        self.__resolvedCommits = {}
 
     def __str__(self):
         return self.path
@@ -255,36 +551,12 @@ class Repository:
     def fromAPI(api_repository):
         return api_repository._impl.getInternal(api_repository.critic)
 
-    def __terminate(self, db=None):
-        self.stopBatch()
-
-    def __startBatch(self):
-        if self.__batch is None:
-            self.__batch = subprocess.Popen(
-                [configuration.executables.GIT, 'cat-file', '--batch'],
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, cwd=self.path)
-
-    def __startBatchCheck(self):
-        if self.__batchCheck is None:
-            self.__batchCheck = subprocess.Popen(
-                [configuration.executables.GIT, 'cat-file', '--batch-check'],
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, cwd=self.path)
-
     def stopBatch(self):
-        if self.__batch:
-            try: os.kill(self.__batch.pid, 9)
-            except: pass
-            try: self.__batch.wait()
-            except: pass
-            self.__batch = None
-        if self.__batchCheck:
-            try: os.kill(self.__batchCheck.pid, 9)
-            except: pass
-            try: self.__batchCheck.wait()
-            except: pass
-            self.__batchCheck = None
+        """Terminate idle pooled 'git cat-file' processes for this repository
+
+           Processes currently checked out by other threads are unaffected, but
+           will not be returned to the pool once they are released."""
+        CAT_FILE_POOL.evict(self.path)
 
     @staticmethod
     def forEach(db, fn):
@@ -326,54 +598,134 @@ class Repository:
         else:
             return None
 
-    def fetch(self, sha1, fetchData=True):
-        if self.__db:
-            cache = self.__db.storage["Repository"]
-            cached_object = cache.get("object:" + sha1)
-            if cached_object:
-                self.__db.recordProfiling("fetch: " + cached_object.type + " (cached)", 0)
-                return cached_object
+    def __getCached(self, sha1, fetchData):
+        if not self.__db or self.__cacheDisabled:
+            return None
 
-        before = time.time()
+        def usable(git_object):
+            # Objects fetched using 'git cat-file --batch-check' are cached
+            # without data, and can't be used when data is requested.
+            return git_object is not None \
+                and (git_object.data is not None or not fetchData)
 
-        if fetchData:
-            self.__startBatch()
-            stdin, stdout = self.__batch.stdin, self.__batch.stdout
-        else:
-            self.__startBatchCheck()
-            stdin, stdout = self.__batchCheck.stdin, self.__batchCheck.stdout
+        cached_object = getObjectCache(self.__db).get(sha1)
+        if usable(cached_object):
+            self.__db.recordProfiling("fetch: " + cached_object.type + " (cached)", 0)
+            return cached_object
 
-        try: stdin.write(sha1 + '\n')
-        except: raise GitError("failed when writing to 'git cat-file' stdin: %s" % stdout.read())
+        cached_object = SHARED_OBJECT_CACHE.get((self.path, sha1))
+        if usable(cached_object):
+            self.__db.recordProfiling("fetch: " + cached_object.type + " (shared cache)", 0)
+            self.__setCached(cached_object, shared=False)
+            return cached_object
 
-        line = stdout.readline()
+        return None
 
-        if line == ("%s missing\n" % sha1):
-            raise GitReferenceError("%s missing from %s" % (sha1[:8], self.path), sha1=sha1, repository=self)
+    def __setCached(self, git_object, shared=True):
+        if not self.__db or self.__cacheDisabled:
+            return
+        # Blob data is only cached on request, but since objects fetched
+        # without data are small, they are always cached.
+        if git_object.type == "blob" and git_object.data is not None \
+                and not self.__cacheBlobs:
+            return
 
-        try: sha1, type, size = line.split()
-        except: raise GitError("unexpected output from 'git cat-file --batch': %s" % line)
+        def insert(cache, key):
+            evicted = cache.set(key, git_object)
+            if evicted:
+                self.__db.recordProfiling(
+                    "object cache: evicted", 0, repetitions=evicted)
 
-        size = int(size)
+        insert(getObjectCache(self.__db), git_object.sha1)
+        if shared:
+            insert(SHARED_OBJECT_CACHE, (self.path, git_object.sha1))
 
-        if fetchData:
-            data = stdout.read(size)
-            stdout.read(1)
-        else:
-            data = None
+    def fetch(self, sha1, fetchData=True):
+        cached_object = self.__getCached(sha1, fetchData)
+        if cached_object:
+            return cached_object
+
+        before = time.time()
 
-        git_object = GitObject(sha1, type, size, data)
+        with CAT_FILE_POOL.checkout(self.path, check=not fetchData) as process:
+            git_object = process.fetch(sha1)
+
+        if git_object is None:
+            raise GitReferenceError("%s missing from %s" % (sha1[:8], self.path), sha1=sha1, repository=self)
 
         after = time.time()
 
-        if not self.__cacheDisabled and (type != "blob" or self.__cacheBlobs):
-            cache["object:" + sha1] = git_object
+        self.__setCached(git_object)
 
         if self.__db:
-            self.__db.recordProfiling("fetch: " + type, after - before)
+            self.__db.recordProfiling("fetch: " + git_object.type, after - before)
 
         return git_object
 
+    def fetchMany(self, sha1s, fetch_data=True):
+        """Fetch multiple objects, yielding them in the order requested
+
+           All objects not already cached are requested from a single
+           'git cat-file --batch' process in one go, and the replies are
+           streamed back as they arrive, so that at most one object (plus any
+           that were requested more than once) is held in memory at a time.
+
+           Raises GitReferenceError when a missing object is reached."""
+
+        sha1s = list(sha1s)
+        remaining = {}
+        pending = []
+
+        for sha1 in sha1s:
+            if sha1 not in remaining and not self.__getCached(sha1, fetch_data):
+                pending.append(sha1)
+            remaining[sha1] = remaining.get(sha1, 0) + 1
+
+        pending_set = set(pending)
+
+        if not sha1s:
+            return
+
+        before = time.time()
+        held = {}
+
+        with CAT_FILE_POOL.checkout(self.path, check=not fetch_data) as process:
+            fetched = process.fetchMany(pending)
+
+            try:
+                for sha1 in sha1s:
+                    remaining[sha1] -= 1
+
+                    if sha1 in pending_set:
+                        pending_set.remove(sha1)
+                        git_object = next(fetched)
+
+                        if git_object is None:
+                            raise GitReferenceError(
+                                "%s missing from %s" % (sha1[:8], self.path),
+                                sha1=sha1, repository=self)
+
+                        self.__setCached(git_object)
+
+                        if remaining[sha1]:
+                            held[sha1] = git_object
+                    else:
+                        git_object = (held.get(sha1)
+                                      or self.fetch(sha1, fetchData=fetch_data))
+
+                        if not remaining[sha1]:
+                            held.pop(sha1, None)
+
+                    yield git_object
+            finally:
+                fetched.close()
+
+        after = time.time()
+
+        if self.__db:
+            self.__db.recordProfiling("fetchMany", after - before,
+                                      rows=len(pending))
+
     def run(self, command, *arguments, **kwargs):
         return self.runCustom(self.path, command, *arguments, **kwargs)
 
@@ -404,6 +756,35 @@ class Repository:
         else:
             return git.returncode, stdout, stderr
 
+    def runLines(self, command, *arguments):
+        """Run a Git command and yield its output line by line
+
+           Unlike run(), the output is read incrementally, so it is never held
+           in memory all at once.  Line breaks are stripped.  GitCommandError
+           is raised (after the last line) if the command fails."""
+
+        argv = [configuration.executables.GIT, command]
+        argv.extend(arguments)
+        env = {}
+        env.update(os.environ)
+        env.update(configuration.executables.GIT_ENV)
+        if "GIT_DIR" in env: del env["GIT_DIR"]
+        git = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, cwd=self.path, env=env)
+        finished = False
+        try:
+            for line in iter(git.stdout.readline, ""):
+                if line[-1] == "\n":
+                    line = line[:-1]
+                yield line
+            finished = True
+        finally:
+            git.stdout.close()
+            stderr = git.stderr.read()
+            git.wait()
+        if finished and git.returncode != 0:
+            raise GitCommandError(" ".join(argv), stderr.strip(), self.path)
+
     def createBranch(self, name, startpoint):
         argv = [configuration.executables.GIT, 'branch', name, startpoint]
         git = subprocess.Popen(argv, stdout=subprocess.PIPE,
@@ -440,6 +821,17 @@ class Repository:
 
         assert len(sha1s) >= 2
 
+        db = db or self.__db
+
+        if db:
+            # Ask the in-memory ancestry graph first.  It doesn't know about
+            # commits not yet added to the database, and doesn't distinguish
+            # that from there being no common ancestor, so let Git handle both.
+            import dbutils.ancestry
+            mergebase_sha1 = dbutils.ancestry.mergeBase(db, sha1s)
+            if mergebase_sha1 is not None:
+                return mergebase_sha1
+
         argv = [configuration.executables.GIT, 'merge-base'] + sha1s
         git = subprocess.Popen(argv, stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE, cwd=self.path)
@@ -450,6 +842,28 @@ class Repository:
             output = stderr.strip()
             raise GitCommandError(cmdline, output, self.path)
 
+    def isAncestor(self, ancestor_sha1, descendant_sha1):
+        """Return true if |ancestor_sha1| is an ancestor of |descendant_sha1|
+
+           A commit is considered to be an ancestor of itself."""
+
+        if self.__db:
+            import dbutils.ancestry
+            result = dbutils.ancestry.isAncestor(
+                self.__db, ancestor_sha1, descendant_sha1)
+            if result is not None:
+                return result
+
+        try:
+            mergebase_sha1 = self.mergebase([ancestor_sha1, descendant_sha1])
+        except GitCommandError:
+            # Merge-base fails if there is no common ancestor.  And if two
+            # commits have no common ancestor, neither can be an ancestor of the
+            # other, obviously.
+            return False
+        else:
+            return mergebase_sha1 == ancestor_sha1
+
     def getCommonAncestor(self, commit_or_commits):
         try: sha1s = commit_or_commits.parents
         except: sha1s = list(commit_or_commits)
@@ -486,6 +900,31 @@ class Repository:
         if git.returncode == 0: return stdout.strip() == "commit"
         else: return False
 
+    def resolveCommits(self, names):
+        """Return a dictionary mapping names of commits to their full SHA-1s
+
+           Names that don't refer to commits (e.g. missing or ambiguous
+           abbreviated SHA-1s) are left out.  All names not looked up before
+           are resolved using a single 'git cat-file --batch-check' request,
+           and the results are remembered for the lifetime of this object."""
+
+        resolved = self.__resolvedCommits
+        pending = [name for name in set(names)
+                   if name not in resolved
+                   # Anything else would break the --batch-check protocol.
+                   and name and not any(c.isspace() for c in name)]
+
+        if pending:
+            with CAT_FILE_POOL.checkout(self.path, check=True) as process:
+                for name, git_object in zip(pending, list(process.fetchMany(pending))):
+                    if git_object is not None and git_object.type == "commit":
+                        resolved[name] = git_object.sha1
+                    else:
+                        resolved[name] = None
+
+        return dict((name, resolved[name]) for name in names
+                    if resolved.get(name))
+
     def createref(self, name, value):
         assert name.startswith("refs/")
         self.run("update-ref", name, str(value), "0" * 40)
@@ -798,6 +1237,14 @@ class Repository:
 
     @staticmethod
     def readObject(repository_path, object_type, object_sha1):
+        if re_sha1.match(object_sha1):
+            with CAT_FILE_POOL.checkout(repository_path) as process:
+                git_object = process.fetch(object_sha1)
+            if git_object and git_object.type == object_type:
+                return git_object.data
+
+        # Fall back to running 'git cat-file <type> <object>', which peels tags
+        # and produces a proper error message for missing objects.
         argv = [configuration.executables.GIT, 'cat-file', object_type, object_sha1]
         git = subprocess.Popen(argv, stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE, cwd=repository_path)
@@ -1038,7 +1485,12 @@ class Commit:
         cache[self.sha1] = self
 
     @staticmethod
-    def fromGitObject(db, repository, gitobject, commit_id=None):
+    def parseHeaders(gitobject):
+        """Parse a commit object's headers
+
+           Returns a tuple (tree, parents, author, committer, message_data)
+           where |message_data| is the undecoded commit message."""
+
         assert gitobject.type == "commit"
 
         data = gitobject.data
@@ -1057,6 +1509,12 @@ class Commit:
             elif key == 'author': author = CommitUserTime.fromValue(value)
             elif key == 'committer': committer = CommitUserTime.fromValue(value)
 
+        return tree, parents, author, committer, data
+
+    @staticmethod
+    def fromGitObject(db, repository, gitobject, commit_id=None):
+        tree, parents, author, committer, data = Commit.parseHeaders(gitobject)
+
         message = textutils.decode(data).encode("utf-8")
 
         commit = Commit(repository, commit_id, gitobject.sha1, parents, author,
@@ -1157,15 +1615,7 @@ class Commit:
         else:
             other_sha1 = str(other)
 
-        try:
-            mergebase_sha1 = self.repository.mergebase([self.sha1, other_sha1])
-        except GitCommandError:
-            # Merge-base fails if there is no common ancestor.  And if two
-            # commits have no common ancestor, neither can be an ancestor of the
-            # other, obviously.
-            return False
-        else:
-            return mergebase_sha1 == self.sha1
+        return self.repository.isAncestor(self.sha1, other_sha1)
 
     def getTree(self, path):
         path = "/" + path.lstrip("/")
@@ -1192,8 +1642,8 @@ RE_LSTREE_LINE = re.compile(
     "(?P<mode>[0-9]{6}) (?P<type>blob|tree|commit) (?P<sha1>[0-9a-f]{40}) +"
     "(?P<size>[0-9]+|-)\t(?P<quote>[\"']?)(?P<name>.*)(?P=quote)$")
 
-class Tree:
-    class Entry:
+class Tree(object):
+    class Entry(object):
         class Mode(int):
             def __new__(cls, value):
                 return super(Tree.Entry.Mode, cls).__new__(cls, int(value, 8))
@@ -1210,7 +1660,7 @@ class Tree:
                     flags = ["---", "--x", "-w-", "-wx", "r--", "r-x", "rw-", "rwx"]
                     return string + flags[(self & 0700) >> 6] + flags[(self & 070) >> 3] + flags[self & 07]
 
-        def __init__(self, name, mode, type, sha1, size):
+        def __init__(self, name, mode, type, sha1, size, lookup_size=None):
             if len(name) > 2 and name[0] in ('"', "'") and name[-1] == name[0]:
                 name = diff.parse.demunge(name[1:-1])
 
@@ -1218,7 +1668,15 @@ class Tree:
             self.mode = Tree.Entry.Mode(mode)
             self.type = type
             self.sha1 = sha1
-            self.size = size
+            self.__size = size
+            self.__lookup_size = lookup_size
+
+        @property
+        def size(self):
+            if self.__lookup_size is not None:
+                self.__size = self.__lookup_size(self.sha1)
+                self.__lookup_size = None
+            return self.__size
 
         def __str__(self):
             return self.name
@@ -1226,6 +1684,15 @@ class Tree:
         def __repr__(self):
             return "[%s %s %s %s%s]" % (self.mode, self.type, self.name, self.sha1[:8], " %d" % self.size if self.size else "")
 
+    class Parsed(object):
+        """Entries of a tree object, as cached in SHARED_OBJECT_CACHE"""
+
+        def __init__(self, sha1, data, entries):
+            self.sha1 = sha1
+            # Only used by ObjectCache to estimate the size.
+            self.data = data
+            self.entries = entries
+
     def __init__(self, entries, commit=None):
         self.__entries_list = entries
         self.__entries_dict = dict([(entry.name, entry) for entry in entries])
@@ -1292,27 +1759,69 @@ class Tree:
         return Tree(entries)
 
     @staticmethod
-    def fromSHA1(repository, sha1):
-        data = repository.fetch(sha1).data
+    def parse(data):
+        """Parse a raw tree object into a list of (name, mode, type, sha1)
+
+           The entry type is derived from the mode, so no other objects need to
+           be looked up."""
+
         entries = []
+        offset = 0
+        length = len(data)
 
-        while len(data):
-            space = data.index(" ")
+        while offset < length:
+            space = data.index(" ", offset)
             null = data.index("\0", space + 1)
 
-            mode = data[:space]
-            name = data[space + 1:null]
+            mode = data[offset:space]
 
-            sha1_binary = data[null + 1:null + 21]
-            sha1 = "".join([("%02x" % ord(c)) for c in sha1_binary])
+            if mode == "40000":
+                entry_type = "tree"
+            elif mode == "160000":
+                entry_type = "commit"
+            else:
+                entry_type = "blob"
 
-            entry_object = repository.fetch(sha1, fetchData=False)
+            entries.append((data[space + 1:null],
+                            mode,
+                            entry_type,
+                            data[null + 1:null + 21].encode("hex")))
 
-            entries.append(Tree.Entry(name, mode, entry_object.type, sha1, entry_object.size))
+            offset = null + 21
 
-            data = data[null + 21:]
+        return entries
 
-        return Tree(entries)
+    @staticmethod
+    def fromSHA1(repository, sha1):
+        """Return the tree object |sha1| in |repository|
+
+           Parsed trees are kept in the process-wide object cache.  Sizes of
+           blobs are fetched on demand; sizes of other entries are None."""
+
+        key = (repository.path, sha1, "parsed")
+        parsed = SHARED_OBJECT_CACHE.get(key)
+
+        if parsed is None:
+            git_object = repository.fetch(sha1)
+            if git_object.type != "tree":
+                raise GitError("%s is a %s, not a tree" % (sha1[:8], git_object.type))
+            parsed = Tree.Parsed(sha1, git_object.data, Tree.parse(git_object.data))
+            SHARED_OBJECT_CACHE.set(key, parsed)
+
+        sizes = {}
+
+        def lookupSize(blob_sha1):
+            if not sizes:
+                # Fetch the sizes of all blobs in the tree at once.
+                blob_sha1s = [entry_sha1 for _, _, entry_type, entry_sha1
+                              in parsed.entries if entry_type == "blob"]
+                for git_object in repository.fetchMany(blob_sha1s, fetch_data=False):
+                    sizes[git_object.sha1] = git_object.size
+            return sizes[blob_sha1]
+
+        return Tree([Tree.Entry(name, mode, entry_type, entry_sha1, None,
+                                lookupSize if entry_type == "blob" else None)
+                     for name, mode, entry_type, entry_sha1 in parsed.entries])
 
 def getTaggedCommit(repository, sha1):
     """Returns the SHA-1 of the tagged commit.
@@ -1402,32 +1911,24 @@ class FetchCommits(threading.Thread):
 
     def run(self):
         try:
-            batch = subprocess.Popen(
-                [configuration.executables.GIT, 'cat-file', '--batch'],
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, cwd=self.repository.path)
-
-            stdout, stderr = batch.communicate("\n".join(self.sha1s.keys()) + "\n")
-
             gitobjects = []
 
-            for sha1, commit_id in self.sha1s.items():
-                line, stdout = stdout.split("\n", 1)
+            with CAT_FILE_POOL.checkout(self.repository.path) as process:
+                sha1s = self.sha1s.keys()
+                fetched = process.fetchMany(sha1s)
 
                 try:
-                    object_sha1, object_type, object_size = line.split(" ")
-                except ValueError:
-                    raise SyntaxError("unexpected line: %r" % line)
-
-                assert object_sha1 == sha1, "%s != %s" % (object_sha1, sha1)
-                assert object_type == "commit"
-
-                object_size = int(object_size)
-
-                object_data = stdout[:object_size]
-                stdout = stdout[object_size + 1:]
-
-                gitobjects.append((GitObject(object_sha1, object_type, object_size, object_data), commit_id))
+                    for index, gitobject in enumerate(fetched):
+                        sha1 = sha1s[index]
+                        assert gitobject is not None, "%s missing" % sha1
+                        assert gitobject.sha1 == sha1, "%s != %s" % (gitobject.sha1, sha1)
+                        assert gitobject.type == "commit"
+
+                        gitobjects.append((gitobject, self.sha1s[sha1]))
+                finally:
+                    # Close the generator before the process is returned to
+                    # the pool, so that an incomplete read marks it broken.
+                    fetched.close()
 
             self.gitobjects = gitobjects
         except Exception:
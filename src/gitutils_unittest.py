@@ -51,3 +51,178 @@ def keepalives():
                                              % (chain_before, chain_after))
 
     print "keepalives: ok"
+
+def trees():
+    # Check that Tree.fromSHA1(), which parses raw tree objects, agrees with
+    # 'git ls-tree -l'.
+
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    import gitutils
+
+    path = tempfile.mkdtemp()
+
+    try:
+        def git(*args, **kwargs):
+            return subprocess.check_output(("git",) + args, cwd=path, **kwargs)
+
+        git("init", "--quiet")
+        os.mkdir(os.path.join(path, "dir"))
+        for index in range(100):
+            with open(os.path.join(path, "file%d" % index), "w") as file:
+                file.write("x" * index)
+        with open(os.path.join(path, "dir", "with space"), "w") as file:
+            file.write("contents\n")
+        os.chmod(os.path.join(path, "file1"), 0755)
+        os.symlink("file2", os.path.join(path, "link"))
+        git("add", ".")
+        git("update-index", "--add", "--cacheinfo",
+            "160000,%s,submodule" % ("1" * 40))
+        tree_sha1 = git("write-tree").strip()
+
+        repository = gitutils.Repository(path=path)
+        tree = gitutils.Tree.fromSHA1(repository, tree_sha1)
+
+        expected = []
+        for line in git("ls-tree", "-l", tree_sha1).splitlines():
+            match = gitutils.RE_LSTREE_LINE.match(line)
+            size = match.group("size")
+            expected.append((match.group("name"),
+                             int(match.group("mode"), 8),
+                             match.group("type"),
+                             match.group("sha1"),
+                             None if size == "-" else int(size)))
+
+        actual = [(entry.name, entry.mode, entry.type, entry.sha1, entry.size)
+                  for entry in tree]
+
+        assert actual == expected, "%r != %r" % (actual, expected)
+        assert tree["dir"].type == "tree"
+        assert tree["file1"].mode == 0100755
+
+        # Parsed trees are cached, but entries (and their sizes) are not
+        # shared between calls.
+        tree_again = gitutils.Tree.fromSHA1(repository, tree_sha1)
+        assert tree_again["file7"] is not tree["file7"]
+        assert tree_again["file7"].size == 7
+
+        subtree = gitutils.Tree.fromSHA1(repository, tree["dir"].sha1)
+        assert subtree.keys() == ["with space"]
+        assert subtree["with space"].size == 9
+    finally:
+        shutil.rmtree(path)
+
+    print "trees: ok"
+
+def catfilepool():
+    # Check that 'git cat-file' processes whose output was not fully read are
+    # never returned to the pool.
+
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    import diff
+    import gitutils
+
+    path = tempfile.mkdtemp()
+
+    try:
+        def git(*args):
+            return subprocess.check_output(("git",) + args, cwd=path)
+
+        git("init", "--quiet")
+        filenames = []
+        for index in range(10):
+            filename = os.path.join(path, "file%d" % index)
+            with open(filename, "w") as file:
+                file.write("contents %d\n" % index)
+            filenames.append(filename)
+        sha1s = git("hash-object", "-w", *filenames).split()
+
+        pool = gitutils.CatFilePool()
+
+        # Stop reading half-way by raising an exception.
+        try:
+            with pool.checkout(path) as process:
+                fetched = process.fetchMany(sha1s)
+                try:
+                    for index, git_object in enumerate(fetched):
+                        if index == 4:
+                            raise Exception("stop")
+                finally:
+                    fetched.close()
+        except Exception as error:
+            assert str(error) == "stop"
+        else:
+            assert False, "exception not raised"
+
+        assert process.broken
+        assert process.process.poll() is not None
+
+        # Any exception discards the process, even if its output was read.
+        try:
+            with pool.checkout(path) as process:
+                assert process.fetch(sha1s[0]).data == "contents 0\n"
+                raise Exception("stop")
+        except Exception:
+            pass
+
+        assert process.process.poll() is not None
+
+        # Complete reads return the process to the pool.
+        with pool.checkout(path) as process:
+            data = [git_object.data for git_object in process.fetchMany(sha1s)]
+            assert data == ["contents %d\n" % index for index in range(10)]
+
+        with pool.checkout(path) as process_again:
+            assert process_again is process
+            assert process.fetch(sha1s[9]).data == "contents 9\n"
+
+        pool.evict()
+
+        # Loading the lines of files reads all objects, and returns the process
+        # used to the (global) pool.
+        repository = gitutils.Repository(path=path)
+        files = [diff.File(None, "file%d" % index, sha1s[index],
+                           sha1s[index + 5], repository)
+                 for index in range(5)]
+
+        with gitutils.CAT_FILE_POOL.checkout(path) as process:
+            pass
+
+        diff.File.loadPlainLines(files)
+
+        assert not process.broken
+        with gitutils.CAT_FILE_POOL.checkout(path) as process_again:
+            assert process_again is process
+
+        for index, file in enumerate(files):
+            assert list(file.old_plain) == ["contents %d" % index]
+            assert list(file.new_plain) == ["contents %d" % (index + 5)]
+
+        # Closing a Repository.fetchMany() generator after the last object was
+        # read also leaves the process usable, but closing it earlier doesn't.
+        fetched = repository.fetchMany(sha1s[:3])
+        assert len([next(fetched) for _ in range(3)]) == 3
+        fetched.close()
+
+        with gitutils.CAT_FILE_POOL.checkout(path) as process_again:
+            assert process_again is process
+
+        fetched = repository.fetchMany(sha1s[:3])
+        next(fetched)
+        fetched.close()
+
+        assert process.broken
+        assert process.process.poll() is not None
+
+        gitutils.CAT_FILE_POOL.evict()
+    finally:
+        shutil.rmtree(path)
+
+    print "catfilepool: ok"
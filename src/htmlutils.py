@@ -24,13 +24,7 @@ import textutils
 
 from cStringIO import StringIO
 
-from linkify import ALL_LINKTYPES, Context
-
-fragments = []
-for linktype in ALL_LINKTYPES:
-    if linktype.fragment:
-        fragments.append(linktype.fragment)
-re_linkify = re.compile("(?:^|\\b|(?=\\W))(" + "|".join(fragments) + ")([.,:;!?)]*(?:\\s|\\b|$))")
+from linkify import ALL_LINKTYPES, Context, re_linkify
 
 re_simple = re.compile("^[^ \t\r\n&<>/=`'\"]+$")
 re_nonascii = re.compile("[^\t\n\r -\x7f]")
@@ -477,6 +471,8 @@ class Generator(object):
             else:
                 context = Context(repository=repository)
 
+            context.prefetch([value])
+
             for linktype in ALL_LINKTYPES:
                 if linktype.match(value):
                     url = linktype.linkify(value, context)
@@ -26,6 +26,7 @@ import gitutils
 from log.commitset import CommitSet
 
 import dbutils
+import dbutils.ancestry
 import reviewing.utils
 import reviewing.mail
 import reviewing.rebase
@@ -53,15 +54,54 @@ def timestamp(time):
 class IndexException(Exception):
     pass
 
+# Number of SHA-1s or rows handled per query when processing commits.  Kept well
+# below 999, SQLite's default limit on the number of parameters in a query,
+# since the quick-start driver turns '=ANY (%s)' into 'IN (?, ?, ...)'.
+PROCESS_COMMITS_BATCH_SIZE = 500
+
+def batches(values, size=PROCESS_COMMITS_BATCH_SIZE):
+    for offset in xrange(0, len(values), size):
+        yield values[offset:offset + size]
+
+def getGitUserIds(db, users):
+    """Return a dictionary mapping (fullname, email) pairs to gituser ids
+
+       Existing gitusers rows are looked up with a single query per batch, and
+       rows are inserted for the ones that don't exist yet."""
+
+    cursor = db.cursor()
+    gituser_ids = {}
+    emails = list(set(email for _, email in users))
+
+    for emails_batch in batches(emails):
+        cursor.execute("""SELECT id, fullname, email
+                            FROM gitusers
+                           WHERE email=ANY (%s)""",
+                       (emails_batch,))
+        for gituser_id, fullname, email in cursor:
+            gituser_ids[(fullname, email)] = gituser_id
+
+    for fullname, email in users:
+        if (fullname, email) not in gituser_ids:
+            cursor.execute("""INSERT INTO gitusers (fullname, email)
+                                   VALUES (%s, %s)
+                                RETURNING id""",
+                           (fullname, email))
+            gituser_ids[(fullname, email)] = cursor.fetchone()[0]
+
+    return gituser_ids
+
 def processCommits(db, repository, sha1):
     sha1 = repository.run("rev-parse", "--verify", "--quiet", sha1 + "^{commit}").strip()
 
-    stack = []
-    edges_values = []
-
     cursor = db.cursor()
-    cursor.execute("SELECT 1 FROM commits LIMIT 1")
-    emptydb = cursor.fetchone() is None
+    cursor.execute("SELECT 1 FROM commits WHERE sha1=%s", (sha1,))
+
+    if cursor.fetchone():
+        # Since we always add all ancestors of a commit along with it, there's
+        # nothing to do if the commit has been added already.
+        db.commit()
+        return
 
     cursor.execute("""SELECT commits.sha1
                         FROM commits
@@ -83,52 +123,89 @@ def processCommits(db, repository, sha1):
 You're trying to add %d new commits to this repository.  Are you
 perhaps pushing to the wrong repository?""" % count)
 
-    commits_values = []
-    commits = set()
+    # All commits reachable from the heads of any repository's branches have
+    # already been added, so exclude them up front.  This includes other
+    # repositories' branches, since the history is often shared (by forks, or
+    # when a repository has no branches yet.)  Branch heads missing from this
+    # repository are ignored.
+    cursor.execute("""SELECT DISTINCT commits.sha1
+                        FROM commits
+                        JOIN branches ON (branches.head=commits.id)""")
 
-    while True:
-        if sha1 not in commits:
-            commit = gitutils.Commit.fromSHA1(db, repository, sha1)
+    revisions = [sha1] + ["^" + head_sha1 for (head_sha1,) in cursor]
+    candidate_sha1s = repository.run(
+        "rev-list", "--ignore-missing", "--stdin",
+        input="\n".join(revisions) + "\n").split()
 
-            if commit.author.email: author_id = commit.author.getGitUserId(db)
-            else: author_id = 0
+    # Commits no longer reachable from any branch (for instance if the branch
+    # was deleted) are listed again, so check which ones already exist.
+    existing_sha1s = set()
+    for sha1s_batch in batches(candidate_sha1s):
+        cursor.execute("SELECT sha1 FROM commits WHERE sha1=ANY (%s)",
+                       (sha1s_batch,))
+        existing_sha1s.update(existing_sha1 for (existing_sha1,) in cursor)
 
-            if commit.committer.email: committer_id = commit.committer.getGitUserId(db)
-            else: committer_id = 0
+    new_sha1s = [candidate_sha1 for candidate_sha1 in candidate_sha1s
+                 if candidate_sha1 not in existing_sha1s]
 
-            if emptydb: row = None
-            else:
-                cursor.execute("SELECT id FROM commits WHERE sha1=%s", (commit.sha1,))
-                row = cursor.fetchone()
-                new_commit = False
+    commits_values = []
+    edges_values = []
+    users = set()
 
-            if not row:
-                commits_values.append((commit.sha1, author_id, committer_id, timestamp(commit.author.time), timestamp(commit.committer.time)))
-                new_commit = True
+    for gitobject in repository.fetchMany(new_sha1s):
+        _, parents, author, committer, _ = gitutils.Commit.parseHeaders(gitobject)
 
-            commits.add(sha1)
+        if author.email: author_key = (author.name, author.email)
+        else: author_key = None
+
+        if committer.email: committer_key = (committer.name, committer.email)
+        else: committer_key = None
+
+        users.update(filter(None, (author_key, committer_key)))
 
-            if new_commit:
-                edges_values.extend([(parent_sha1, commit.sha1) for parent_sha1 in set(commit.parents)])
-                stack.extend(set(commit.parents))
+        commits_values.append((gitobject.sha1, author_key, committer_key,
+                               timestamp(author.time), timestamp(committer.time)))
+        edges_values.extend((parent_sha1, gitobject.sha1)
+                            for parent_sha1 in set(parents))
 
-        if not stack: break
+    gituser_ids = getGitUserIds(db, users)
+    gituser_ids[None] = 0
 
-        sha1 = stack.pop(0)
+    for commits_batch in batches(commits_values):
+        cursor.executemany("""INSERT INTO commits (sha1, author_gituser, commit_gituser, author_time, commit_time)
+                                   VALUES (%s, %s, %s, %s, %s)""",
+                           [(commit_sha1, gituser_ids[commit_author_key],
+                             gituser_ids[commit_committer_key], author_time, commit_time)
+                            for (commit_sha1, commit_author_key, commit_committer_key,
+                                 author_time, commit_time) in commits_batch])
 
-    cursor.executemany("""INSERT INTO commits (sha1, author_gituser, commit_gituser, author_time, commit_time)
-                               VALUES (%s, %s, %s, %s, %s)""",
-                       commits_values)
+    commit_ids = {}
+    edge_sha1s = list(set(parent_sha1 for parent_sha1, _ in edges_values)
+                      | set(new_sha1s))
 
-    cursor.executemany("""INSERT INTO edges (parent, child)
-                               SELECT parents.id, children.id
-                                 FROM commits AS parents,
-                                      commits AS children
-                                WHERE parents.sha1=%s AND children.sha1=%s""",
-                       edges_values)
+    for sha1s_batch in batches(edge_sha1s):
+        cursor.execute("SELECT id, sha1 FROM commits WHERE sha1=ANY (%s)",
+                       (sha1s_batch,))
+        commit_ids.update((commit_sha1, commit_id)
+                          for commit_id, commit_sha1 in cursor)
+
+    for edges_batch in batches(edges_values):
+        cursor.executemany("""INSERT INTO edges (parent, child)
+                                   VALUES (%s, %s)""",
+                           [(commit_ids[edge_parent_sha1], commit_ids[edge_child_sha1])
+                            for edge_parent_sha1, edge_child_sha1 in edges_batch])
 
     db.commit()
 
+    # Add the new commits to this process' ancestry graph right away, since the
+    # branch updates that follow will ask about them.
+    parent_ids = dict((commit_ids[new_sha1], []) for new_sha1 in new_sha1s)
+    for parent_sha1, child_sha1 in edges_values:
+        parent_ids[commit_ids[child_sha1]].append(commit_ids[parent_sha1])
+    dbutils.ancestry.addCommits(
+        (commit_ids[new_sha1], new_sha1, parent_ids[commit_ids[new_sha1]])
+        for new_sha1 in new_sha1s)
+
 def createBranches(db, user, repository, branches, flags):
     if len(branches) > 1:
         try:
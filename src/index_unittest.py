@@ -0,0 +1,244 @@
+def createRepository(path, count):
+    """Create a repository with |count| commits, and return their SHA-1s
+
+       The history is mostly linear, with a side branch forking off and being
+       merged back every 100 commits.  The SHA-1s are returned in the order the
+       commits were created, that is, parents before children."""
+
+    import os
+    import subprocess
+
+    env = dict(os.environ, GIT_DIR=path)
+
+    subprocess.check_call(["git", "init", "--quiet", "--bare", path], env=env)
+
+    commands = []
+    master = side = None
+
+    for index in range(count):
+        if index % 100 == 50 and master is not None:
+            ref, parents = "refs/heads/side", [master]
+        elif index % 100 == 99 and side is not None:
+            ref, parents = "refs/heads/master", [master, side]
+        else:
+            ref, parents = "refs/heads/master", filter(None, [master])
+
+        message = "commit %d\n" % index
+        signature = "User %d <user%d@example.org> %d +0000" % (
+            index % 7, index % 7, 1500000000 + index)
+
+        commands.append("commit %s\nmark :%d\n" % (ref, index + 1))
+        commands.append("author %s\ncommitter %s\n" % (signature, signature))
+        commands.append("data %d\n%s" % (len(message), message))
+        for offset, parent in enumerate(parents):
+            commands.append("%s :%d\n" % ("merge" if offset else "from", parent))
+        commands.append("\n")
+
+        if ref == "refs/heads/side":
+            side = index + 1
+        else:
+            master = index + 1
+
+    marks = os.path.join(path, "marks")
+    fast_import = subprocess.Popen(
+        ["git", "fast-import", "--quiet", "--export-marks=" + marks],
+        stdin=subprocess.PIPE, env=env)
+    fast_import.communicate("".join(commands))
+    assert fast_import.returncode == 0
+
+    sha1s = {}
+    with open(marks) as marks_file:
+        for line in marks_file:
+            mark, sha1 = line.split()
+            sha1s[int(mark[1:])] = sha1
+
+    return [sha1s[number] for number in sorted(sha1s)]
+
+def createTables(db):
+    # Temporary tables shadow the real tables with the same names, for this
+    # connection only.
+    import dbaccess
+
+    if dbaccess.DRIVER == "postgresql":
+        id_column = "id SERIAL PRIMARY KEY"
+    else:
+        id_column = "id INTEGER PRIMARY KEY"
+
+    cursor = db.cursor()
+    cursor.execute("""CREATE TEMPORARY TABLE gitusers
+                        ( %s, email TEXT, fullname TEXT )""" % id_column)
+    cursor.execute("""CREATE TEMPORARY TABLE commits
+                        ( %s, sha1 TEXT, author_gituser INTEGER,
+                          commit_gituser INTEGER, author_time TIMESTAMP,
+                          commit_time TIMESTAMP )""" % id_column)
+    cursor.execute("""CREATE TEMPORARY TABLE edges
+                        ( parent INTEGER, child INTEGER )""")
+    cursor.execute("""CREATE TEMPORARY TABLE branches
+                        ( id INTEGER, repository INTEGER, head INTEGER,
+                          type TEXT, base INTEGER )""")
+
+def addBranch(db, repository_id, sha1):
+    cursor = db.cursor()
+    cursor.execute("SELECT id FROM commits WHERE sha1=%s", (sha1,))
+    commit_id, = cursor.fetchone()
+    cursor.execute("""INSERT INTO branches (id, repository, head, type, base)
+                           VALUES (%s, %s, %s, 'normal', NULL)""",
+                   (commit_id, repository_id, commit_id))
+
+def existingRows(db):
+    # Number of already added commits that processCommits() checked for.
+    return sum(rows or 0
+               for query, (_, _, _, rows, _) in db.profiling.items()
+               if query.startswith("SELECT sha1 FROM commits"))
+
+def countQueries(db):
+    return sum(count for query, (count, _, _, _, _) in db.profiling.items()
+               if not query.startswith("<"))
+
+def commits():
+    # Check that processCommits() adds exactly the commits and edges that are
+    # missing, and doesn't revisit commits reachable from other repositories'
+    # branches.
+
+    import shutil
+    import subprocess
+    import tempfile
+
+    import api
+    import dbutils
+    import gitutils
+    import index
+
+    path = tempfile.mkdtemp()
+
+    try:
+        sha1s = createRepository(path, 300)
+        repository = gitutils.Repository(repository_id=1, path=path)
+        critic = api.critic.startSession(for_testing=True)
+
+        # Commits are represented as (sha1, sha1) pairs, and edges as (parent
+        # sha1, child sha1) pairs.
+        def expected(sha1):
+            edges = set()
+            for line in subprocess.check_output(
+                    ["git", "rev-list", "--parents", sha1], cwd=path).splitlines():
+                child_sha1 = line.split()[0]
+                edges.add((child_sha1, child_sha1))
+                edges.update((parent_sha1, child_sha1)
+                             for parent_sha1 in line.split()[1:])
+            return edges
+
+        def actual(db):
+            cursor = db.cursor()
+            cursor.execute("SELECT sha1, sha1 FROM commits")
+            edges = set(cursor)
+            cursor.execute("""SELECT parents.sha1, children.sha1
+                                FROM edges
+                                JOIN commits AS parents ON (parents.id=edges.parent)
+                                JOIN commits AS children ON (children.id=edges.child)""")
+            edges.update(cursor)
+            return edges
+
+        with dbutils.Database.forTesting(critic) as db:
+            createTables(db)
+
+            index.processCommits(db, repository, sha1s[199])
+            assert actual(db) == expected(sha1s[199])
+
+            # Commits reachable from another repository's branches are never
+            # listed, and thus not checked for.
+            addBranch(db, 2, sha1s[199])
+            db.profiling.clear()
+
+            index.processCommits(db, repository, sha1s[249])
+            assert actual(db) == expected(sha1s[249])
+            assert existingRows(db) == 0, existingRows(db)
+
+            # Without branches, already added commits are listed, but not added
+            # again.
+            db.cursor().execute("DELETE FROM branches")
+
+            index.processCommits(db, repository, sha1s[299])
+            assert actual(db) == expected(sha1s[299])
+
+            db.rollback()
+    finally:
+        shutil.rmtree(path)
+
+    print "commits: ok"
+
+def benchmark(arguments):
+    # Not run as part of the test suite.  Run manually to measure:
+    #
+    #   python -m run_unittest index_unittest.py benchmark \
+    #       [--sizes=1000,10000,100000]
+    #
+    # For each size N, a repository with N + 200 commits is created, and
+    #
+    #   initial:      the first N commits are added to empty tables,
+    #   known:        100 more are added, with the first N reachable from
+    #                 another repository's branch, and
+    #   unreferenced: the last 100 are added, with no branches at all, which
+    #                 lists all N + 200 commits, and checks which exist.
+
+    import shutil
+    import tempfile
+    import time
+
+    import api
+    import dbutils
+    import gitutils
+    import index
+
+    critic = api.critic.startSession(for_testing=True)
+
+    for size in map(int, arguments.sizes.split(",")):
+        path = tempfile.mkdtemp()
+
+        try:
+            sha1s = createRepository(path, size + 200)
+            repository = gitutils.Repository(repository_id=1, path=path)
+
+            with dbutils.Database.forTesting(critic) as db:
+                createTables(db)
+
+                timings = []
+
+                def measure(label, sha1):
+                    db.profiling.clear()
+                    before = time.time()
+                    index.processCommits(db, repository, sha1)
+                    timings.append((label, time.time() - before,
+                                    countQueries(db), existingRows(db)))
+
+                measure("initial", sha1s[size - 1])
+                addBranch(db, 2, sha1s[size - 1])
+                measure("known", sha1s[size + 99])
+                db.cursor().execute("DELETE FROM branches")
+                measure("unreferenced", sha1s[size + 199])
+
+                db.rollback()
+
+            print "%6d commits: %s" % (size, ", ".join(
+                "%s %.3fs (%d statements, %d existing)" % timing
+                for timing in timings))
+        finally:
+            shutil.rmtree(path)
+
+    print "benchmark: ok"
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("tests", nargs=argparse.REMAINDER)
+
+    arguments = parser.parse_args(argv)
+
+    for test in arguments.tests:
+        if test == "commits":
+            commits()
+        elif test == "benchmark":
+            benchmark(arguments)
@@ -15,6 +15,7 @@
 # the License.
 
 import contextlib
+import hashlib
 import itertools
 import re
 
@@ -23,6 +24,8 @@ import auth
 import request
 import textutils
 
+from textutils import json_encode
+
 class Error(Exception):
     pass
 
@@ -247,7 +250,8 @@ def registerHandler(path, resource_class):
 def PrimaryResource(resource_class):
     assert hasattr(resource_class, "name")
     assert hasattr(resource_class, "value_class")
-    for name in ("single", "multiple", "create", "update", "delete"):
+    for name in ("single", "multiple", "create", "update", "delete", "etag",
+                 "prefetch"):
         if not hasattr(resource_class, name):
             setattr(resource_class, name, None)
     for name in ("exceptions", "objects", "lists", "maps"):
@@ -324,6 +328,7 @@ def sorted_by_id(items):
     return sorted(items, key=lambda item: item.id)
 
 import check
+import cache
 
 from check import convert, ensure
 
@@ -345,6 +350,77 @@ def getAPIVersion(req):
 
     return api_version
 
+def render(req, value):
+    """Return |value| encoded as JSON, formatted as requested by |req|"""
+
+    accept_header = req.getRequestHeader("Accept")
+    if accept_header == "application/vnd.api+json":
+        default_indent = None
+    else:
+        default_indent = 2
+    indent = req.getParameter("indent", default_indent, filter=int)
+    if indent == 0:
+        # json.encode(..., indent=0) still gives line-breaks, just no
+        # indentation.  This is not so useful, so set indent to None instead,
+        # which disables formatting entirely.
+        indent = None
+
+    return json_encode(value, indent=indent)
+
+def computeETag(critic, req, parameters, resource_class, value, values):
+    """Return a strong ETag for the response to a GET request, or None
+
+       Resource classes support ETags by defining an etag() function, called
+       with the same arguments as json() but with both |value| and |values|,
+       that returns a version token that changes whenever the JSON returned by
+       json() would change, or None if the resource can't be versioned.  It
+       must be considerably cheaper than json().
+
+       Resources linked via the "include" parameter must support ETags too, and
+       their versions must be reflected in the version of the resource linking
+       to them."""
+
+    if parameters.debug or not resource_class.etag:
+        return None
+
+    api_version = getAPIVersion(req)
+
+    try:
+        linked_classes = [lookup([api_version, resource_type])
+                          for resource_type in Linked(req).linked_per_type]
+    except PathError:
+        return None
+
+    if not all(linked_class.etag for linked_class in linked_classes):
+        return None
+
+    try:
+        version = resource_class.etag(parameters, value, values)
+    except resource_class.exceptions as error:
+        raise PathError("Resource not found: %s" % error.message)
+
+    if version is None:
+        return None
+
+    if critic.actual_user:
+        user_id = critic.actual_user.id
+    else:
+        user_id = None
+    if critic.access_token:
+        access_token_id = critic.access_token.id
+    else:
+        access_token_id = None
+
+    key = (req.path,
+           sorted(req.getParameters().items()),
+           req.getRequestHeader("Accept"),
+           user_id,
+           sorted(critic.database.authentication_labels),
+           access_token_id,
+           version)
+
+    return '"%s"' % hashlib.sha1(repr(key)).hexdigest()
+
 def finishGET(critic, req, parameters, resource_class, value, values):
     assert (value is None) != (values is None)
 
@@ -354,6 +430,9 @@ def finishGET(critic, req, parameters, resource_class, value, values):
         if values is not None:
             values_json = []
 
+            if resource_class.prefetch:
+                resource_class.prefetch(parameters, values)
+
             for value in values:
                 try:
                     values_json.append(resource_class.json(value, parameters))
@@ -401,6 +480,12 @@ def finishGET(critic, req, parameters, resource_class, value, values):
             for resource_type, linked_values in linked.linked_per_type.items():
                 resource_class = lookup([api_version, resource_type])
 
+                # Let the resource class load whatever all the values need in
+                # bulk, so that the number of queries per linked type and level
+                # doesn't grow with the number of values.
+                if resource_class.prefetch and linked_values:
+                    resource_class.prefetch(parameters, list(linked_values))
+
                 for linked_value in linked_values:
                     try:
                         linked_value_json = resource_class.json(linked_value,
@@ -651,18 +736,40 @@ def handleRequestInternal(critic, req):
         values = list(values)
 
     if req.method == "GET":
-        return finishGET(critic, req, parameters, resource_class, value, values)
+        etag = computeETag(
+            critic, req, parameters, resource_class, value, values)
+        if etag is None:
+            return render(req, finishGET(
+                critic, req, parameters, resource_class, value, values))
+        if etag in cache.parseIfNoneMatch(
+                req.getRequestHeader("If-None-Match")):
+            req.addResponseHeader("ETag", etag)
+            raise request.NotModified()
+        rendered = cache.RENDERED.get(etag)
+        if rendered is None:
+            rendered = render(req, finishGET(
+                critic, req, parameters, resource_class, value, values))
+            cache.RENDERED.set(etag, rendered)
+        # Only add the header once the resource has been rendered successfully,
+        # so that it's never attached to an error response.
+        req.addResponseHeader("ETag", etag)
+        return rendered
     elif req.method == "POST":
-        return finishPOST(
-            critic, req, parameters, resource_class, value, values, data)
+        return render(req, finishPOST(
+            critic, req, parameters, resource_class, value, values, data))
     elif req.method == "PUT":
-        return finishPUT(
-            critic, req, parameters, resource_class, value, values, data)
+        return render(req, finishPUT(
+            critic, req, parameters, resource_class, value, values, data))
     elif req.method == "DELETE":
-        return finishDELETE(
-            critic, req, parameters, resource_class, value, values)
+        return render(req, finishDELETE(
+            critic, req, parameters, resource_class, value, values))
 
 def handleRequest(critic, req):
+    """Handle an API request, and return the rendered JSON response
+
+       Errors are signalled by raising Error (or request.HTTPResponse, for
+       "204 No Content" and "304 Not Modified" responses.)"""
+
     try:
         return handleRequestInternal(critic, req)
     except (api.PermissionDenied, auth.AccessDenied) as error:
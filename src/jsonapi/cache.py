@@ -0,0 +1,158 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import collections
+import hashlib
+import threading
+
+import configuration
+
+class RenderedCache(object):
+    """Size-bounded LRU cache of rendered JSON responses
+
+       Responses are cached under their ETag, which identifies the requested
+       resource, the query parameters, the user (and access token) and the
+       version of the resource.  Entries for outdated versions are thus never
+       returned, and are simply evicted eventually.
+
+       Instances are thread-safe, so that a single instance can be shared by all
+       sessions in a process."""
+
+    OVERHEAD = 256
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, etag):
+        with self.__lock:
+            rendered = self.__entries.pop(etag, None)
+            if rendered is None:
+                self.misses += 1
+                return None
+            self.__entries[etag] = rendered
+            self.hits += 1
+            return rendered
+
+    def set(self, etag, rendered):
+        entry_size = RenderedCache.OVERHEAD + len(rendered)
+        if entry_size > self.max_size:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(etag, None)
+            if previous is not None:
+                self.size -= RenderedCache.OVERHEAD + len(previous)
+            self.__entries[etag] = rendered
+            self.size += entry_size
+            while self.size > self.max_size:
+                _, evicted = self.__entries.popitem(last=False)
+                self.size -= RenderedCache.OVERHEAD + len(evicted)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+RENDERED = RenderedCache(configuration.limits.JSONAPI_RENDERED_CACHE_SIZE)
+
+def parseIfNoneMatch(value):
+    """Return the set of entity tags listed in an If-None-Match header
+
+       Weak tags are returned as the corresponding strong tags, since weak
+       comparison is used for If-None-Match."""
+
+    if not value:
+        return set()
+    etags = set()
+    for etag in value.split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etags.add(etag)
+    return etags
+
+def reviewVersions(critic, reviews):
+    """Return a token that changes whenever any of |reviews| is modified
+
+       The token is derived from the reviews' serial numbers, which are
+       incremented whenever a review is modified in a way that other users can
+       see, and from their pending rebases.  If a user is signed in, the user's
+       draft changes (which only that user can see) are included as well."""
+
+    review_ids = sorted(set(review.id for review in reviews))
+    if not review_ids:
+        return ""
+
+    cursor = critic.getDatabaseCursor()
+    cursor.execute(
+        """SELECT reviews.id, reviews.serial, reviewrebases.id
+             FROM reviews
+  LEFT OUTER JOIN reviewrebases ON (reviewrebases.review=reviews.id
+                                AND reviewrebases.new_head IS NULL)
+            WHERE reviews.id=ANY (%s)""",
+        (review_ids,))
+    versions = sorted(cursor)
+
+    user = critic.actual_user
+    if user is None:
+        return repr(versions)
+
+    drafts = hashlib.sha1()
+
+    cursor.execute(
+        """SELECT commentchains.review, comments.id, comments.comment
+             FROM commentchains
+             JOIN comments ON (comments.chain=commentchains.id)
+            WHERE commentchains.review=ANY (%s)
+              AND comments.uid=%s
+              AND comments.state='draft'""",
+        (review_ids, user.id))
+    drafts.update(repr(sorted(cursor)))
+
+    cursor.execute(
+        """SELECT commentchains.review, commentchainchanges.chain,
+                  commentchainchanges.time, commentchainchanges.to_type,
+                  commentchainchanges.to_state,
+                  commentchainchanges.to_last_commit,
+                  commentchainchanges.to_addressed_by
+             FROM commentchains
+             JOIN commentchainchanges
+                    ON (commentchainchanges.chain=commentchains.id)
+            WHERE commentchains.review=ANY (%s)
+              AND commentchainchanges.uid=%s
+              AND commentchainchanges.state='draft'""",
+        (review_ids, user.id))
+    drafts.update(repr(sorted(cursor)))
+
+    cursor.execute(
+        """SELECT reviewfiles.review, reviewfilechanges.file,
+                  reviewfilechanges.to_state
+             FROM reviewfiles
+             JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
+            WHERE reviewfiles.review=ANY (%s)
+              AND reviewfilechanges.uid=%s
+              AND reviewfilechanges.state='draft'""",
+        (review_ids, user.id))
+    drafts.update(repr(sorted(cursor)))
+
+    return "%r:%s" % (versions, drafts.hexdigest())
@@ -0,0 +1,31 @@
+def renderedcache():
+    from jsonapi.cache import RenderedCache, parseIfNoneMatch
+
+    cache = RenderedCache(4 * (RenderedCache.OVERHEAD + 10))
+
+    for index in range(4):
+        cache.set('"%d"' % index, "%010d" % index)
+    assert len(cache) == 4
+
+    # Touch the oldest entry, so that the second oldest is evicted instead.
+    assert cache.get('"0"') == "0000000000"
+    cache.set('"4"', "0000000004")
+    assert len(cache) == 4
+    assert cache.get('"1"') is None
+    assert cache.get('"0"') == "0000000000"
+    assert cache.size == 4 * (RenderedCache.OVERHEAD + 10)
+
+    # Entries larger than the whole cache are not cached at all.
+    cache.set('"5"', "x" * cache.max_size)
+    assert cache.get('"5"') is None
+    assert len(cache) == 4
+
+    disabled = RenderedCache(0)
+    disabled.set('"0"', "")
+    assert len(disabled) == 0
+
+    assert parseIfNoneMatch(None) == set()
+    assert parseIfNoneMatch('"a"') == set(['"a"'])
+    assert parseIfNoneMatch('"a", W/"b",*') == set(['"a"', '"b"', "*"])
+
+    print "renderedcache: ok"
@@ -0,0 +1,160 @@
+import re
+
+class FakeRequest(object):
+    def __init__(self, path, query=None, headers=None):
+        self.method = "GET"
+        self.path = path
+        self.query = query or {}
+        self.headers = headers or {}
+        self.response_headers = {}
+
+    def getParameter(self, name, default=None, filter=lambda value: value):
+        if name not in self.query:
+            return default
+        return filter(self.query[name])
+
+    def getParameters(self):
+        return dict(self.query)
+
+    def getRequestHeader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def addResponseHeader(self, name, value):
+        self.response_headers[name] = value
+
+def request(path, **kwargs):
+    import api
+    import jsonapi
+    import textutils
+
+    # Use a fresh session for each request, so that nothing is cached.
+    critic = api.critic.startSession(for_testing=True)
+    req = FakeRequest(path, **kwargs)
+    result = textutils.json_decode(jsonapi.handleRequest(critic, req))
+
+    queries = {}
+    for query, (count, _, _, _, _) in critic.database.profiling.items():
+        query = re.sub(r"\s+", " ", query)
+        queries[query] = queries.get(query, 0) + count
+
+    return req, result, queries
+
+def count_queries(queries, *fragments):
+    return sum(count for query, count in queries.items()
+               if all(fragment in query for fragment in fragments))
+
+def fetch_review(arguments):
+    import api
+
+    critic = api.critic.startSession(for_testing=True)
+    repository = api.repository.fetch(critic, name="critic")
+    branch = api.branch.fetch(
+        critic, repository=repository, name=arguments.review)
+    return api.review.fetch(critic, branch=branch)
+
+def linked(arguments):
+    review = fetch_review(arguments)
+
+    _, result, queries = request(
+        "api/v1/reviews/%d" % review.id,
+        query={ "include": "users,commits,comments,files" })
+
+    assert result["id"] == review.id
+    linked = result["linked"]
+    assert len(linked["comments"]) == 6, linked["comments"]
+    assert len(linked["users"]) >= 4
+    assert len(linked["commits"]) >= 1
+    assert len(linked["files"]) >= 1
+
+    # Everything the linked comments need is fetched in bulk, independent of
+    # the number of comments.
+    assert count_queries(queries, "FROM commentchainlines") <= 1, queries
+    assert count_queries(queries, "FROM commentchainchanges") <= 1, queries
+    assert count_queries(
+        queries, "commentchains.first_comment!=comments.id") <= 1, queries
+    assert count_queries(queries, "FROM files") <= 1, queries
+
+    # Commits are never looked up one at a time.
+    assert count_queries(
+        queries, "SELECT sha1 FROM commits WHERE id=%s") == 0, queries
+
+    print "linked: ok"
+
+def etag(arguments):
+    import request as request_module
+
+    review = fetch_review(arguments)
+    path = "api/v1/reviews/%d" % review.id
+
+    req, first, _ = request(path, query={ "include": "commits" })
+    etag = req.response_headers.get("ETag")
+    assert etag and etag.startswith('"') and etag.endswith('"'), etag
+
+    req, second, _ = request(path, query={ "include": "commits" })
+    assert req.response_headers.get("ETag") == etag
+    assert second == first
+
+    # Different query parameters give a different ETag.
+    req, _, _ = request(path)
+    assert req.response_headers.get("ETag") not in (None, etag)
+
+    # Linked types that don't support ETags disable them.
+    req, _, _ = request(path, query={ "include": "users" })
+    assert "ETag" not in req.response_headers
+
+    try:
+        request(path, query={ "include": "commits" },
+                headers={ "If-None-Match": 'W/"x", ' + etag })
+    except request_module.NotModified:
+        pass
+    else:
+        assert False, "expected request.NotModified"
+
+    # Watching and unwatching the review changes its watchers, and thus the
+    # ETag.
+    import api
+    import dbutils
+    import operation.manipulatereview
+
+    critic = api.critic.startSession(for_testing=True)
+    associated = (review.owners | review.assigned_reviewers
+                  | review.active_reviewers | review.watchers)
+    subject = next(user for user in api.user.fetchAll(critic, status="current")
+                   if user not in associated)
+
+    with dbutils.Database.forTesting(critic) as db:
+        db_review = dbutils.Review.fromId(db, review.id)
+        db_subject = dbutils.User.fromId(db, subject.id)
+
+        operation.manipulatereview.WatchReview().process(
+            db, db_subject, db_review, db_subject)
+
+        try:
+            req, watched, _ = request(path, query={ "include": "commits" })
+            assert req.response_headers.get("ETag") != etag
+            assert subject.id in watched["watchers"], watched["watchers"]
+        finally:
+            operation.manipulatereview.UnwatchReview().process(
+                db, db_subject, db_review, db_subject)
+
+    req, unwatched, _ = request(path, query={ "include": "commits" })
+    assert req.response_headers.get("ETag") not in (None, etag)
+    assert subject.id not in unwatched["watchers"], unwatched["watchers"]
+
+    print "etag: ok"
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--review")
+    parser.add_argument("tests", nargs=argparse.REMAINDER)
+
+    arguments = parser.parse_args(argv)
+
+    for test in arguments.tests:
+        if test == "linked":
+            linked(arguments)
+        elif test == "etag":
+            etag(arguments)
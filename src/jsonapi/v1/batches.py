@@ -76,6 +76,16 @@ class Batches(object):
                          "unreviewed_changes": jsonapi.sorted_by_id(
                              value.unreviewed_file_changes) })
 
+    @staticmethod
+    def etag(parameters, value, values):
+        batches = [value] if value else values
+        # The unpublished batch (whose id is None) reflects the current user's
+        # draft changes, which are covered by the review's version.
+        return "%r:%s" % (
+            [batch.id for batch in batches],
+            jsonapi.cache.reviewVersions(
+                parameters.critic, [batch.review for batch in batches]))
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) batches in reviews.
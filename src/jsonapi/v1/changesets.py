@@ -81,6 +81,20 @@ class Changesets(object):
                 "review_state": review_state(review)
             })
 
+    @staticmethod
+    def etag(parameters, value, values):
+        # Changesets are immutable once processed, but their review state
+        # depends on the review's version.
+        changesets = [value] if value else values
+        review = jsonapi.deduce("v1/reviews", parameters)
+        if review:
+            review_version = jsonapi.cache.reviewVersions(
+                parameters.critic, [review])
+        else:
+            review_version = None
+        return "%r:%s" % ([changeset.id for changeset in changesets],
+                          review_version)
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) changesets.
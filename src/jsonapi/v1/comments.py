@@ -158,6 +158,10 @@ class Comments(object):
                 "draft_changes": draft_changes_json,
             })
 
+    @staticmethod
+    def prefetch(parameters, values):
+        api.comment.prefetch(parameters.critic, values)
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) comments in reviews.
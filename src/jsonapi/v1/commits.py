@@ -77,6 +77,15 @@ class Commits(object):
                           "author": userAndTimestamp(value.author),
                           "committer": userAndTimestamp(value.committer) })
 
+    @staticmethod
+    def prefetch(parameters, values):
+        api.commit.prefetchParents(values)
+
+    @staticmethod
+    def etag(parameters, value, values):
+        # Commits are immutable, so their ids are all the version we need.
+        return repr([commit.id for commit in ([value] if value else values)])
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) commits from a Git repository.
@@ -102,6 +102,11 @@ class Reviews(object):
                          "progress_per_commit":
                              change_counts_as_dict(value.progress_per_commit)})
 
+    @staticmethod
+    def etag(parameters, value, values):
+        return jsonapi.cache.reviewVersions(
+            parameters.critic, [value] if value else values)
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) reviews in this system.
@@ -52,6 +52,12 @@ class ReviewSummaries(object):
                                               review_summary in value.reviews],
                                   "more": value.more})
 
+    @staticmethod
+    def etag(parameters, value, values):
+        reviews = [review_summary.review for review_summary in value.reviews]
+        return "%s:%r" % (jsonapi.cache.reviewVersions(
+            parameters.critic, reviews), value.more)
+
     @staticmethod
     def multiple(parameters):
         """Retrieve review summaries."""
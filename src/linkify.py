@@ -25,6 +25,60 @@ class Context(object):
         self.repository = repository or (review.repository if review else None)
         self.review = review
         self.extra = kwargs
+        self.__review_commits = {}
+
+    def prefetch(self, texts):
+        """Resolve all commit references in |texts| at once
+
+           Resolving references one at a time, as link types do, is expensive;
+           this can be called before rendering a number of texts to resolve
+           all references in them in a single batch."""
+
+        if not self.repository:
+            return
+
+        names = set()
+
+        for text in texts:
+            for word in [text] + re_linkify.split(text):
+                if word:
+                    for linktype in ALL_LINKTYPES:
+                        if linktype.match(word):
+                            names.update(linktype.getCommitReferences(word))
+
+        sha1s = self.repository.resolveCommits(names).values()
+
+        if self.review and self.db:
+            self.__checkReviewCommits(sha1s)
+
+    def resolveCommit(self, name):
+        """Return the full SHA-1 of the commit |name|, or None"""
+        return self.repository.resolveCommits([name]).get(name)
+
+    def reviewContainsCommit(self, sha1):
+        if sha1 not in self.__review_commits:
+            self.__checkReviewCommits([sha1])
+        return self.__review_commits[sha1]
+
+    def __checkReviewCommits(self, sha1s):
+        sha1s = [sha1 for sha1 in sha1s if sha1 not in self.__review_commits]
+        if not sha1s:
+            return
+
+        cursor = self.db.cursor()
+        cursor.execute("""SELECT commits.sha1
+                            FROM reviewchangesets
+                            JOIN changesets ON (changesets.id=reviewchangesets.changeset)
+                            JOIN commits ON (commits.id=changesets.child)
+                           WHERE reviewchangesets.review=%s
+                             AND changesets.type!='conflicts'
+                             AND commits.sha1=ANY (%s)""",
+                       (self.review.id, sha1s))
+
+        contained = set(sha1 for (sha1,) in cursor)
+
+        for sha1 in sha1s:
+            self.__review_commits[sha1] = sha1 in contained
 
 class LinkType(object):
     """
@@ -70,6 +124,16 @@ class LinkType(object):
         """
         pass
 
+    def getCommitReferences(self, word):
+        """
+        getCommitReferences(word) -> list of strings.
+
+        Returns the (possibly abbreviated) commit SHA-1s that linkify()
+        would look up in the context's repository, so that they can be
+        resolved in advance, along with those from other words.
+        """
+        return []
+
 class SimpleLinkType(LinkType):
     """
     Base class for link type when the word contains the URL.
@@ -120,13 +184,16 @@ class SHA1(LinkType):
     def __init__(self):
         super(SHA1, self).__init__("[0-9A-Fa-f]{8,40}")
 
+    def getCommitReferences(self, word):
+        return [word]
+
     def linkify(self, word, context):
         sha1 = word
         if context.repository \
-                and context.repository.iscommit(word):
-            sha1 = context.repository.revparse(sha1)
+                and context.resolveCommit(word):
+            sha1 = context.resolveCommit(sha1)
             if context.review \
-                    and context.review.containsCommit(context.db, sha1):
+                    and context.reviewContainsCommit(sha1):
                 return "/%s/%s?review=%d" % (context.repository.name, sha1, context.review.id)
             else:
                 return "/%s/%s" % (context.repository.name, sha1)
@@ -144,16 +211,20 @@ class Diff(LinkType):
     def __init__(self):
         super(Diff, self).__init__("[0-9A-Fa-f]{8,40}\\.\\.[0-9A-Fa-f]{8,40}")
 
+    def getCommitReferences(self, word):
+        from_sha1, _, to_sha1 = word.partition("..")
+        return [from_sha1, to_sha1]
+
     def linkify(self, word, context):
         from_sha1, _, to_sha1 = word.partition("..")
         if context.repository \
-                and context.repository.iscommit(from_sha1) \
-                and context.repository.iscommit(to_sha1):
-            from_sha1 = context.repository.revparse(from_sha1)
-            to_sha1 = context.repository.revparse(to_sha1)
+                and context.resolveCommit(from_sha1) \
+                and context.resolveCommit(to_sha1):
+            from_sha1 = context.resolveCommit(from_sha1)
+            to_sha1 = context.resolveCommit(to_sha1)
             if context.review \
-                    and context.review.containsCommit(context.db, from_sha1) \
-                    and context.review.containsCommit(context.db, to_sha1):
+                    and context.reviewContainsCommit(from_sha1) \
+                    and context.reviewContainsCommit(to_sha1):
                 return "/%s/%s..%s?review=%d" % (context.repository.name, from_sha1, to_sha1, context.review.id)
             else:
                 return "/%s/%s..%s" % (context.repository.name, from_sha1, to_sha1)
@@ -182,3 +253,9 @@ Review()
 
 try: import customization.linktypes
 except ImportError: pass
+
+fragments = []
+for linktype in ALL_LINKTYPES:
+    if linktype.fragment:
+        fragments.append(linktype.fragment)
+re_linkify = re.compile("(?:^|\\b|(?=\\W))(" + "|".join(fragments) + ")([.,:;!?)]*(?:\\s|\\b|$))")
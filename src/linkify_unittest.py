@@ -0,0 +1,50 @@
+def linktypes():
+    import shutil
+    import subprocess
+    import tempfile
+
+    import gitutils
+    import linkify
+
+    path = tempfile.mkdtemp()
+
+    try:
+        def git(*args):
+            return subprocess.check_output(
+                ("git", "-c", "user.name=Test", "-c", "user.email=test@example.org")
+                + args, cwd=path)
+
+        git("init", "--quiet")
+        git("commit", "--quiet", "--allow-empty", "-m", "first")
+        git("commit", "--quiet", "--allow-empty", "-m", "second")
+        first_sha1, second_sha1 = git("rev-list", "--reverse", "HEAD").split()
+        tree_sha1 = git("rev-parse", "HEAD^{tree}").strip()
+
+        repository = gitutils.Repository(name="test", path=path)
+        context = linkify.Context(repository=repository)
+
+        context.prefetch(["See %s and %s..%s, not %s or 0123456789abcdef."
+                          % (first_sha1[:8], first_sha1[:10], second_sha1,
+                             tree_sha1)])
+
+        sha1 = linkify.SHA1()
+        diff = linkify.Diff()
+
+        assert (sha1.linkify(first_sha1[:8], context)
+                == "/test/%s" % first_sha1)
+        assert (diff.linkify("%s..%s" % (first_sha1[:10], second_sha1), context)
+                == "/test/%s..%s" % (first_sha1, second_sha1))
+        assert sha1.linkify(tree_sha1, context) == "/%s" % tree_sha1
+        assert (sha1.linkify("0123456789abcdef", context)
+                == "/0123456789abcdef")
+
+        # Words not seen by prefetch() are resolved on demand.
+        assert (sha1.linkify(second_sha1[:12], context)
+                == "/test/%s" % second_sha1)
+
+        assert repository.resolveCommits([first_sha1[:8], tree_sha1]) \
+            == { first_sha1[:8]: first_sha1 }
+    finally:
+        shutil.rmtree(path)
+
+    print "linktypes: ok"
@@ -14,65 +14,231 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import array
+
 import gitutils
+import dbutils.ancestry
 
-class CommitSet:
-    def __init__(self, commits):
-        self.__commits = dict([(str(commit), commit) for commit in commits])
-        self.__merges = set()
-        self.__children = {}
+class CommitGraph(object):
+    """Compact, immutable graph of the commits in a commit set
+
+       Commits are identified by their position in a topological order of the
+       set, in which all of a commit's parents (in the set) come before it.
+       Parent and child relations are stored as flat arrays of positions.
+       Since instances contain no commit objects, they can be cached and
+       shared between database sessions."""
+
+    # Ancestor bit masks take O(N^2) bits for N commits, so they are only
+    # calculated for graphs with at most this many commits.  Larger graphs are
+    # walked instead.
+    MAX_ANCESTOR_MASKS = 1000
+
+    def __init__(self, commits, commit_ids=None):
+        """Create a graph from an iterable of (sha1, parent sha1s) tuples
+
+           If given, |commit_ids| should map SHA-1s to commit ids."""
+
+        parents_by_sha1 = {}
+        for sha1, parent_sha1s in commits:
+            parents_by_sha1.setdefault(sha1, list(parent_sha1s))
+
+        # Order the commits topologically, using an iterative depth-first
+        # traversal that emits each commit after all its parents.
+        sha1s = []
+        index = {}
+        for sha1 in parents_by_sha1:
+            stack = [sha1]
+            while stack:
+                current = stack[-1]
+                if current in index:
+                    stack.pop()
+                    continue
+                pending = [parent_sha1
+                           for parent_sha1 in parents_by_sha1[current]
+                           if parent_sha1 in parents_by_sha1
+                           and parent_sha1 not in index]
+                if pending:
+                    stack.extend(pending)
+                else:
+                    index[current] = len(sha1s)
+                    sha1s.append(current)
+                    stack.pop()
+
+        parent_offsets = array.array("l", [0])
+        parent_positions = array.array("l")
+        children = [[] for _ in sha1s]
+        tails = {}
+        merges = []
+
+        for position, sha1 in enumerate(sha1s):
+            parent_sha1s = parents_by_sha1[sha1]
+            if len(parent_sha1s) > 1:
+                merges.append(position)
+            for parent_sha1 in parent_sha1s:
+                parent_position = index.get(parent_sha1)
+                if parent_position is None:
+                    tails.setdefault(parent_sha1, []).append(position)
+                else:
+                    parent_positions.append(parent_position)
+                    children[parent_position].append(position)
+            parent_offsets.append(len(parent_positions))
+
+        child_offsets = array.array("l", [0])
+        child_positions = array.array("l")
+        heads = []
+
+        for position, position_children in enumerate(children):
+            if not position_children:
+                heads.append(position)
+            child_positions.extend(position_children)
+            child_offsets.append(len(child_positions))
+
+        self.sha1s = sha1s
+        self.index = index
+        self.commit_ids = commit_ids or {}
+        self.heads = tuple(heads)
+        self.merges = tuple(merges)
+        self.tails = dict((tail_sha1, tuple(positions))
+                          for tail_sha1, positions in tails.items())
+        self.tail_sha1s = frozenset(tails)
+        self.__parent_offsets = parent_offsets
+        self.__parent_positions = parent_positions
+        self.__child_offsets = child_offsets
+        self.__child_positions = child_positions
+        self.__ancestors = None
+
+    def __len__(self):
+        return len(self.sha1s)
+
+    def parents(self, position):
+        """Return the positions of a commit's parents in the set"""
+        return self.__parent_positions[self.__parent_offsets[position]:
+                                       self.__parent_offsets[position + 1]]
+
+    def children(self, position):
+        """Return the positions of a commit's children in the set"""
+        return self.__child_positions[self.__child_offsets[position]:
+                                      self.__child_offsets[position + 1]]
+
+    def ancestors(self, position, lowest=0):
+        """Return the positions of a commit's ancestors in the set
+
+           The returned set includes the commit itself.  Ancestors at positions
+           lower than |lowest| are not included (nor walked through.)"""
 
-        parents = set()
+        ancestors = set([position])
+        stack = [position]
+        while stack:
+            for parent_position in self.parents(stack.pop()):
+                if parent_position >= lowest \
+                        and parent_position not in ancestors:
+                    ancestors.add(parent_position)
+                    stack.append(parent_position)
+        return ancestors
+
+    def isAncestor(self, ancestor, position):
+        """Return true if |ancestor| is an ancestor of (or is) |position|
+
+           For small graphs, the ancestor bit masks of all commits are
+           calculated on first use, in a single pass over the topological
+           order.  Otherwise, the graph is walked, skipping commits that come
+           before |ancestor| in the order, since they can't be its
+           descendants."""
+
+        if ancestor > position:
+            return False
 
-        for commit in self.__commits.values():
-            for parent in commit.parents:
-                parents.add(parent)
-                self.__children.setdefault(parent, set()).add(commit)
-            if len(commit.parents) > 1:
-                self.__merges.add(commit)
+        if len(self.sha1s) > self.MAX_ANCESTOR_MASKS:
+            return ancestor in self.ancestors(position, lowest=ancestor)
 
-        commit_set = set(self.__commits.values())
+        if self.__ancestors is None:
+            ancestors = []
+            for index in xrange(len(self.sha1s)):
+                mask = 1 << index
+                for parent_position in self.parents(index):
+                    mask |= ancestors[parent_position]
+                ancestors.append(mask)
+            self.__ancestors = ancestors
+        return bool(self.__ancestors[position] & (1 << ancestor))
 
-        # Heads: commits that aren't the parent of a commit in the set.
-        self.__heads = commit_set - parents
+    @staticmethod
+    def fromReview(db, review_id):
+        """Create the graph of the commits in a review, using one query"""
+
+        cursor = db.cursor()
+        cursor.execute("""SELECT DISTINCT commits.id, commits.sha1, parents.sha1
+                            FROM reviewchangesets
+                            JOIN changesets ON (changesets.id=reviewchangesets.changeset)
+                            JOIN commits ON (commits.id=changesets.child)
+                 LEFT OUTER JOIN edges ON (edges.child=commits.id)
+                 LEFT OUTER JOIN commits AS parents ON (parents.id=edges.parent)
+                           WHERE reviewchangesets.review=%s""",
+                       (review_id,))
+
+        commit_ids = {}
+        parent_sha1s = {}
+        for commit_id, sha1, parent_sha1 in cursor:
+            commit_ids[sha1] = commit_id
+            sha1_parents = parent_sha1s.setdefault(sha1, [])
+            if parent_sha1 is not None:
+                sha1_parents.append(parent_sha1)
+
+        return CommitGraph(parent_sha1s.items(), commit_ids)
+
+class CommitSet:
+    def __init__(self, commits, graph=None):
+        commits = dict((str(commit), commit) for commit in commits)
 
-        # Tails: parent commits not included in the set.
-        self.__tails = parents - commit_set
+        if graph is None:
+            graph = CommitGraph((sha1, commit.parents)
+                                for sha1, commit in commits.items())
+
+        self.__graph = graph
+        self.__commits = [commits[sha1] for sha1 in graph.sha1s]
+        self.__heads = set(self.__commits[position] for position in graph.heads)
+
+    def __position(self, commit):
+        return self.__graph.index.get(str(commit))
 
     def __contains__(self, commit):
-        return str(commit) in self.__commits
+        return str(commit) in self.__graph.index
 
     def __getitem__(self, key):
-        return self.__commits[str(key)]
+        return self.__commits[self.__graph.index[str(key)]]
 
     def __len__(self):
         return len(self.__commits)
 
     def __iter__(self):
-        return iter(self.__commits.values())
+        return iter(self.__commits)
 
     def __repr__(self):
-        return repr(self.__commits)
+        return repr(dict((str(commit), commit) for commit in self.__commits))
 
     def get(self, key):
-        return self.__commits.get(str(key))
+        position = self.__position(key)
+        if position is None: return None
+        return self.__commits[position]
 
     def getHeads(self):
         return self.__heads.copy()
 
     def getTails(self):
-        return self.__tails.copy()
+        return set(self.__graph.tail_sha1s)
 
     def getMerges(self):
-        return self.__merges.copy()
+        return set(self.__commits[position] for position in self.__graph.merges)
 
     def getChildren(self, commit):
-        children = self.__children.get(commit)
-        if children: return children.copy()
-        else: return set()
+        position = self.__position(commit)
+        if position is None:
+            positions = self.__graph.tails.get(str(commit), ())
+        else:
+            positions = self.__graph.children(position)
+        return set(self.__commits[child] for child in positions)
 
     def getParents(self, commit):
-        return set([self.__commits[sha1] for sha1 in commit.parents if sha1 in self.__commits])
+        return set([self[sha1] for sha1 in commit.parents if sha1 in self])
 
     def getFilteredTails(self, repository):
         """Return a set containing each tail commit of the set of commits that isn't an
@@ -88,12 +254,11 @@ the latest one."""
 
             eliminated = set()
             for other in candidates:
-                base = repository.mergebase([tail, other])
-                if base == tail:
+                if repository.isAncestor(tail, other):
                     # Tail is an ancestor of other: tail should not be included
                     # in the returned set.
                     break
-                elif base == other:
+                elif repository.isAncestor(other, tail):
                     # Other is an ancestor of tail: other should not be included
                     # in the returned set.
                     eliminated.add(other)
@@ -112,24 +277,13 @@ the latest one."""
         that is a parent of a commit that is a member of the set.
         """
 
-        assert commit in self.__commits
+        assert commit in self
 
-        stack = set([commit.sha1])
-        processed = set()
-        tails = set()
+        ancestors = self.__graph.ancestors(self.__position(commit))
 
-        while stack:
-            commit = self.__commits[stack.pop()]
-
-            if commit not in processed:
-                processed.add(commit)
-
-                for sha1 in commit.parents:
-                    parent = self.__commits.get(sha1)
-                    if parent: stack.add(parent)
-                    else: tails.add(sha1)
-
-        return tails
+        return set(tail_sha1
+                   for tail_sha1, positions in self.__graph.tails.items()
+                   if not ancestors.isdisjoint(positions))
 
     def getCommonAncestors(self, commit):
         """Return a set of each commit in this set that is an ancestor of each parent of
@@ -140,7 +294,7 @@ have no common ancestor within this set."""
         branches = []
 
         for sha1 in commit.parents:
-            if sha1 not in self.__commits: return common_ancestors
+            if sha1 not in self: return common_ancestors
             branches.append(set())
 
         for index, sha1 in enumerate(commit.parents):
@@ -148,7 +302,7 @@ have no common ancestor within this set."""
             branch = branches[index]
 
             while stack:
-                commit = self.__commits.get(stack.pop())
+                commit = self.get(stack.pop())
 
                 if commit and commit not in branch:
                     branch.add(commit)
@@ -182,41 +336,46 @@ have no common ancestor within this set."""
         'commit' that don't have other descendants in the commit set.
         """
 
-        pending = set(filter(None, (self.__commits.get(str(commit)) for commit in commits)))
-        commits = self.__commits.copy()
-        children = self.__children.copy()
+        graph = self.__graph
+        removed = [False] * len(self.__commits)
+        child_counts = [len(graph.children(position))
+                        for position in xrange(len(self.__commits))]
+
+        pending = set(position for position in map(self.__position, commits)
+                      if position is not None)
 
         while pending:
-            commit = pending.pop()
+            position = pending.pop()
 
-            del commits[commit]
-            if commit in children:
-                del children[commit]
+            if removed[position]:
+                continue
+            removed[position] = True
 
-            for parent_sha1 in commit.parents:
-                if parent_sha1 in commits:
-                    children0 = children.get(parent_sha1, set())
-                    children0 -= set([commit])
-                    if not children0:
-                        pending.add(commits[parent_sha1])
+            for parent_position in graph.parents(position):
+                child_counts[parent_position] -= 1
+                if not child_counts[parent_position]:
+                    pending.add(parent_position)
 
-        return CommitSet(commits.values())
+        return CommitSet(commit for position, commit in enumerate(self.__commits)
+                         if not removed[position])
 
     def isAncestorOf(self, ancestor, commit):
         if ancestor == commit:
             return False
-        else:
-            descendants = self.__children.get(ancestor, set()).copy()
-            pending = descendants.copy()
 
-            while pending and not commit in descendants:
-                descendant = pending.pop()
-                children = self.__children.get(descendant, set()) - descendants
+        position = self.__position(commit)
+        if position is None:
+            return False
 
-                descendants.update(children)
-                pending.update(children)
+        graph = self.__graph
+        ancestor_position = self.__position(ancestor)
 
-            return commit in descendants
+        if ancestor_position is not None:
+            return graph.isAncestor(ancestor_position, position)
+        else:
+            # Not in the set, but possibly a tail of it.
+            return any(graph.isAncestor(child_position, position)
+                       for child_position in graph.tails.get(str(ancestor), ()))
 
     @staticmethod
     def fromRange(db, from_commit, to_commit, commits=None):
@@ -256,6 +415,28 @@ have no common ancestor within this set."""
         if from_commit == to_commit:
             return CommitSet([to_commit])
 
+        if dbutils.ancestry.isAncestor(db, from_commit.sha1, to_commit.sha1):
+            # Both commits are in the ancestry graph, so find the commits in
+            # the range using it, and load them all at once.
+            cache = db.storage["Commit"]
+            sha1s = dbutils.ancestry.commitRange(
+                db, [to_commit.sha1], [from_commit.sha1])
+
+            range_commits = [cache[sha1] for sha1 in sha1s if sha1 in cache]
+            range_commits.extend(
+                gitutils.Commit.fromGitObject(db, repository, gitobject)
+                for gitobject in repository.fetchMany(
+                    [sha1 for sha1 in sha1s if sha1 not in cache]))
+
+            for commit in range_commits:
+                if len(commit.parents) > 1:
+                    # See the comment in process() above.
+                    mergebase = repository.mergebase(commit.parents, db=db)
+                    if not from_commit.isAncestorOf(mergebase):
+                        return None
+
+            return CommitSet(range_commits)
+
         try:
             process(to_commit)
             return CommitSet(commits)
@@ -0,0 +1,110 @@
+class FakeCommit(object):
+    def __init__(self, sha1, parents):
+        self.sha1 = sha1
+        self.parents = parents
+    def __hash__(self): return hash(self.sha1)
+    def __eq__(self, other): return self.sha1 == str(other)
+    def __ne__(self, other): return self.sha1 != str(other)
+    def __str__(self): return self.sha1
+    def __repr__(self): return "FakeCommit(%r)" % self.sha1
+
+def createCommits(generator, count):
+    commits = []
+    for index in xrange(count):
+        candidates = range(max(0, index - 8), index)
+        parents = generator.sample(
+            candidates, min(len(candidates), generator.choice([1, 1, 1, 2])))
+        commits.append(FakeCommit("%040x" % index,
+                                  ["%040x" % parent for parent in parents]))
+    return commits
+
+def commitset():
+    import random
+    from log.commitset import CommitGraph, CommitSet
+
+    generator = random.Random(0)
+
+    for _ in xrange(20):
+        all_commits = createCommits(generator, 60)
+        # Leave out some early commits, which then become tails.
+        commits = all_commits[generator.randint(1, 10):]
+        by_sha1 = dict((commit.sha1, commit) for commit in all_commits)
+
+        member_sha1s = set(commit.sha1 for commit in commits)
+
+        def ancestors(commit):
+            # Ancestors reachable via members of the set only, plus tails.
+            result = set()
+            stack = [commit.sha1]
+            while stack:
+                sha1 = stack.pop()
+                if sha1 not in result:
+                    result.add(sha1)
+                    if sha1 in member_sha1s:
+                        stack.extend(by_sha1[sha1].parents)
+            return result
+
+        parent_sha1s = set(sha1 for commit in commits for sha1 in commit.parents)
+
+        commitset = CommitSet(reversed(commits))
+
+        assert len(commitset) == len(commits)
+        assert set(commitset) == set(commits)
+        assert set(map(str, commitset.getHeads())) == member_sha1s - parent_sha1s
+        assert commitset.getTails() == parent_sha1s - member_sha1s
+        assert set(map(str, commitset.getMerges())) \
+            == set(commit.sha1 for commit in commits if len(commit.parents) > 1)
+
+        for commit in commits:
+            assert commit in commitset
+            assert commitset[commit.sha1] is commit
+            assert commitset.get(commit) is commit
+            assert set(map(str, commitset.getChildren(commit))) \
+                == set(other.sha1 for other in commits
+                       if commit.sha1 in other.parents)
+
+            commit_ancestors = ancestors(commit)
+            expected_tails = set()
+            for sha1 in commit_ancestors & member_sha1s:
+                expected_tails.update(set(by_sha1[sha1].parents) - member_sha1s)
+            assert commitset.getTailsFrom(commit) == expected_tails
+
+            for other in commits:
+                assert commitset.isAncestorOf(other, commit) \
+                    == (other.sha1 != commit.sha1
+                        and other.sha1 in commit_ancestors), (other, commit)
+
+            for tail in commitset.getTails():
+                assert commitset.isAncestorOf(tail, commit) \
+                    == (tail in commit_ancestors), (tail, commit)
+
+        head = generator.choice(list(commitset.getHeads()))
+        without = commitset.without([head])
+        assert head not in without
+        # Every remaining commit is an ancestor of a remaining head.
+        for commit in without:
+            assert any(commit.sha1 in ancestors(other)
+                       for other in without.getHeads())
+        # Every removed commit was an ancestor of the removed head only.
+        for commit in commits:
+            if commit not in without:
+                assert commit.sha1 in ancestors(head)
+                assert not any(commit.sha1 in ancestors(other)
+                               for other in without)
+
+    # Large graphs are walked instead of using ancestor bit masks, with the
+    # same results.
+    for _ in xrange(20):
+        commits = createCommits(generator, 60)
+        graph = CommitGraph((commit.sha1, commit.parents) for commit in commits)
+        walked = CommitGraph((commit.sha1, commit.parents) for commit in commits)
+        walked.MAX_ANCESTOR_MASKS = 0
+
+        for position in xrange(len(graph)):
+            ancestors = graph.ancestors(position)
+            for ancestor in xrange(len(graph)):
+                assert graph.isAncestor(ancestor, position) \
+                    == walked.isAncestor(ancestor, position) \
+                    == (ancestor in ancestors), (ancestor, position)
+
+    print "commitset: ok"
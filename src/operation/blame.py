@@ -47,7 +47,7 @@ class LineAnnotator:
             else:
                 commits.append(commit)
 
-        for changeset in loadChangesetsForCommits(db, parent.repository, commits, filtered_file_ids=file_ids):
+        for changeset in loadChangesetsForCommits(db, parent.repository, commits, filtered_file_ids=file_ids, load_lines=True):
             self.changesets[changeset.child.sha1] = changeset_cache[changeset.child] = changeset
 
         for commit in set(self.commitset) - set(self.changesets.keys()):
@@ -235,6 +235,14 @@ class ReapplyFilters(Operation):
                                    VALUES (%s, %s)""",
                            [(review_file_id, user.id) for review_file_id in assign_changes])
 
+        # Let clients that cache the reviews know that their reviewers and
+        # watchers have changed.
+        if new_reviews or assigned_reviews:
+            cursor.execute("""UPDATE reviews
+                                 SET serial=serial+1
+                               WHERE id=ANY (%s)""",
+                           (list(new_reviews | assigned_reviews),))
+
         db.commit()
 
         watched_reviews &= new_reviews
@@ -179,10 +179,12 @@ class WatchReview(Operation):
                 user_include = include
 
         with db.updating_cursor(
-                "reviewusers", "reviewrecipientfilters") as cursor:
+                "reviews", "reviewusers", "reviewrecipientfilters") as cursor:
             cursor.execute("""INSERT INTO reviewusers (review, uid, type)
                                    VALUES (%s, %s, 'manual')""",
                            (review.id, subject.id))
+            cursor.execute("UPDATE reviews SET serial=serial+1 WHERE id=%s",
+                           (review.id,))
 
             if not default_include and user_include is None:
                 cursor.execute(
@@ -234,11 +236,13 @@ class UnwatchReview(Operation):
                 message=("Cannot unwatch review since user is assigned to "
                          "review changes."))
 
-        with db.updating_cursor("reviewusers") as cursor:
+        with db.updating_cursor("reviews", "reviewusers") as cursor:
             cursor.execute("""DELETE
                                 FROM reviewusers
                                WHERE review=%s
                                  AND uid=%s""",
                            (review.id, subject.id))
+            cursor.execute("UPDATE reviews SET serial=serial+1 WHERE id=%s",
+                           (review.id,))
 
         return OperationResult()
@@ -286,10 +286,7 @@ def renderCreateReview(req, db, user):
             invalid_branch_name = "false"
             default_branch_name = htmlutils.htmlify(match.group(1))
 
-    changesets = []
-    changeset_utils.createChangesets(db, repository, commits)
-    for commit in commits:
-        changesets.extend(changeset_utils.createChangeset(db, None, repository, commit, do_highlight=False))
+    changesets = changeset_utils.createChangesets(db, repository, commits)
     changeset_ids = [changeset.id for changeset in changesets]
 
     all_reviewers, all_watchers = reviewing.utils.getReviewersAndWatchers(
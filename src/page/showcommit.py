@@ -15,6 +15,7 @@
 # the License.
 
 import htmlutils
+import linkify
 import page.utils
 import dbutils
 import gitutils
@@ -160,12 +161,10 @@ def renderCommitInfo(db, target, user, repository, review, commit, conflicts=Fal
                     outputBranches(cell.span("branches"), child)
                     outputTags(cell.span("tags"), child)
 
-    def linkToCommit(commit):
-        if review:
-            cursor.execute("SELECT 1 FROM commits JOIN changesets ON (child=commits.id) JOIN reviewchangesets ON (changeset=changesets.id) WHERE sha1=%s AND review=%s", (commit.sha1, review.id))
-            if cursor.fetchone():
-                return "%s/%s?review=%d" % (repository.name, commit.sha1, review.id)
-        return "%s/%s" % (repository.name, commit.sha1)
+    # Resolve all SHA-1s mentioned in the commit message at once, rather than
+    # line by line.
+    linkify_context = linkify.Context(repository=repository)
+    linkify_context.prefetch(msg)
 
     highlight_index = 0
 
@@ -191,7 +190,7 @@ def renderCommitInfo(db, target, user, repository, review, commit, conflicts=Fal
         row = commit_msg.tr(className)
         row.td("edge").text()
         cell = row.td("line single commit-msg", id="msg%d" % index, critic_length_limit=lengthLimit)
-        if text: cell.preformatted().text(text, linkify=linkToCommit, repository=repository)
+        if text: cell.preformatted().text(text, linkify=linkify_context)
         else: cell.text()
         row.td("edge").text()
 
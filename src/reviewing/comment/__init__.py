@@ -528,6 +528,10 @@ def propagateCommentChains(db, user, review, commits, replayed_rebases={}):
     commentchainlines_values = []
     addressed_values = []
 
+    # Changes to all commented files, loaded once for all comment chains.
+    changes = reviewing.comment.propagate.ChangeCache(
+        db, review.repository, chains_by_file.keys())
+
     for file_id, chains in chains_by_file.items():
         file_path = dbutils.describe_file(db, file_id)
         file_sha1 = review.branch.getHead(db).getFileSHA1(file_path)
@@ -546,7 +550,7 @@ def propagateCommentChains(db, user, review, commits, replayed_rebases={}):
             if head in replayed_rebases:
                 head = replayed_rebases[head]
 
-            propagation = reviewing.comment.propagate.Propagation(db)
+            propagation = reviewing.comment.propagate.Propagation(db, changes)
             propagation.setExisting(review, chain_id, review.branch.getHead(db), file_id, first_line, last_line)
             propagation.calculateAdditionalLines(commits, head)
 
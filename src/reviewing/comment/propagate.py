@@ -14,9 +14,12 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import bisect
+
 import dbutils
 import diff
 
+from changeset.load import loadChangesets
 from changeset.utils import createChangeset
 
 FORWARD  = 1
@@ -107,6 +110,142 @@ class Location:
 
         return self.active
 
+class ChangeMap(object):
+    """Sequence of changes, prepared for translating locations through them
+
+       Does the same thing as Location.apply(), but finds the first change that
+       doesn't precede the location using binary search, and so is cheap to
+       use repeatedly for the same changes."""
+
+    def __init__(self, changes):
+        self.__count = len(changes)
+        self.__old_begins = [change.delete_offset for change in changes]
+        self.__old_ends = [change.delete_offset + change.delete_count
+                           for change in changes]
+        self.__new_begins = [change.insert_offset for change in changes]
+        self.__new_ends = [change.insert_offset + change.insert_count
+                           for change in changes]
+        # Line number delta (new minus old) caused by the changes before each
+        # change, and by all of them.
+        self.__deltas = [0]
+        for change in changes:
+            self.__deltas.append(self.__deltas[-1] + change.insert_count
+                                 - change.delete_count)
+
+    def __len__(self):
+        return self.__count
+
+    def apply(self, location, direction):
+        """Adjust |location| like Location.apply() would
+
+           Returns True if the location is still active."""
+
+        if direction == FORWARD:
+            begins, ends, sign = self.__old_begins, self.__old_ends, 1
+        else:
+            begins, ends, sign = self.__new_begins, self.__new_ends, -1
+
+        # Changes are sorted and don't overlap, so the changes that end before
+        # the location (and don't overlap it) are a prefix of the sequence.
+        index = bisect.bisect_right(ends, location.first_line)
+
+        if index < self.__count and begins[index] <= location.last_line:
+            location.active = False
+        else:
+            location += sign * self.__deltas[index]
+
+        return location.active
+
+class ChangeCache(object):
+    """Changes to a set of files between pairs of commits
+
+       Can be shared by the propagations of many comment chains, so that the
+       changes between each pair of commits are loaded once, rather than once
+       per comment chain."""
+
+    def __init__(self, db, repository, file_ids):
+        self.db = db
+        self.repository = repository
+        self.file_ids = set(file_ids)
+        self.__changes = {}
+        self.__prefetched = set()
+
+    def prefetch(self, commits):
+        """Load the changes made by each of |commits|
+
+           The changes of all commits with a single parent, whose changesets
+           already exist, are loaded using a single loadChangesets() call.
+           Other changes are loaded (and created, if necessary) on demand."""
+
+        pending = {}
+
+        for commit in commits:
+            if len(commit.parents) == 1 and commit.sha1 not in self.__prefetched:
+                self.__prefetched.add(commit.sha1)
+                pending[commit.sha1] = commit
+
+        if not pending:
+            return
+
+        cursor = self.db.cursor()
+        cursor.execute("""SELECT changesets.id, parents.sha1, children.sha1
+                            FROM changesets
+                            JOIN commits AS parents ON (parents.id=changesets.parent)
+                            JOIN commits AS children ON (children.id=changesets.child)
+                           WHERE children.sha1=ANY (%s)
+                             AND changesets.type='direct'""",
+                       (pending.keys(),))
+
+        changesets = []
+
+        for changeset_id, parent_sha1, child_sha1 in cursor.fetchall():
+            key = (parent_sha1, child_sha1)
+            if key not in self.__changes:
+                child = pending[child_sha1]
+                changesets.append((key, diff.Changeset(changeset_id, None, child, "direct")))
+
+        loadChangesets(self.db, self.repository,
+                       [changeset for _, changeset in changesets],
+                       filtered_file_ids=self.file_ids)
+
+        for key, changeset in changesets:
+            self.__changes[key] = self.__extract(changeset)
+
+    def get(self, from_commit, to_commit, file_id):
+        """Return the changes to a file between two commits
+
+           The changes are returned as a tuple (changes, removed, added), where
+           |changes| is a ChangeMap, or None if the file wasn't modified, and
+           |removed| and |added| are booleans."""
+
+        key = (from_commit.sha1, to_commit.sha1)
+        changes = self.__changes.get(key)
+
+        if changes is None:
+            changesets = createChangeset(self.db,
+                                         user=None,
+                                         repository=self.repository,
+                                         from_commit=from_commit,
+                                         to_commit=to_commit,
+                                         filtered_file_ids=self.file_ids,
+                                         do_highlight=False)
+
+            assert len(changesets) == 1
+
+            changes = self.__changes[key] = self.__extract(changesets[0])
+
+        return changes.get(file_id, (None, False, False))
+
+    def __extract(self, changeset):
+        changes = {}
+        for changed_file in changeset.files:
+            assert changed_file.id in self.file_ids
+            removed = changed_file.new_sha1 == "0" * 40
+            added = changed_file.old_sha1 == "0" * 40
+            changes[changed_file.id] = (ChangeMap(changed_file.chunks), removed, added)
+            changed_file.clean()
+        return changes
+
 class AddressedBy(object):
     def __init__(self, parent, child, location):
         self.parent = parent
@@ -114,8 +253,9 @@ class AddressedBy(object):
         self.location = location
 
 class Propagation:
-    def __init__(self, db):
+    def __init__(self, db, changes=None):
         self.db = db
+        self.changes = changes
         self.review = None
         self.head = None
         self.rebases = None
@@ -248,7 +388,10 @@ class Propagation:
         return self.active
 
     def __propagate(self, commits):
-        cursor = self.db.cursor()
+        if self.changes is None:
+            self.changes = ChangeCache(self.db, self.review.repository, [self.file_id])
+
+        self.changes.prefetch(commits)
 
         def propagateBackward(commit, location, processed):
             parents = commits.getParents(commit)
@@ -270,7 +413,7 @@ class Propagation:
                     pass
                 elif changes:
                     parent_location = location.copy()
-                    if parent_location.apply(changes, BACKWARD):
+                    if changes.apply(parent_location, BACKWARD):
                         file_sha1 = parent.getFileSHA1(self.file_path)
                         assert file_sha1
                         self.__setLines(file_sha1, parent_location)
@@ -304,7 +447,7 @@ class Propagation:
                     self.addressed_by.append(AddressedBy(commit, child, location))
                 elif changes:
                     child_location = location.copy()
-                    if child_location.apply(changes, FORWARD):
+                    if changes.apply(child_location, FORWARD):
                         file_sha1 = child.getFileSHA1(self.file_path)
                         assert file_sha1
                         self.__setLines(file_sha1, child_location)
@@ -336,24 +479,7 @@ class Propagation:
         propagateForward(self.initial_commit, self.location, set())
 
     def __getChanges(self, from_commit, to_commit):
-        changesets = createChangeset(self.db,
-                                     user=None,
-                                     repository=self.review.repository,
-                                     from_commit=from_commit,
-                                     to_commit=to_commit,
-                                     filtered_file_ids=set([self.file_id]),
-                                     do_highlight=False)
-
-        assert len(changesets) == 1
-
-        if changesets[0].files:
-            changed_file = changesets[0].files[0]
-            assert changed_file.id == self.file_id
-            removed = changed_file.new_sha1 == "0" * 40
-            added = changed_file.old_sha1 == "0" * 40
-            return changesets[0].files[0].chunks, removed, added
-        else:
-            return None, False, False
+        return self.changes.get(from_commit, to_commit, self.file_id)
 
     def __setLines(self, file_sha1, lines):
         if file_sha1 not in self.all_lines:
@@ -0,0 +1,38 @@
+def changemap():
+    import random
+    import diff
+    from reviewing.comment.propagate import (Location, ChangeMap,
+                                             FORWARD, BACKWARD)
+
+    generator = random.Random(0)
+
+    for _ in xrange(500):
+        chunks = []
+        offset = 1
+        delta = 0
+        for _ in xrange(generator.randint(0, 6)):
+            offset += generator.randint(1, 5)
+            delete_count = generator.randint(0, 3)
+            insert_count = generator.randint(0 if delete_count else 1, 3)
+            chunks.append(diff.Chunk(offset, delete_count,
+                                     offset + delta, insert_count))
+            offset += delete_count
+            delta += insert_count - delete_count
+
+        changes = ChangeMap(chunks)
+        assert len(changes) == len(chunks)
+
+        for direction in (FORWARD, BACKWARD):
+            for first_line in xrange(1, 40):
+                last_line = first_line + generator.randint(0, 4)
+
+                expected = Location(first_line, last_line)
+                expected.apply(chunks, direction)
+
+                location = Location(first_line, last_line)
+                assert changes.apply(location, direction) == expected.active
+                assert location.active == expected.active
+                if expected.active:
+                    assert location == expected, (chunks, first_line, last_line)
+
+    print "changemap: ok"
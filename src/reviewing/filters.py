@@ -17,6 +17,8 @@
 import dbutils
 import time
 import re
+import collections
+import threading
 
 class PatternError(Exception):
     def __init__(self, pattern, message):
@@ -143,24 +145,130 @@ class Path(object):
         # way it's stable and predictable.
         return cmp(pathA, pathB)
 
+class _MatcherState(object):
+    __slots__ = ("literals", "wildcards", "recursive", "loop", "terminal")
+
+    def __init__(self, loop=False):
+        self.literals = {}       # dict(component -> state)
+        self.wildcards = {}      # dict(component -> tuple(regexp, state))
+        self.recursive = None    # state following a "**" component
+        self.loop = loop         # True if this state follows a "**" component
+        self.terminal = []       # indexes of patterns ending here
+
+    def child(self, component):
+        if component == "**":
+            if self.recursive is None:
+                self.recursive = _MatcherState(loop=True)
+            return self.recursive
+        elif hasWildcard(component):
+            if component not in self.wildcards:
+                self.wildcards[component] = (compilePattern(component),
+                                             _MatcherState())
+            return self.wildcards[component][1]
+        else:
+            return self.literals.setdefault(component, _MatcherState())
+
+def _closure(states, state):
+    # Since "**" can match zero components, any state with a "**" component
+    # following it is also in the state following the "**" component.
+    while state is not None and state not in states:
+        states.add(state)
+        state = state.recursive
+
+def _step(states, component):
+    result = set()
+    for state in states:
+        _closure(result, state.literals.get(component))
+        for regexp, child in state.wildcards.itervalues():
+            if regexp.match(component):
+                _closure(result, child)
+        if state.loop and component:
+            result.add(state)
+    return frozenset(result)
+
+class PathMatcher(object):
+    """Matches paths against a list of patterns in a single pass
+
+       The patterns (as accepted by compilePattern()) are merged into a trie of
+       path components, where components with wildcards in them are matched
+       using regular expressions, and "**" components can consume any number
+       of path components.  The states reached for each directory are cached,
+       so files in the same directory share the cost of matching it.  At most
+       MAX_DIRECTORIES directories are cached, least recently used first out,
+       since matchers are shared and long-lived."""
+
+    MAX_DIRECTORIES = 10000
+
+    def __init__(self, patterns):
+        root = _MatcherState()
+        for index, pattern in enumerate(patterns):
+            state = root
+            for component in pattern.split("/"):
+                state = state.child(component)
+            state.terminal.append(index)
+        states = set()
+        _closure(states, root)
+        self.__root = frozenset(states)
+        self.__directories = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __directoryStates(self, dirname):
+        if not dirname:
+            return self.__root
+        with self.__lock:
+            states = self.__directories.pop(dirname, None)
+            if states is not None:
+                self.__directories[dirname] = states
+                return states
+        parent, _, basename = dirname.rpartition("/")
+        states = _step(self.__directoryStates(parent), basename)
+        with self.__lock:
+            self.__directories[dirname] = states
+            while len(self.__directories) > self.MAX_DIRECTORIES:
+                self.__directories.popitem(last=False)
+        return states
+
+    def match(self, path):
+        """Return the indexes of all patterns that match |path|, sorted"""
+        dirname, _, filename = path.rpartition("/")
+        states = self.__directoryStates(dirname)
+        if not states:
+            return []
+        return sorted(set(index
+                          for state in _step(states, filename)
+                          for index in state.terminal))
+
+def filterPattern(path):
+    """Return the pattern matching the files a filter on |path| applies to
+
+       A filter on a directory applies to all files in the directory, and in
+       its sub-directories.  If the directory name contains wildcards,
+       however, it only applies to files directly in matching directories."""
+    if not path or path == "/":
+        return "**/*"
+    dirname, _, filename = path.rpartition("/")
+    if not filename:
+        if hasWildcard(dirname):
+            return dirname + "/*"
+        return dirname + "/**/*"
+    return path
+
+# Cache of sorted global and review filters, and their PathMatcher.
+FILTERS_CACHE = dbutils.SharedCache(("filters", "reviewfilters", "users"))
+
 class Filters:
     def __init__(self):
         # Pseudo-types:
         #   data: dict(user_id -> tuple(filter_type, delegate))
         #   file: tuple(file_id, data)
-        #   tree: tuple(dict(dirname -> tree), dict(filename -> file))
 
         self.files = {}          # dict(path -> file)
-        self.directories = {}    # dict(dirname -> tree)
-        self.root = ({}, {})     # tree
         self.data = {}           # dict(file_id -> data)
         self.active_filters = {} # dict(user_id -> set(filter_id))
         self.matched_files = {}  # dict(filter_id -> set(file_id))
 
-        # Note: The same per-file 'data' objects are referenced by all of
-        # 'self.files', 'self.tree' and 'self.data'.
-
-        self.directories[""] = self.root
+        # Note: The same per-file 'data' objects are referenced by both
+        # 'self.files' and 'self.data'.
 
     def setFiles(self, db, file_ids=None, review=None):
         assert (file_ids is None) != (review is None)
@@ -179,128 +287,55 @@ class Filters:
             self.files[path] = (file_id, data)
             self.data[file_id] = data
 
-            if "/" in path:
-                dirname, filename = path.rsplit("/", 1)
-
-                def find_tree(dirname):
-                    tree = self.directories.get(dirname)
-                    if tree:
-                        return tree
-                    tree = self.directories[dirname] = ({}, {})
-                    if "/" in dirname:
-                        dirname, basename = dirname.rsplit("/", 1)
-                        find_tree(dirname)[0][basename] = tree
-                    else:
-                        self.root[0][dirname] = tree
-                    return tree
-
-                tree = find_tree(dirname)
-            else:
-                filename = path
-                tree = self.root
-
-            tree[1][filename] = self.files[path]
-
     def addFilter(self, user_id, path, filter_type, delegate, filter_id):
-        def files_in_tree(components, tree):
-            for dirname, child_tree in tree[0].items():
-                for f in files_in_tree(components + [dirname], child_tree):
-                    yield f
-            dirname = "/".join(components) + "/" if components else ""
-            for filename, (file_id, data) in tree[1].items():
-                yield dirname, filename, file_id, data
-
-        if not path:
-            dirname, filename = "", None
-            components = []
-        elif "/" in path:
-            dirname, filename = path.rsplit("/", 1)
-            if not dirname:
-                dirname = ""
-                components = []
-            else:
-                components = dirname.split("/")
-            if not filename:
-                filename = None
-        else:
-            dirname, filename = "", path
-            components = []
-
-        def hasWildcard(string):
-            return "*" in string or "?" in string
-
-        file_ids = []
-        files = []
-
-        if hasWildcard(path):
-            tree = self.root
-
-            for index, component in enumerate(components):
-                if hasWildcard(component):
-                    wild_dirname = "/".join(components[index:]) + "/"
-                    break
-                else:
-                    tree = tree[0].get(component)
-                    if not tree:
-                        return
-            else:
-                wild_dirname = None
+        filters = [(user_id, path, filter_type, delegate, filter_id)]
+        self.__applyFilters(filters, PathMatcher([filterPattern(path)]))
+
+    def __applyFilters(self, filters, matcher):
+        # Filters are applied in order, so where several filters match the
+        # same file, the last one for each user determines the outcome.
+        matched_files = [[] for _ in filters]
+
+        for path, (file_id, data) in self.files.iteritems():
+            for index in matcher.match(path):
+                user_id, _, filter_type, delegate, _ = filters[index]
+                matched_files[index].append(file_id)
+                if filter_type == "ignored":
+                    data.pop(user_id, None)
+                elif filter_type in ("reviewer", "watcher"):
+                    data[user_id] = (filter_type, delegate)
 
-            re_filename = compilePattern(filename or "*")
+        for (user_id, _, filter_type, _, filter_id), file_ids \
+                in zip(filters, matched_files):
+            if not file_ids:
+                continue
+            self.matched_files[filter_id] = file_ids
+            if filter_type in ("reviewer", "watcher"):
+                self.active_filters.setdefault(user_id, set()).add(filter_id)
 
-            if wild_dirname:
-                re_dirname = compilePattern(wild_dirname)
+    @staticmethod
+    def compile(filters):
+        """Sort |filters| and compile a PathMatcher for them
 
-                for dirname, filename, file_id, data in files_in_tree([], tree):
-                    if re_dirname.match(dirname) and re_filename.match(filename):
-                        file_ids.append(file_id)
-                        files.append(data)
-            else:
-                for filename, (file_id, data) in tree[1].items():
-                    if re_filename.match(filename):
-                        file_ids.append(file_id)
-                        files.append(data)
-        else:
-            if filename:
-                if path in self.files:
-                    file_id, data = self.files[path]
-                    file_ids.append(file_id)
-                    files.append(data)
-                else:
-                    return
-            else:
-                if dirname in self.directories:
-                    for _, _, file_id, data in files_in_tree([dirname], self.directories[dirname]):
-                        file_ids.append(file_id)
-                        files.append(data)
-                else:
-                    return
-
-        self.matched_files[filter_id] = file_ids
-
-        if filter_type == "ignored":
-            for data in files:
-                if user_id in data:
-                    del data[user_id]
-        elif filter_type in ("reviewer", "watcher"):
-            if files:
-                self.active_filters.setdefault(user_id, set()).add(filter_id)
-                for data in files:
-                    data[user_id] = (filter_type, delegate)
+           Returns a tuple (filters, matcher), where the filters are in the
+           order in which they should be applied."""
 
-    def addFilters(self, filters):
         def compareFilters(filterA, filterB):
             return Path.cmp(filterA[1], filterB[1])
 
         def add_filter_id(filter_data):
             if len(filter_data) == 4:
                 return tuple(filter_data) + (None,)
-            return filter_data
+            return tuple(filter_data)
 
         sorted_filters = sorted(map(add_filter_id, filters), cmp=compareFilters)
+        matcher = PathMatcher([filterPattern(path)
+                               for _, path, _, _, _ in sorted_filters])
 
-        for user_id, path, filter_type, delegate, filter_id in sorted_filters:
-            self.addFilter(user_id, path, filter_type, delegate, filter_id)
+        return sorted_filters, matcher
+
+    def addFilters(self, filters):
+        self.__applyFilters(*Filters.compile(filters))
 
     class Review:
         def __init__(self, review_id, applyfilters, applyparentfilters, repository):
@@ -315,37 +350,50 @@ class Filters:
 
         cursor = db.cursor()
 
-        if user is not None: user_filter = " AND uid=%d" % user.id
-        else: user_filter = ""
+        if user is not None:
+            user_id = user.id
+            user_filter = " AND uid=%d" % user_id
+        else:
+            user_id = None
+            user_filter = ""
 
         def loadGlobal(repository, recursive):
             if recursive and repository.parent:
                 loadGlobal(repository.parent, recursive)
 
-            cursor.execute("""SELECT filters.uid, filters.path, filters.type, filters.delegate, filters.id
-                                FROM filters
-                                JOIN users ON (users.id=filters.uid)
-                               WHERE filters.repository=%%s
-                                 AND users.status!='retired'
-                                     %s""" % user_filter,
-                           (repository.id,))
-            self.addFilters(cursor)
+            def fetch():
+                cursor.execute("""SELECT filters.uid, filters.path, filters.type, filters.delegate, filters.id
+                                    FROM filters
+                                    JOIN users ON (users.id=filters.uid)
+                                   WHERE filters.repository=%%s
+                                     AND users.status!='retired'
+                                         %s""" % user_filter,
+                               (repository.id,))
+                return Filters.compile(cursor)
+
+            self.__applyFilters(*FILTERS_CACHE.get(
+                db, ("global", repository.id, user_id), fetch))
 
         def loadReview(review):
-            cursor.execute("""SELECT reviewfilters.uid, reviewfilters.path, reviewfilters.type, NULL
-                                FROM reviewfilters
-                                JOIN users ON (users.id=reviewfilters.uid)
-                               WHERE reviewfilters.review=%%s
-                                 AND users.status!='retired'
-                                     %s""" % user_filter,
-                           (review.id,))
+            def fetch():
+                cursor.execute("""SELECT reviewfilters.uid, reviewfilters.path, reviewfilters.type, NULL
+                                    FROM reviewfilters
+                                    JOIN users ON (users.id=reviewfilters.uid)
+                                   WHERE reviewfilters.review=%%s
+                                     AND users.status!='retired'
+                                         %s""" % user_filter,
+                               (review.id,))
+                return cursor.fetchall()
+
             if added_review_filters or removed_review_filters:
-                review_filters = set(cursor.fetchall())
+                review_filters = set(fetch())
                 review_filters -= set(map(tuple, removed_review_filters))
                 review_filters |= set(map(tuple, added_review_filters))
                 self.addFilters(list(review_filters))
             else:
-                self.addFilters(cursor)
+                self.__applyFilters(*FILTERS_CACHE.get(
+                    db, ("review", review.id, user_id),
+                    lambda: Filters.compile(fetch())))
 
         if review:
             if review.applyfilters:
@@ -429,11 +477,15 @@ def getMatchedFiles(repository, paths):
     if len(paths) == 1 and not paths[0].wildDirname and not paths[0].filename:
         return { paths[0].path: filenames }
 
+    # Each filename is added to the first (most specific) path it matches.
+    matcher = PathMatcher([path.path + "**/*" if path.path.endswith("/")
+                           else path.path
+                           for path in paths])
+
     for filename in filenames:
-        for path in paths:
-            if path.match(filename):
-                matched[path.path].append(filename)
-                break
+        indexes = matcher.match(filename)
+        if indexes:
+            matched[paths[indexes[0]].path].append(filename)
 
     return matched
 
@@ -0,0 +1,57 @@
+def matcher():
+    import random
+    import reviewing.filters
+
+    patterns = ["a/b.c",
+                "a/*.c",
+                "a/**/*.c",
+                "**/*.h",
+                "**/b/*",
+                "a/*/d/**/*",
+                "a/?/*",
+                "*.txt",
+                "a/b/**/*",
+                "",
+                "a/b.c/x"]
+    components = ["a", "b", "c", "d", "b.c", "x.h", "e.txt", "f.c", "g"]
+
+    matcher = reviewing.filters.PathMatcher(patterns)
+    regexps = [reviewing.filters.compilePattern(pattern)
+               for pattern in patterns]
+
+    generator = random.Random(0)
+    for _ in xrange(2000):
+        path = "/".join(generator.choice(components)
+                        for _ in xrange(generator.randint(1, 5)))
+        expected = [index for index, regexp in enumerate(regexps)
+                    if regexp.match(path)]
+        assert matcher.match(path) == expected, \
+            "%s: %r != %r" % (path, matcher.match(path), expected)
+
+    assert matcher.match("a/b.c") == [0, 1, 2]
+    assert matcher.match("a/x/d/y") == [5]
+    assert matcher.match("x/y/z") == []
+
+    # The cache of directory states is bounded, and results are unaffected by
+    # evictions.
+    bounded = reviewing.filters.PathMatcher(patterns)
+    bounded.MAX_DIRECTORIES = 5
+    for _ in xrange(500):
+        path = "/".join(generator.choice(components)
+                        for _ in xrange(generator.randint(1, 5)))
+        assert bounded.match(path) == matcher.match(path), path
+        assert len(bounded._PathMatcher__directories) <= 5
+
+    print "matcher: ok"
+
+def filterPattern():
+    from reviewing.filters import filterPattern
+
+    assert filterPattern("") == "**/*"
+    assert filterPattern("/") == "**/*"
+    assert filterPattern("a/b/") == "a/b/**/*"
+    assert filterPattern("a/*/") == "a/*/*"
+    assert filterPattern("a/b.c") == "a/b.c"
+    assert filterPattern("a/*.c") == "a/*.c"
+
+    print "filterPattern: ok"
@@ -31,6 +31,10 @@ def renderComments(db, target, user, chain, position, linkify):
 
     div_chain = target.div("comments %s" % position)
 
+    if isinstance(linkify, htmlutils.Context):
+        # Resolve SHA-1s mentioned in any of the comments at once.
+        linkify.prefetch([comment.comment for comment in chain.comments])
+
     for comment in chain.comments:
         div_comment = div_chain.div("comment%s" % (comment.state == "draft" and " draft" or ""), id="c%dc%d" % (chain.id, comment.id))
 
@@ -50,10 +50,7 @@ each file.  For any changes in a file for which no reviewer is identified, None
 is used as a key in the dictionary instead of a real user ID."""
 
     if changesets is None:
-        changesets = []
-        changeset_utils.createChangesets(db, repository, commits)
-        for commit in commits:
-            changesets.extend(changeset_utils.createChangeset(db, None, repository, commit, do_highlight=False))
+        changesets = changeset_utils.createChangesets(db, repository, commits)
 
     cursor = db.cursor()
 
@@ -69,34 +66,61 @@ is used as a key in the dictionary instead of a real user ID."""
     reviewers = {}
     watchers = {}
 
-    for changeset in changesets:
-        author_user_ids = changeset.child.author.getUserIds(db) if changeset.child else set()
+    cursor.execute("""SELECT DISTINCT changeset, file
+                        FROM fileversions
+                       WHERE changeset=ANY (%s)""",
+                   (list(set(changeset.id for changeset in changesets)),))
+
+    files_per_changeset = {}
+    for changeset_id, file_id in cursor:
+        files_per_changeset.setdefault(changeset_id, []).append(file_id)
+
+    # Delegate user ids, by comma-separated user names.
+    delegates = {}
 
-        cursor.execute("SELECT DISTINCT file FROM fileversions WHERE changeset=%s", (changeset.id,))
+    def getDelegateUserIds(delegate):
+        if delegate not in delegates:
+            delegates[delegate] = [
+                dbutils.User.fromName(db, delegate_user_name).id
+                for delegate_user_name in delegate.split(",")]
+        return delegates[delegate]
 
-        for (file_id,) in cursor:
-            reviewers_found = False
+    # Reviewers and watchers of a file, by (file id, author user ids).  The
+    # assignment only depends on the author of the changes, and typically the
+    # same few authors have changed the same files many times.
+    assignments = {}
+
+    def getAssignment(file_id, author_user_ids):
+        key = (file_id, author_user_ids)
+        if key not in assignments:
+            file_reviewers = set()
+            file_watchers = set()
 
             for user_id, (filter_type, delegate) in filters.listUsers(file_id).items():
                 if filter_type == 'reviewer':
                     if user_id not in author_user_ids:
-                        reviewer_user_ids = [user_id]
+                        file_reviewers.add(user_id)
                     elif delegate:
-                        reviewer_user_ids = []
-                        for delegate_user_name in delegate.split(","):
-                            delegate_user = dbutils.User.fromName(db, delegate_user_name)
-                            reviewer_user_ids.append(delegate_user.id)
-                    else:
-                        reviewer_user_ids = []
-
-                    for reviewer_user_id in reviewer_user_ids:
-                        reviewers.setdefault(file_id, {}).setdefault(reviewer_user_id, set()).add(changeset.id)
-                        reviewers_found = True
+                        file_reviewers.update(getDelegateUserIds(delegate))
                 else:
-                    watchers.setdefault(file_id, {}).setdefault(user_id, set()).add(changeset.id)
+                    file_watchers.add(user_id)
+
+            if not file_reviewers:
+                file_reviewers.add(None)
 
-            if not reviewers_found:
-                reviewers.setdefault(file_id, {}).setdefault(None, set()).add(changeset.id)
+            assignments[key] = file_reviewers, file_watchers
+        return assignments[key]
+
+    for changeset in changesets:
+        author_user_ids = changeset.child.author.getUserIds(db) if changeset.child else frozenset()
+
+        for file_id in files_per_changeset.get(changeset.id, ()):
+            file_reviewers, file_watchers = getAssignment(file_id, author_user_ids)
+
+            for user_id in file_reviewers:
+                reviewers.setdefault(file_id, {}).setdefault(user_id, set()).add(changeset.id)
+            for user_id in file_watchers:
+                watchers.setdefault(file_id, {}).setdefault(user_id, set()).add(changeset.id)
 
     return reviewers, watchers
 
@@ -171,10 +195,8 @@ def assignChanges(db, user, review, commits=None, changesets=None, update=False)
     if changesets is None:
         assert commits is not None
 
-        changesets = []
-
-        for commit in commits:
-            changesets.extend(changeset_utils.createChangeset(db, user, review.repository, commit))
+        changesets = changeset_utils.createChangesets(
+            db, review.repository, commits, do_highlight=True)
 
     applyfilters = review.applyfilters
     applyparentfilters = review.applyparentfilters
@@ -231,7 +253,35 @@ def assignChanges(db, user, review, commits=None, changesets=None, update=False)
     new_watchers -= old_reviewers | new_reviewers
 
     cursor.executemany("INSERT INTO reviewusers (review, uid) VALUES (%s, %s)", reviewusers_values)
-    cursor.executemany("INSERT INTO reviewuserfiles (file, uid) SELECT id, %s FROM reviewfiles WHERE review=%s AND changeset=%s AND file=%s", reviewuserfiles_values)
+
+    if reviewuserfiles_values:
+        cursor.execute("""SELECT id, changeset, file
+                            FROM reviewfiles
+                           WHERE review=%s
+                             AND changeset=ANY (%s)""",
+                       (review.id, list(set(changeset_id for _, _, changeset_id, _
+                                                in reviewuserfiles_values))))
+
+        reviewfile_ids = dict(((changeset_id, file_id), reviewfile_id)
+                              for reviewfile_id, changeset_id, file_id in cursor)
+
+        assigned_files = []
+        assigned_users = []
+
+        for user_id, _, changeset_id, file_id in reviewuserfiles_values:
+            reviewfile_id = reviewfile_ids.get((changeset_id, file_id))
+            if reviewfile_id is not None:
+                assigned_files.append(reviewfile_id)
+                assigned_users.append(user_id)
+
+        if configuration.database.DRIVER == "postgresql":
+            # Insert all rows using a single statement.
+            cursor.execute("""INSERT INTO reviewuserfiles (file, uid)
+                                   SELECT UNNEST(%s::INTEGER[]), UNNEST(%s::INTEGER[])""",
+                           (assigned_files, assigned_users))
+        else:
+            cursor.executemany("INSERT INTO reviewuserfiles (file, uid) VALUES (%s, %s)",
+                               zip(assigned_files, assigned_users))
 
     if configuration.extensions.ENABLED:
         cursor.execute("""SELECT id, uid, extension, path
@@ -270,8 +320,9 @@ def createChangesetsForCommits(db, commits, silent_if_empty=set(), full_merges=s
     for commit in commits:
         if commit not in full_merges and commit not in replayed_rebases:
             simple_commits.append(commit)
-    if simple_commits:
-        changeset_utils.createChangesets(db, repository, simple_commits)
+    simple_changesets = {}
+    for changeset in changeset_utils.createChangesets(db, repository, simple_commits):
+        simple_changesets.setdefault(changeset.child, []).append(changeset)
 
     for commit in commits:
         if commit in full_merges:
@@ -283,8 +334,7 @@ def createChangesetsForCommits(db, commits, silent_if_empty=set(), full_merges=s
                 from_commit=commit, to_commit=replayed_rebases[commit],
                 conflicts=True, do_highlight=False)
         else:
-            commit_changesets = changeset_utils.createChangeset(
-                db, user, repository, commit, do_highlight=False)
+            commit_changesets = simple_changesets[commit]
 
         if commit in silent_if_empty:
             for commit_changeset in commit_changesets:
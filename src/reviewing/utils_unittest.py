@@ -0,0 +1,190 @@
+class Author(object):
+    def __init__(self, user_ids):
+        self.user_ids = frozenset(user_ids)
+
+    def getUserIds(self, db):
+        return self.user_ids
+
+class Commit(object):
+    def __init__(self, author):
+        self.author = author
+
+class ChangedFile(object):
+    def __init__(self, file_id):
+        self.id = file_id
+
+class Changeset(object):
+    def __init__(self, changeset_id, child, file_ids):
+        self.id = changeset_id
+        self.child = child
+        self.files = [ChangedFile(file_id) for file_id in file_ids]
+
+def createTables(db):
+    # Temporary tables shadow the real tables with the same names, for this
+    # connection only, and are dropped when the transaction is rolled back.
+    cursor = db.cursor()
+    cursor.execute("CREATE TEMPORARY TABLE files (id INTEGER, path TEXT)")
+    cursor.execute("CREATE TEMPORARY TABLE fileversions (changeset INTEGER, file INTEGER)")
+
+def createReview(db, generator, commits, files, filters, files_per_commit=10):
+    """Create a synthetic review, and return its changesets and filters
+
+       The files and their versions are stored in the temporary tables created
+       by createTables()."""
+
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM fileversions")
+    cursor.execute("DELETE FROM files")
+
+    paths = ["dir%d/sub%d/file%d.c" % (index % 20, index % 7, index)
+             for index in range(files)]
+    cursor.executemany("INSERT INTO files (id, path) VALUES (%s, %s)",
+                       list(enumerate(paths, 1)))
+
+    authors = [Author([user_id]) for user_id in range(1, 6)]
+    changesets = []
+    fileversions = []
+
+    for changeset_id in range(1, commits + 1):
+        file_ids = generator.sample(range(1, files + 1),
+                                    min(files, files_per_commit))
+        changesets.append(Changeset(changeset_id,
+                                    Commit(generator.choice(authors)),
+                                    file_ids))
+        fileversions.extend((changeset_id, file_id) for file_id in file_ids)
+
+    cursor.executemany("""INSERT INTO fileversions (changeset, file)
+                               VALUES (%s, %s)""",
+                       fileversions)
+
+    # Users 1-5 are also the authors, so that some changes have no reviewer.
+    reviewfilters = [(1 + index % 30,
+                      "dir%d/" % (index % 20),
+                      "reviewer" if index % 3 else "watcher",
+                      None,
+                      index)
+                     for index in range(filters)]
+
+    return changesets, reviewfilters
+
+def oldReviewersAndWatchers(db, changesets, reviewfilters):
+    # The per-changeset implementation getReviewersAndWatchers() replaced.
+    # (Delegates are not used by the synthetic reviews, and are left out.)
+    from reviewing.filters import Filters
+    from reviewing.utils import getFileIdsFromChangesets
+
+    cursor = db.cursor()
+
+    filters = Filters()
+    filters.setFiles(db, list(getFileIdsFromChangesets(changesets)))
+    filters.addFilters(reviewfilters)
+
+    reviewers = {}
+    watchers = {}
+
+    for changeset in changesets:
+        author_user_ids = changeset.child.author.getUserIds(db)
+
+        cursor.execute("SELECT DISTINCT file FROM fileversions WHERE changeset=%s",
+                       (changeset.id,))
+
+        for (file_id,) in cursor.fetchall():
+            reviewers_found = False
+
+            for user_id, (filter_type, _) in filters.listUsers(file_id).items():
+                if filter_type == 'reviewer':
+                    if user_id not in author_user_ids:
+                        reviewers.setdefault(file_id, {}).setdefault(user_id, set()).add(changeset.id)
+                        reviewers_found = True
+                else:
+                    watchers.setdefault(file_id, {}).setdefault(user_id, set()).add(changeset.id)
+
+            if not reviewers_found:
+                reviewers.setdefault(file_id, {}).setdefault(None, set()).add(changeset.id)
+
+    return reviewers, watchers
+
+def countQueries(db):
+    return sum(count for query, (count, _, _, _, _) in db.profiling.items()
+               if not query.startswith("<"))
+
+def assignments():
+    # Check that getReviewersAndWatchers() agrees with the implementation it
+    # replaced, and uses a constant number of queries.
+
+    import random
+
+    import api
+    import dbutils
+    import reviewing.utils
+
+    critic = api.critic.startSession(for_testing=True)
+    generator = random.Random(0)
+
+    with dbutils.Database.forTesting(critic) as db:
+        createTables(db)
+
+        for commits in (1, 10, 50):
+            changesets, reviewfilters = createReview(
+                db, generator, commits, files=200, filters=30)
+
+            expected = oldReviewersAndWatchers(db, changesets, reviewfilters)
+
+            db.profiling.clear()
+
+            actual = reviewing.utils.getReviewersAndWatchers(
+                db, None, changesets=changesets, reviewfilters=reviewfilters,
+                applyfilters=False)
+
+            assert actual == expected, "%d commits" % commits
+            assert countQueries(db) == 2, db.profiling.keys()
+
+        db.rollback()
+
+    print "assignments: ok"
+
+def benchmark():
+    # Not run as part of the test suite.  Run manually to measure:
+    #
+    #   python -m run_unittest reviewing/utils_unittest.py benchmark
+    #
+    # Synthetic reviews of increasing size, with 2000 files and 60 path
+    # filters, and 10 changed files per commit, are processed by both the
+    # current and the replaced implementation.
+
+    import random
+    import time
+
+    import api
+    import dbutils
+    import reviewing.utils
+
+    critic = api.critic.startSession(for_testing=True)
+    generator = random.Random(0)
+
+    with dbutils.Database.forTesting(critic) as db:
+        createTables(db)
+
+        for commits in (50, 200, 500, 1000):
+            changesets, reviewfilters = createReview(
+                db, generator, commits, files=2000, filters=60)
+
+            timings = []
+
+            for label, fn in [
+                    ("old", lambda: oldReviewersAndWatchers(
+                        db, changesets, reviewfilters)),
+                    ("new", lambda: reviewing.utils.getReviewersAndWatchers(
+                        db, None, changesets=changesets,
+                        reviewfilters=reviewfilters, applyfilters=False))]:
+                db.profiling.clear()
+                before = time.time()
+                fn()
+                timings.append((label, time.time() - before, countQueries(db)))
+
+            print "%5d commits: %s" % (commits, ", ".join(
+                "%s %.3fs (%d queries)" % timing for timing in timings))
+
+        db.rollback()
+
+    print "benchmark: ok"
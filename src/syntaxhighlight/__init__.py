@@ -16,12 +16,14 @@
 
 import os
 import os.path
-import bz2
 
 import htmlutils
 import textutils
 import configuration
 import diff.parse
+import diff.lineindex
+
+import store
 
 LANGUAGES = set()
 
@@ -59,8 +61,7 @@ def generateHighlightPath(sha1, language, mode="legacy"):
     return os.path.join(configuration.services.HIGHLIGHT["cache_dir"], sha1[:2], sha1[2:] + "." + language + suffix)
 
 def isHighlighted(sha1, language, mode="legacy"):
-    path = generateHighlightPath(sha1, language, mode)
-    return os.path.isfile(path) or os.path.isfile(path + ".bz2")
+    return store.getStore().contains(sha1, language, mode)
 
 def wrap(raw_source, mode):
     if mode == "json":
@@ -69,30 +70,30 @@ def wrap(raw_source, mode):
     return htmlutils.htmlify(raw_source)
 
 def readHighlight(repository, sha1, path, language, request=False, mode="legacy"):
-    from request import requestHighlights
+    return readHighlightLines(repository, sha1, path, language, request, mode).read()
 
-    async = mode == "json"
-    source = None
+def readHighlightLines(repository, sha1, path, language, request=False, mode="legacy"):
+    """Return the lines of a highlighted file
+
+       The lines are returned as a sequence object, whose lines are decoded on
+       demand; a store.StoredLines if the file has been highlighted, and a
+       diff.lineindex.LineIndex otherwise."""
+
+    from request import requestHighlights
 
     if language:
-        path = generateHighlightPath(sha1, language, mode)
-
-        if os.path.isfile(path):
-            os.utime(path, None)
-            source = open(path).read()
-        elif os.path.isfile(path + ".bz2"):
-            os.utime(path + ".bz2", None)
-            source = bz2.BZ2File(path + ".bz2", "r").read()
+        lines = store.getStore().lookup(sha1, language, mode)
+
+        if lines is not None:
+            return lines
         elif request:
-            requestHighlights(repository, { sha1: (path, language) }, mode, async=async)
+            requestHighlights(repository, { sha1: (path, language) }, mode, async=mode == "json")
             if mode == "json":
                 raise HighlightRequested()
-            return readHighlight(repository, sha1, path, language, False, mode)
-
-    if not source:
-        source = wrap(textutils.decode(repository.fetch(sha1).data), mode)
+            return readHighlightLines(repository, sha1, path, language, False, mode)
 
-    return source
+    return diff.lineindex.LineIndex(
+        wrap(textutils.decode(repository.fetch(sha1).data), mode))
 
 # Import for side-effects: these modules add strings to the LANGUAGES set to
 # indicate which languages they support highlighting.
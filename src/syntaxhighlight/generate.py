@@ -18,6 +18,7 @@ import os
 import errno
 
 import syntaxhighlight
+import syntaxhighlight.store
 import gitutils
 import textutils
 import htmlutils
@@ -132,7 +133,10 @@ def generateHighlight(repository_path, sha1, language, mode, output_file=None):
 
         output_file.close()
 
-        os.chmod(output_path + ".tmp", 0660)
-        os.rename(output_path + ".tmp", output_path)
+        with open(output_path + ".tmp") as output_file:
+            syntaxhighlight.store.getStore().add(
+                sha1, language, mode, output_file.read())
+
+        os.unlink(output_path + ".tmp")
 
     return True
@@ -0,0 +1,522 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2017 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""Packed store of syntax highlighted files
+
+   Highlighted files are stored as entries appended to segment files, and
+   located using an append-only index file that each process reads into a dict
+   (incrementally, as it finds that the dict is missing entries.)  Each entry
+   is split into blocks of BLOCK_LINES lines that are compressed separately,
+   so that a range of lines can be read without decompressing the whole file.
+
+   Reads are recorded in memory and appended to an access log in batches.  The
+   compact() method uses the access log to decide which entries to keep, and
+   rewrites the store in a single pass.
+
+   Writers and compact() serialize using an exclusive lock on the 'lock' file
+   in the store directory.  Readers don't lock at all."""
+
+import os
+import bz2
+import mmap
+import time
+import zlib
+import errno
+import fcntl
+import struct
+import atexit
+import threading
+
+# Number of lines per separately compressed block.
+BLOCK_LINES = 256
+
+# zlib compression level.  Entries are compressed when highlighted, so favor
+# speed over size.
+COMPRESSION_LEVEL = 1
+
+# New entries are appended to a new segment once the current one is this big.
+SEGMENT_SIZE_LIMIT = 256 * 1024 * 1024
+
+# Recorded reads are appended to the access log when this many have been
+# recorded, or when this many seconds have passed since the last flush.
+ACCESS_FLUSH_COUNT = 256
+ACCESS_FLUSH_INTERVAL = 60
+
+# Readers check whether the index has been replaced by compact() at most this
+# often (in seconds) when finding entries; until then, they may keep reading
+# entries from the old segments.
+INDEX_CHECK_INTERVAL = 60
+
+ENTRY_HEADER = struct.Struct("<4sIIB")
+ENTRY_MAGIC = "HLE1"
+BLOCK_LENGTH = struct.Struct("<I")
+
+FLAG_TRAILING_LINEBREAK = 1
+FLAG_EOF_EOL = 2
+
+class StoreError(Exception):
+    pass
+
+def makeKey(sha1, language, mode):
+    return "%s.%s.%s" % (sha1, language, mode)
+
+def splitKey(key):
+    sha1, language, mode = key.split(".")
+    return sha1, language, mode
+
+def encodeEntry(source):
+    """Encode |source| (a string) as a store entry"""
+
+    if source:
+        trailing_linebreak = source[-1] == "\n"
+        eof_eol = source[-1] in "\n\r"
+        lines = (source[:-1] if trailing_linebreak else source).split("\n")
+    else:
+        trailing_linebreak = eof_eol = False
+        lines = []
+
+    flags = 0
+    if trailing_linebreak:
+        flags |= FLAG_TRAILING_LINEBREAK
+    if eof_eol:
+        flags |= FLAG_EOF_EOL
+
+    blocks = [zlib.compress("\n".join(lines[offset:offset + BLOCK_LINES]),
+                            COMPRESSION_LEVEL)
+              for offset in xrange(0, len(lines), BLOCK_LINES)]
+
+    return "".join([ENTRY_HEADER.pack(ENTRY_MAGIC, len(lines), len(blocks), flags)]
+                   + [BLOCK_LENGTH.pack(len(block)) for block in blocks]
+                   + blocks)
+
+class StoredLines(object):
+    """Read-only sequence of the lines in a store entry
+
+       Behaves like the list returned by diff.parse.splitlines().  Blocks of
+       lines are decompressed when lines in them are first accessed."""
+
+    def __init__(self, data, offset):
+        magic, self.__count, block_count, flags = \
+            ENTRY_HEADER.unpack_from(data, offset)
+        if magic != ENTRY_MAGIC:
+            raise StoreError("invalid entry at offset %d" % offset)
+
+        self.trailing_linebreak = bool(flags & FLAG_TRAILING_LINEBREAK)
+        self.eof_eol = bool(flags & FLAG_EOF_EOL)
+
+        self.__data = data
+        self.__blocks = []
+        self.__decompressed = {}
+
+        offset += ENTRY_HEADER.size
+        block_offset = offset + block_count * BLOCK_LENGTH.size
+        for index in xrange(block_count):
+            length, = BLOCK_LENGTH.unpack_from(data, offset)
+            self.__blocks.append((block_offset, length))
+            offset += BLOCK_LENGTH.size
+            block_offset += length
+
+        # Offset of the first byte after this entry.
+        self.end = block_offset
+
+    def __block(self, index):
+        lines = self.__decompressed.get(index)
+        if lines is None:
+            offset, length = self.__blocks[index]
+            lines = zlib.decompress(self.__data[offset:offset + length]).split("\n")
+            self.__decompressed[index] = lines
+        return lines
+
+    def __len__(self):
+        return self.__count
+
+    def __iter__(self):
+        for index in xrange(len(self.__blocks)):
+            for line in self.__block(index):
+                yield line
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.__count)
+            if step != 1:
+                return [self[item] for item in xrange(start, stop, step)]
+            lines = []
+            while start < stop:
+                block_index, block_offset = divmod(start, BLOCK_LINES)
+                block = self.__block(block_index)
+                count = min(stop - start, len(block) - block_offset)
+                lines.extend(block[block_offset:block_offset + count])
+                start += count
+            return lines
+        if index < 0:
+            index += self.__count
+        if not 0 <= index < self.__count:
+            raise IndexError("line index out of range")
+        block_index, block_offset = divmod(index, BLOCK_LINES)
+        return self.__block(block_index)[block_offset]
+
+    def __getslice__(self, start, stop):
+        # Python 2 calls this instead of __getitem__() for simple slices.
+        return self.__getitem__(slice(max(0, start), max(0, stop)))
+
+    def read(self):
+        """Return the whole entry as a string"""
+        source = "\n".join(self)
+        if self.trailing_linebreak:
+            source += "\n"
+        return source
+
+class Lock(object):
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "lock")
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        return False
+
+class HighlightStore(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index")
+        self.access_path = os.path.join(directory, "access")
+
+        # key => (segment, offset, created)
+        self.__entries = {}
+        self.__index_inode = None
+        self.__index_position = 0
+        self.__index_checked = time.time()
+        self.__segments = {}
+
+        # key => time of last read, not yet flushed to the access log.
+        self.__accessed = {}
+        self.__accessed_flushed = time.time()
+
+        self.__lock = threading.Lock()
+
+    def __segmentPath(self, segment):
+        return os.path.join(self.directory, "segment.%06d" % segment)
+
+    def __listSegments(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(int(filename[8:]) for filename in filenames
+                      if filename.startswith("segment.")
+                      and filename[8:].isdigit())
+
+    def __reset(self):
+        self.__entries = {}
+        self.__index_inode = None
+        self.__index_position = 0
+        self.__segments = {}
+
+    def __refresh(self):
+        """Read new index records, or reread the index if it was replaced"""
+
+        try:
+            index_file = open(self.index_path, "r")
+        except IOError as error:
+            if error.errno == errno.ENOENT:
+                self.__reset()
+                return
+            raise
+
+        with index_file:
+            inode = os.fstat(index_file.fileno()).st_ino
+            if inode != self.__index_inode:
+                self.__reset()
+                self.__index_inode = inode
+
+            index_file.seek(self.__index_position)
+            data = index_file.read()
+
+        # Ignore a partially written last record.
+        complete = data.rfind("\n") + 1
+        self.__index_position += complete
+
+        for record in data[:complete].splitlines():
+            key, segment, offset, created = record.split(" ")
+            self.__entries[key] = (int(segment), int(offset), int(created))
+
+    def __checkIndex(self):
+        now = time.time()
+        if now - self.__index_checked < INDEX_CHECK_INTERVAL:
+            return
+        self.__index_checked = now
+        try:
+            inode = os.stat(self.index_path).st_ino
+        except OSError:
+            inode = None
+        if inode != self.__index_inode:
+            self.__reset()
+
+    def __segment(self, segment, end):
+        data = self.__segments.get(segment)
+        if data is None or len(data) < end:
+            # Not mapped yet, or the segment has grown since it was mapped.
+            with open(self.__segmentPath(segment), "rb") as segment_file:
+                data = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__segments[segment] = data
+        return data
+
+    def __load(self, key):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        segment, offset, _ = entry
+        data = self.__segment(segment, offset + ENTRY_HEADER.size)
+        lines = StoredLines(data, offset)
+        if lines.end > len(data):
+            lines = StoredLines(self.__segment(segment, lines.end), offset)
+        return lines
+
+    def contains(self, sha1, language, mode):
+        key = makeKey(sha1, language, mode)
+        with self.__lock:
+            if key not in self.__entries:
+                self.__refresh()
+            return key in self.__entries
+
+    def lookup(self, sha1, language, mode):
+        """Return a StoredLines object, or None if the entry is missing"""
+
+        key = makeKey(sha1, language, mode)
+
+        with self.__lock:
+            self.__checkIndex()
+
+            if key not in self.__entries:
+                self.__refresh()
+
+            try:
+                lines = self.__load(key)
+            except (IOError, OSError, ValueError):
+                # The segment was probably removed by compact(); reread the
+                # index and try again.
+                self.__reset()
+                self.__refresh()
+                lines = self.__load(key)
+
+            if lines is not None:
+                self.__recordAccess(key)
+
+            return lines
+
+    def __recordAccess(self, key):
+        now = time.time()
+        self.__accessed[key] = now
+        if len(self.__accessed) >= ACCESS_FLUSH_COUNT \
+                or now - self.__accessed_flushed >= ACCESS_FLUSH_INTERVAL:
+            self.__flushAccessed()
+
+    def __flushAccessed(self):
+        self.__accessed_flushed = time.time()
+        if not self.__accessed:
+            return
+        records = "".join("%s %d\n" % (key, accessed)
+                          for key, accessed in self.__accessed.items())
+        self.__accessed = {}
+        try:
+            # Writes in append mode are atomic enough for this: a lost or
+            # garbled record only affects the accuracy of compact().
+            with open(self.access_path, "a") as access_file:
+                access_file.write(records)
+        except IOError:
+            pass
+
+    def flushAccessed(self):
+        with self.__lock:
+            self.__flushAccessed()
+
+    def add(self, sha1, language, mode, source):
+        """Add a highlighted file to the store"""
+
+        key = makeKey(sha1, language, mode)
+        entry = encodeEntry(source)
+
+        try:
+            os.makedirs(self.directory, 0750)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+        with Lock(self.directory):
+            segments = self.__listSegments()
+            segment = segments[-1] if segments else 0
+            segment_path = self.__segmentPath(segment)
+
+            if os.path.exists(segment_path) \
+                    and os.path.getsize(segment_path) >= SEGMENT_SIZE_LIMIT:
+                segment += 1
+                segment_path = self.__segmentPath(segment)
+
+            with open(segment_path, "ab") as segment_file:
+                segment_file.seek(0, os.SEEK_END)
+                offset = segment_file.tell()
+                segment_file.write(entry)
+
+            with open(self.index_path, "a") as index_file:
+                index_file.write("%s %d %d %d\n" % (key, segment, offset, time.time()))
+
+    def compact(self, max_age):
+        """Drop entries that haven't been read in |max_age| seconds
+
+           All kept entries are copied into new segments, and the index is
+           replaced.  Returns a tuple of a set of (sha1, language, mode) tuples
+           for the kept entries, and the number of purged entries."""
+
+        if not os.path.isdir(self.directory):
+            return set(), 0
+
+        now = time.time()
+
+        with Lock(self.directory):
+            self.flushAccessed()
+
+            with self.__lock:
+                self.__reset()
+                self.__refresh()
+                entries = self.__entries.copy()
+
+            last_used = dict((key, created) for key, (_, _, created)
+                             in entries.items())
+
+            compacting_path = self.access_path + ".compacting"
+            try:
+                os.rename(self.access_path, compacting_path)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+            else:
+                with open(compacting_path) as access_file:
+                    for record in access_file:
+                        try:
+                            key, accessed = record.split(" ")
+                            accessed = int(accessed)
+                        except ValueError:
+                            continue
+                        if last_used.get(key, accessed) < accessed:
+                            last_used[key] = accessed
+
+            kept = sorted((segment, offset, key)
+                          for key, (segment, offset, _) in entries.items()
+                          if now - last_used[key] <= max_age)
+
+            old_segments = self.__listSegments()
+            segment = old_segments[-1] + 1 if old_segments else 0
+            segment_file = open(self.__segmentPath(segment), "wb")
+            records = []
+
+            with self.__lock:
+                for old_segment, old_offset, key in kept:
+                    lines = self.__load(key)
+                    if segment_file.tell() >= SEGMENT_SIZE_LIMIT:
+                        segment_file.close()
+                        segment += 1
+                        segment_file = open(self.__segmentPath(segment), "wb")
+                    offset = segment_file.tell()
+                    data = self.__segments[old_segment]
+                    segment_file.write(data[old_offset:lines.end])
+                    records.append("%s %d %d %d\n" % (key, segment, offset,
+                                                      last_used[key]))
+
+            segment_file.close()
+
+            with open(self.index_path + ".new", "w") as index_file:
+                index_file.write("".join(records))
+            os.rename(self.index_path + ".new", self.index_path)
+
+            for old_segment in old_segments:
+                os.unlink(self.__segmentPath(old_segment))
+            if os.path.exists(compacting_path):
+                os.unlink(compacting_path)
+
+            with self.__lock:
+                self.__reset()
+
+        return (set(splitKey(key) for _, _, key in kept),
+                len(entries) - len(kept))
+
+def migrateLegacyCache(store, cache_dir):
+    """Move highlighted files from the old one-file-per-entry layout into |store|
+
+       Returns the number of migrated files.  Code context files and other
+       stray files are deleted."""
+
+    import syntaxhighlight
+
+    migrated = 0
+
+    for section in sorted(os.listdir(cache_dir)):
+        section_path = os.path.join(cache_dir, section)
+        if len(section) != 2 or not os.path.isdir(section_path):
+            continue
+
+        for filename in os.listdir(section_path):
+            path = os.path.join(section_path, filename)
+            parts = filename.split(".")
+
+            if parts[-1] == "bz2":
+                compressed = True
+                parts.pop()
+            else:
+                compressed = False
+
+            if len(parts) == 2:
+                mode = "legacy"
+            elif len(parts) == 3 and parts[2] == "json":
+                mode = "json"
+            else:
+                mode = None
+
+            if mode and len(parts[0]) == 38 \
+                    and parts[1] in syntaxhighlight.LANGUAGES:
+                if compressed:
+                    source = bz2.BZ2File(path, "r").read()
+                else:
+                    with open(path) as source_file:
+                        source = source_file.read()
+                store.add(section + parts[0], parts[1], mode, source)
+                migrated += 1
+
+            os.unlink(path)
+
+        try:
+            os.rmdir(section_path)
+        except OSError:
+            # Not empty, for instance due to a code context file being written
+            # by a concurrent highlight job.
+            pass
+
+    return migrated
+
+STORE = None
+
+def getStore():
+    global STORE
+    if STORE is None:
+        import configuration
+        STORE = HighlightStore(os.path.join(
+            configuration.services.HIGHLIGHT["cache_dir"], "store"))
+        atexit.register(STORE.flushAccessed)
+    return STORE
@@ -0,0 +1,66 @@
+def basic():
+    import os
+    import shutil
+    import tempfile
+
+    import syntaxhighlight.store
+    from syntaxhighlight.store import HighlightStore, BLOCK_LINES
+
+    # Make readers notice compacting immediately.
+    syntaxhighlight.store.INDEX_CHECK_INTERVAL = 0
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        store = HighlightStore(os.path.join(directory, "store"))
+        sha1 = "0123456789" * 4
+
+        assert store.lookup(sha1, "python", "legacy") is None
+        assert not store.contains(sha1, "python", "legacy")
+
+        source = "".join("line %d\n" % index for index in range(3 * BLOCK_LINES + 7))
+        store.add(sha1, "python", "legacy", source)
+        store.add(sha1, "python", "json", "")
+        store.add(sha1, "c++", "legacy", "no linebreak\r")
+
+        # A separate instance, like another process, sees the entries too.
+        other = HighlightStore(store.directory)
+
+        for instance in (store, other):
+            assert instance.contains(sha1, "python", "legacy")
+
+            lines = instance.lookup(sha1, "python", "legacy")
+            assert len(lines) == 3 * BLOCK_LINES + 7
+            assert lines[0] == "line 0"
+            assert lines[-1] == "line %d" % (3 * BLOCK_LINES + 6)
+            assert lines[BLOCK_LINES - 2:BLOCK_LINES + 2] == \
+                ["line %d" % index for index in range(BLOCK_LINES - 2, BLOCK_LINES + 2)]
+            assert list(lines) == source[:-1].split("\n")
+            assert lines.read() == source
+            assert lines.eof_eol
+
+            lines = instance.lookup(sha1, "python", "json")
+            assert len(lines) == 0 and lines.read() == "" and not lines.eof_eol
+
+            lines = instance.lookup(sha1, "c++", "legacy")
+            assert list(lines) == ["no linebreak\r"] and lines.eof_eol
+
+        # Entries are kept if they're new enough, or recently read.
+        kept, purged = store.compact(max_age=60)
+        assert kept == set([(sha1, "python", "legacy"), (sha1, "python", "json"),
+                            (sha1, "c++", "legacy")]), repr(kept)
+        assert purged == 0
+
+        # Readers pick up the compacted index.
+        assert other.lookup(sha1, "python", "legacy").read() == source
+
+        store.add(sha1, "java", "legacy", "added after compacting\n")
+        assert other.lookup(sha1, "java", "legacy").read() == "added after compacting\n"
+
+        kept, purged = store.compact(max_age=-1)
+        assert kept == set() and purged == 4
+        assert other.lookup(sha1, "python", "legacy") is None
+    finally:
+        shutil.rmtree(directory)
+
+    print "basic: ok"
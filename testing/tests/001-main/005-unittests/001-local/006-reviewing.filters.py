@@ -0,0 +1 @@
+instance.unittest("reviewing.filters", ["matcher", "filterPattern"])
@@ -0,0 +1 @@
+instance.unittest("api.commitset", ["orderings"])
@@ -1 +1 @@
-instance.unittest("dbutils.database", ["cursors"])
+instance.unittest("dbutils.database", ["cursors", "sharedcache", "pooling"])
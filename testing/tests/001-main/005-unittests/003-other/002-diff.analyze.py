@@ -0,0 +1 @@
+instance.unittest("diff.analyze", ["basic"])
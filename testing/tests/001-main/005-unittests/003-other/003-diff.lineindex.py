@@ -0,0 +1 @@
+instance.unittest("diff.lineindex", ["basic", "loaders"])
@@ -0,0 +1 @@
+instance.unittest("log.commitset", ["commitset"])
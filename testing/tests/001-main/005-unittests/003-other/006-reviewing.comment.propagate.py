@@ -0,0 +1 @@
+instance.unittest("reviewing.comment.propagate", ["changemap"])
@@ -0,0 +1 @@
+instance.unittest("gitutils", ["trees", "catfilepool"])
@@ -0,0 +1 @@
+instance.unittest("linkify", ["linktypes"])
@@ -0,0 +1 @@
+instance.unittest("jsonapi.cache", ["renderedcache"])
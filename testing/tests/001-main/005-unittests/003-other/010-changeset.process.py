@@ -0,0 +1 @@
+instance.unittest("changeset.process", ["typechanges"])
@@ -0,0 +1 @@
+instance.unittest("reviewing.utils", ["assignments"])
@@ -0,0 +1 @@
+instance.unittest("index", ["commits"])